@@ -12,5 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TicTacToe.settings')
+# widoki gry async (ttt.views.game_details_async, current_game_async)
+os.environ.setdefault('TTT_ASYNC_VIEWS', '1')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# importowane po get_asgi_application(), ktore konfiguruje Django
+from ttt.sse import EventsRouter  # noqa: E402
+
+application = EventsRouter(django_application)
@@ -0,0 +1,15 @@
+"""URL-e dla ASGI: widoki gry w wersji async, pozostale jak w TicTacToe.urls."""
+from django.urls import path
+from TicTacToe import urls
+from ttt import views
+
+ASYNC_VIEWS = {
+    'current_game': views.current_game_async,
+    'game_details': views.game_details_async,
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS[pattern.name], name=pattern.name)
+    if getattr(pattern, 'name', None) in ASYNC_VIEWS else pattern
+    for pattern in urls.urlpatterns
+]
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from django.urls import reverse_lazy
 
@@ -44,16 +45,23 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'ttt.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'ttt.middleware.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'TicTacToe.urls'
+# TicTacToe/asgi.py sets TTT_ASYNC_VIEWS=1: game views in their async versions;
+# under WSGI every async view would run in its own event loop
+if os.environ.get('TTT_ASYNC_VIEWS') == '1':
+    ROOT_URLCONF = 'TicTacToe.asgi_urls'
+else:
+    ROOT_URLCONF = 'TicTacToe.urls'
 
 TEMPLATES = [
     {
@@ -82,9 +90,66 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # baza testowa w pliku - w pamieci (shared cache) watki blokuja cale tabele
+        # i testy wspolbieznych zapisow (ConcurrentGamesTest) nie mialyby sensu
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+    },
+    # read replica of 'default' for game views (ttt.db.ReplicaRouter), used when
+    # TTT_REPLICA_DATABASE names it; the test database is a separate file
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'TEST': {'NAME': BASE_DIR / 'test_replica.sqlite3'},
+    },
 }
 
+DATABASE_ROUTERS = ['ttt.db.ReplicaRouter']
+
+# Replica alias for read-only paths (core.get_game, get_game_moves, index), None - reads from 'default'
+TTT_REPLICA_DATABASE = None
+
+# After a write the player reads from 'default' for this long (should exceed the replica lag)
+TTT_REPLICA_STICKY_SECONDS = 10
+
+
+# SQLite concurrency profile (ttt.db): pragmas run on every new connection.
+# WAL lets readers run during a write (the mode is stored in the database
+# file), synchronous=normal syncs on checkpoints only, busy_timeout waits for
+# the write lock instead of failing at once
+TTT_SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 5000,  # ms
+    'temp_store': 'memory',
+    'cache_size': -16000,  # KiB
+}
+
+# Attempts for writes failing with "database is locked" (random backoff between them)
+TTT_DB_LOCK_RETRIES = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# 'games' holds loaded game state (ttt.game_cache); in production point it
+# at a shared backend (e.g. Redis with maxmemory-policy allkeys-lru)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'games': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ttt-games',
+        'TIMEOUT': 24 * 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'CULL_FREQUENCY': 10,
+        },
+    },
+}
+
+TTT_GAME_CACHE = 'games'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -135,4 +200,30 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_URL = reverse_lazy('login')
 
-LOGIN_REDIRECT_URL = reverse_lazy('index')
\ No newline at end of file
+LOGIN_REDIRECT_URL = reverse_lazy('index')
+
+# Computer player: 'minimax' (main board and mini-board solved separately),
+# 'alphabeta' (whole-game search with a time limit per move)
+# or 'mcts' (Monte Carlo Tree Search, one tree per worker process)
+TTT_BOT_ENGINE = 'alphabeta'
+
+TTT_BOT_TIME_LIMIT = 0.5  # s
+
+# MCTS budget: playouts per worker, or TTT_BOT_TIME_LIMIT when None
+TTT_MCTS_PLAYOUTS = None
+
+TTT_MCTS_WORKERS = 1
+
+# Computer moves run in a background thread pool; 0 runs them in the request
+TTT_BOT_WORKERS = 2
+
+TTT_BOT_QUEUE_SIZE = 100
+
+# Move history storage for new games: 'rows' (one Move row per cell),
+# 'dual' (Move rows and the compact Game.move_log) or 'log' (Game.move_log only);
+# pack existing finished games with `manage.py pack_move_logs`
+TTT_MOVE_STORAGE = 'rows'
+
+# Pub/sub for game events pushed over SSE (ttt.sse); swap for a shared
+# broker with the same interface when running several processes
+TTT_EVENT_BROKER = 'ttt.events.InProcessBroker'
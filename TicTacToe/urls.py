@@ -27,4 +27,7 @@ urlpatterns = [
     path('invite', views.invite, name='invite'),
     path('game/<str:external_session_id>', views.current_game, name='current_game'),
     path('game/<str:external_session_id>/<int:game_id>', views.game_details, name='game_details'),
-]
\ No newline at end of file
+    path('game/<str:external_session_id>/<int:game_id>/state', views.game_state, name='game_state'),
+    path('game/<str:external_session_id>/<int:game_id>/bot', views.bot_status, name='bot_status'),
+    path('metrics', views.metrics_view, name='metrics'),
+]
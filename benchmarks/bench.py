@@ -0,0 +1,255 @@
+"""Mikro-benchmarki silnika (ttt, parser) i core.update_game.
+
+Uruchomienie (z katalogu projektu):
+
+    python -m benchmarks.bench                       # wyniki na ekran
+    python -m benchmarks.bench --save baseline.json  # zapis punktu odniesienia
+    python -m benchmarks.bench --compare baseline.json --tolerance 0.2
+
+Przy --compare program konczy sie kodem 1, jesli ktorykolwiek benchmark
+ma ops/s nizsze o wiecej niz tolerance od zapisanego punktu odniesienia.
+Korpus pozycji i losowosc w ttt.minimax sa ustalane z --seed.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TicTacToe.settings')
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.contrib.sessions.backends.cache import SessionStore  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+
+from ttt import core, parser, ttt, views  # noqa: E402
+from ttt.models import Game  # noqa: E402
+from ttt.state import UltimateState  # noqa: E402
+from ttt.testing import compare, percentile, position_boards, random_game  # noqa: E402
+
+DEFAULT_SEED = 1
+DEFAULT_GAMES = 20
+PERCENTILES = (50, 95, 99)
+
+
+class Corpus:
+
+    def __init__(self, seed, games):
+        rng = random.Random(seed)
+        self.games = [random_game(rng) for _ in range(games)]
+        self.positions = []
+        for moves in self.games:
+            for ply in range(0, len(moves), 7):
+                self.positions.append(moves[:ply])
+        self.mini_boards = []
+        for moves in self.positions:
+            boards = position_boards(moves)
+            for board_nr in range(ttt.MIN_BOARD_NR + 1, ttt.MAX_BOARD_NR + 1):
+                self.mini_boards.append(boards[board_nr])
+        self.scenarios = [parser.render_scenario(moves) for moves in self.games]
+
+
+def measure(fn, calls, rounds):
+    times = []
+    for _ in range(rounds):
+        for args in calls:
+            start = time.perf_counter_ns()
+            fn(*args)
+            times.append(time.perf_counter_ns() - start)
+    times.sort()
+    total = sum(times)
+    result = {
+        'ops': len(times),
+        'ops_per_sec': len(times) / (total / 1e9) if total else float('inf'),
+    }
+    for q in PERCENTILES:
+        result['p{}_us'.format(q)] = percentile(times, q) / 1000
+    return result
+
+
+def bench_get_board_result(corpus, rounds):
+    return measure(ttt.get_board_result, [(b,) for b in corpus.mini_boards], rounds)
+
+
+def bench_make_board(corpus, rounds):
+    calls = [
+        ([(pos, v) for pos, v in b.items() if v is not None], True)
+        for b in corpus.mini_boards
+    ]
+    return measure(ttt.make_board, calls, rounds)
+
+
+def bench_minimax(corpus, rounds):
+    calls = []
+    for board in corpus.mini_boards:
+        if ttt._is_playable(board):
+            depth = len(ttt._get_empty_cells(board))
+            calls.append((board, depth, ttt.CROSS_SYMBOL, ttt.CROSS_SYMBOL, ttt.CIRCLE_SYMBOL))
+    return measure(ttt.minimax, calls, rounds)
+
+
+def bench_bot_turn(corpus, rounds):
+    calls = []
+    for moves in corpus.positions:
+        symbol = ttt.CIRCLE_SYMBOL if len(moves) % 2 else ttt.CROSS_SYMBOL
+        next_board_nr = moves[-1].position if moves else None
+        calls.append((position_boards(moves), symbol, next_board_nr))
+    return measure(ttt.bot_turn, calls, rounds)
+
+
+def bench_parse_steps(corpus, rounds):
+    return measure(parser.parse_steps, [(s,) for s in corpus.scenarios], rounds)
+
+
+def bench_iter_scenarios(corpus, rounds):
+    # jeden scenariusz na wywolanie, jak w parse_steps
+    return measure(
+        lambda lines: next(parser.iter_scenarios(lines)),
+        [(s.splitlines(),) for s in corpus.scenarios], rounds
+    )
+
+
+def _replay(moves):
+    state = UltimateState.initial()
+    for m in moves:
+        state.apply(m.board_nr, m.position, m.value)
+
+
+def bench_replay_game(corpus, rounds):
+    # jedna operacja to cala gra, z walidacja kazdego ruchu
+    return measure(_replay, [(moves,) for moves in corpus.games], rounds)
+
+
+class _UpdateGameCalls:
+    # argumenty core.update_game dla kolejnych ruchow gier z korpusu; kazde
+    # przejscie (runda measure) tworzy nowe gry, poza mierzonym czasem
+
+    def __init__(self, corpus, session):
+        self.corpus = corpus
+        self.session = session
+
+    def __iter__(self):
+        for moves in self.corpus.games:
+            game = core.create_game(self.session)
+            for m in moves:
+                user = game.cross_player if m.value == ttt.CROSS_SYMBOL else game.circle_player
+                yield game.id, user, m.board_nr, m.position
+            game.result = game.result or ttt.DRAW
+            game.save()
+
+
+def bench_update_game(corpus, rounds):
+    cross_user = User.objects.create_user('bench-x')
+    circle_user = User.objects.create_user('bench-o')
+    session = core.invite(cross_user, circle_user)
+    return measure(core.update_game, _UpdateGameCalls(corpus, session), rounds)
+
+
+def bench_render_game_page(corpus, rounds):
+    # stan gry i HTML strony gry (bez middleware i sesji z bazy) w pozycjach z korpusu
+    cross_user = User.objects.create_user('bench-page-x')
+    circle_user = User.objects.create_user('bench-page-o')
+    session = core.invite(cross_user, circle_user)
+    request = RequestFactory().get('/')
+    request.user = cross_user
+    request.session = SessionStore()
+    games = []
+    for moves in corpus.positions:
+        game = core.create_game(session)
+        for m in moves:
+            user = game.cross_player if m.value == ttt.CROSS_SYMBOL else game.circle_player
+            core.update_game(game.id, user, m.board_nr, m.position)
+        game.refresh_from_db()
+        games.append(game)
+        # nastepna gra w tej samej sesji; obiekt w pamieci zostaje w trakcie gry
+        Game.objects.filter(id=game.id).update(result=ttt.DRAW)
+
+    def render_page(game):
+        views._render_game_page(request, session.external_id, views._game_page_state(game, cross_user))
+    return measure(render_page, [(game,) for game in games], rounds)
+
+
+# (nazwa, funkcja, liczba powtorzen korpusu)
+BENCHMARKS = [
+    ('ttt.get_board_result', bench_get_board_result, 20),
+    ('ttt.make_board', bench_make_board, 20),
+    ('ttt.minimax', bench_minimax, 5),
+    ('ttt.bot_turn', bench_bot_turn, 3),
+    ('parser.parse_steps', bench_parse_steps, 5),
+    ('parser.iter_scenarios', bench_iter_scenarios, 5),
+    ('state.UltimateState.apply', bench_replay_game, 20),
+    ('core.update_game', bench_update_game, 1),
+    ('views.render_game_page', bench_render_game_page, 3),
+]
+
+
+def run(seed=DEFAULT_SEED, games=DEFAULT_GAMES, only=None):
+    ttt.seed_random(seed)
+    corpus = Corpus(seed, games)
+    results = {}
+    # wlasny plik bazy - nie niszczy bazy rownolegle uruchomionych testow
+    test_db_dir = tempfile.mkdtemp()
+    old_test_name = connection.settings_dict['TEST']['NAME']
+    connection.settings_dict['TEST']['NAME'] = os.path.join(test_db_dir, 'bench.sqlite3')
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        for name, fn, rounds in BENCHMARKS:
+            if only and not any(o in name for o in only):
+                continue
+            results[name] = fn(corpus, rounds)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        connection.settings_dict['TEST']['NAME'] = old_test_name
+        shutil.rmtree(test_db_dir, ignore_errors=True)
+    return results
+
+
+def format_results(results):
+    header = '{:<24} {:>8} {:>12} {:>10} {:>10} {:>10}'.format(
+        'benchmark', 'ops', 'ops/s', 'p50 us', 'p95 us', 'p99 us')
+    lines = [header, '-' * len(header)]
+    for name, r in results.items():
+        lines.append('{:<24} {:>8} {:>12.1f} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+            name, r['ops'], r['ops_per_sec'], r['p50_us'], r['p95_us'], r['p99_us']))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    arg_parser.add_argument('--games', type=int, default=DEFAULT_GAMES)
+    arg_parser.add_argument('--only', action='append', help='run benchmarks whose name contains this')
+    arg_parser.add_argument('--save', help='write results as JSON baseline')
+    arg_parser.add_argument('--compare', help='JSON baseline to compare against')
+    arg_parser.add_argument('--tolerance', type=float, default=0.2)
+    args = arg_parser.parse_args(argv)
+
+    results = run(seed=args.seed, games=args.games, only=args.only)
+    print(format_results(results))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for name, current, base in regressions:
+            print('REGRESSION {}: {:.1f} ops/s, baseline {:.1f} ops/s ({:+.0%})'.format(
+                name, current, base, current / base - 1), file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
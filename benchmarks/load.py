@@ -0,0 +1,263 @@
+"""Generator obciazenia grajacy cale gry przez widoki Django.
+
+Rejestruje uzytkownikow przez widok registration, tworzy sesje przez
+core.invite (gracz - gracz) i core.invite_computer_player (gracz - komputer),
+a nastepnie rownolegle rozgrywa gry przez game_details (GET/POST) i game_state,
+uzywajac django.test.Client w osobnych watkach. Baza to tymczasowy plik
+SQLite, wiec watki konkuruja o blokady tak jak na produkcji.
+
+    python -m benchmarks.load --pairs 8 --computer-games 4
+    python -m benchmarks.load --pairs 16 --bot-workers 2 --json load.json
+
+Raport: przepustowosc, histogramy opoznien dla kazdego rodzaju requestu,
+bledy "database is locked" i osobno czas ruchow komputera.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TicTacToe.settings')
+django.setup()
+
+from django.db import connection, connections  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from ttt import core, ttt  # noqa: E402
+from ttt.search import Position  # noqa: E402
+from ttt.testing import ResponseError, Stats  # noqa: E402
+
+POLL_INTERVAL = 0.02  # s
+MAX_RETRIES = 20
+MAX_GAME_TIME = 120  # s
+
+PASSWORD = 'load-test-password'
+
+
+class Player:
+    """Klient HTTP jednego gracza, grajacy losowymi poprawnymi ruchami."""
+
+    def __init__(self, username, stats, rng):
+        self.username = username
+        self.stats = stats
+        self.rng = rng
+        self.client = Client()
+
+    def request(self, kind, method, url, **kwargs):
+        for attempt in range(MAX_RETRIES):
+            start = time.perf_counter()
+            try:
+                response = getattr(self.client, method)(url, **kwargs)
+            except Exception as exc:
+                self.stats.count_error(kind, exc)
+                time.sleep(POLL_INTERVAL * (attempt + 1))
+                continue
+            finally:
+                self.stats.record(kind, time.perf_counter() - start)
+            if response.status_code == 503:
+                # baza zajeta - jak blad blokady, ponawiamy
+                self.stats.count_error(kind, ResponseError(response.status_code))
+                time.sleep(POLL_INTERVAL * (attempt + 1))
+                continue
+            return response
+        raise RuntimeError('{} failed {} times'.format(kind, MAX_RETRIES))
+
+    def register(self):
+        self.request('POST registration', 'post', reverse('registration'), data={
+            'username': self.username,
+            'password': PASSWORD,
+            'email': '{}@example.com'.format(self.username),
+        })
+        return User.objects.get(username=self.username)
+
+    def open_game(self, external_session_id):
+        response = self.request('GET current_game', 'get', reverse('current_game', args=[external_session_id]))
+        url = response['Location']
+        self.request('GET game_details', 'get', url)
+        return url
+
+    def play(self, url):
+        """Gra az do konca gry. Zwraca wynik."""
+        position = Position.from_boards(ttt.to_boards([]), ttt.CROSS_SYMBOL, None)
+        cursor = 0
+        deadline = time.monotonic() + MAX_GAME_TIME
+        while time.monotonic() < deadline:
+            state = self.request('GET game_state', 'get', url + '/state', data={'since': cursor}).json()
+            for move in state['moves']:
+                if move['board_nr'] != ttt.MAIN_BOARD_NR:
+                    position.play(move['board_nr'], move['position'])
+            cursor = state['cursor']
+            if state['result'] is not None:
+                return state['result']
+            if not state['is_your_move']:
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            board_nr, pos = self.rng.choice(position.legal_moves())
+            response = self.request('POST game_details', 'post', url, data=json.dumps({
+                'boardNr': board_nr,
+                'position': pos,
+            }), content_type='application/json')
+            if response.status_code == 200:
+                self.stats.count_move()
+            else:
+                self.stats.count_error('POST game_details', ResponseError(response.status_code))
+        raise RuntimeError('game {} did not finish in {} s'.format(url, MAX_GAME_TIME))
+
+
+def _run_player(player, url, stats, failures):
+    try:
+        player.play(url)
+    except Exception as exc:
+        failures.append(exc)
+    finally:
+        connections.close_all()
+
+
+def _run_pair(player_1, player_2, url, stats, failures):
+    threads = [
+        threading.Thread(target=_run_player, args=(p, url, stats, failures))
+        for p in (player_1, player_2)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats.count_game()
+
+
+def _run_computer_game(player, url, stats, failures):
+    _run_player(player, url, stats, failures)
+    stats.count_game()
+
+
+def _timed_update_game_by_computer(stats):
+    original = core.update_game_by_computer
+
+    def update_game_by_computer(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            stats.record('bot move', time.perf_counter() - start)
+
+    return original, update_game_by_computer
+
+
+def run(pairs, computer_games, seed=1):
+    stats = Stats()
+    rng = random.Random(seed)
+    failures = []
+
+    humans = []
+    for i in range(pairs * 2 + computer_games):
+        player = Player('load{}'.format(i), stats, random.Random(rng.getrandbits(32)))
+        player.user = player.register()
+        humans.append(player)
+
+    jobs = []
+    for i in range(pairs):
+        player_1, player_2 = humans[2 * i], humans[2 * i + 1]
+        session = core.invite(player_1.user, player_2.user)
+        url = player_1.open_game(session.external_id)
+        player_2.open_game(session.external_id)
+        jobs.append(threading.Thread(target=_run_pair, args=(player_1, player_2, url, stats, failures)))
+    for player in humans[pairs * 2:]:
+        session = core.invite_computer_player(player.user)
+        url = player.open_game(session.external_id)
+        jobs.append(threading.Thread(target=_run_computer_game, args=(player, url, stats, failures)))
+
+    original, timed = _timed_update_game_by_computer(stats)
+    core.update_game_by_computer = timed
+    start = time.perf_counter()
+    try:
+        for job in jobs:
+            job.start()
+        for job in jobs:
+            job.join()
+    finally:
+        core.update_game_by_computer = original
+    elapsed = time.perf_counter() - start
+
+    result = stats.summary(elapsed)
+    result['failures'] = [str(f) for f in failures]
+    return result
+
+
+def format_summary(summary):
+    lines = [
+        'elapsed: {elapsed_s:.2f} s, games finished: {games_finished}'.format(**summary),
+        'throughput: {requests_per_sec:.1f} req/s, {moves_per_sec:.1f} moves/s'.format(**summary),
+        'lock errors (incl. 503 busy): {}'.format(summary['lock_errors']),
+    ]
+    for key, count in sorted(summary['errors'].items()):
+        lines.append('error {}: {}'.format(key, count))
+    for failure in summary['failures']:
+        lines.append('failure: {}'.format(failure))
+    lines.append('')
+    lines.append('{:<22} {:>7} {:>9} {:>9} {:>9} {:>9}'.format(
+        'request', 'count', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms'))
+    for kind, lat in summary['latency'].items():
+        lines.append('{:<22} {:>7} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}'.format(
+            kind, lat['count'], lat['p50_ms'], lat['p95_ms'], lat['p99_ms'], lat['max_ms']))
+    for kind, lat in summary['latency'].items():
+        lines.append('')
+        lines.append('{} histogram:'.format(kind))
+        for bucket, count in lat['histogram_ms'].items():
+            if count:
+                lines.append('  {:>8} ms {:>7}'.format(bucket, count))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--pairs', type=int, default=4, help='human vs human games')
+    arg_parser.add_argument('--computer-games', type=int, default=2, help='human vs computer games')
+    arg_parser.add_argument('--seed', type=int, default=1)
+    arg_parser.add_argument('--bot-engine', default='alphabeta')
+    arg_parser.add_argument('--bot-time-limit', type=float, default=0.05)
+    arg_parser.add_argument('--bot-workers', type=int, default=0)
+    arg_parser.add_argument('--json', help='write the summary as JSON')
+    arg_parser.add_argument('--verbose', action='store_true', help='log request exceptions')
+    args = arg_parser.parse_args(argv)
+
+    if not args.verbose:
+        # bledy blokad sa liczone w raporcie, tracebacki tylko zaciemniaja wynik
+        logging.disable(logging.CRITICAL)
+
+    test_db_dir = tempfile.mkdtemp()
+    old_test_name = connection.settings_dict['TEST']['NAME']
+    connection.settings_dict['TEST']['NAME'] = os.path.join(test_db_dir, 'load.sqlite3')
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        with override_settings(
+                TTT_BOT_ENGINE=args.bot_engine,
+                TTT_BOT_TIME_LIMIT=args.bot_time_limit,
+                TTT_BOT_WORKERS=args.bot_workers,
+                ALLOWED_HOSTS=['testserver']):
+            summary = run(args.pairs, args.computer_games, seed=args.seed)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        connection.settings_dict['TEST']['NAME'] = old_test_name
+        shutil.rmtree(test_db_dir, ignore_errors=True)
+
+    print(format_summary(summary))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return 1 if summary['failures'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,284 @@
+"""Porownanie WSGI i ASGI przy wielu rownoczesnych klientach.
+
+Obie aplikacje sa wolane w procesie (bez serwera HTTP i sieci):
+
+    wsgi - WSGIHandler z widokami sync, obslugiwany przez pule watkow
+           (jak gunicorn --threads), nadmiarowe requesty czekaja w kolejce
+    asgi - ASGIHandler z widokami async (TicTacToe.asgi_urls), wszystkie
+           requesty jako korutyny jednej petli zdarzen
+
+Kazdy klient to zalogowany gracz, ktory ma wlasna gre z komputerem i kilka
+razy pobiera strone gry (current_game -> game_details). Ruch komputera jest
+liczony w requescie (TTT_BOT_WORKERS=0): w wiekszosci gier komputer zaczyna,
+wiec robi to pierwsze pobranie strony; gracz, ktory zaczyna, wysyla ruch
+(POST). Pod WSGI to przeszukiwanie zajmuje watek puli, pod ASGI - watek
+executora (bot_worker.submit_async).
+
+    python -m benchmarks.servers --clients 200 --requests 5
+    python -m benchmarks.servers --mode asgi --clients 1000 --json servers.json
+
+Raport: requesty/s, opoznienia requestow, czas obsluzenia klienta liczony
+od startu (razem z czekaniem w kolejce puli WSGI) i bledy.
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TicTacToe.settings')
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.handlers.asgi import ASGIHandler  # noqa: E402
+from django.core.handlers.wsgi import WSGIHandler  # noqa: E402
+from django.db import connection, connections  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from ttt import core  # noqa: E402
+from ttt.testing import ResponseError, Stats  # noqa: E402
+
+URLCONFS = {
+    'wsgi': 'TicTacToe.urls',
+    'asgi': 'TicTacToe.asgi_urls',
+}
+
+FIRST_MOVE = json.dumps({'boardNr': 5, 'position': 5}).encode('utf-8')
+
+
+def _make_clients(count, prefix):
+    """(cookie sesji, url current_game, czy gracz zaczyna) dla kazdego klienta."""
+    clients = []
+    for i in range(count):
+        user = User.objects.create_user('{}{}'.format(prefix, i))
+        game_session = core.invite_computer_player(user)
+        game = core.create_game(game_session)
+        client = Client()
+        client.force_login(user)
+        cookie = '{}={}'.format(settings.SESSION_COOKIE_NAME, client.cookies[settings.SESSION_COOKIE_NAME].value)
+        url = reverse('current_game', args=[game_session.external_id])
+        clients.append((cookie, url, core.is_first_player(game, user)))
+    return clients
+
+
+def _wsgi_call(app, method, path, cookie, body=b''):
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'testserver',
+        'HTTP_COOKIE': cookie,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.url_scheme': 'http',
+        'wsgi.version': (1, 0),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = dict(headers)
+
+    chunks = app(environ, start_response)
+    try:
+        b''.join(chunks)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    return response['status'], response['headers']
+
+
+async def _asgi_call(app, method, path, cookie, body=b''):
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': method,
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode('utf-8'),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [
+            (b'host', b'testserver'),
+            (b'cookie', cookie.encode('latin-1')),
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode('ascii')),
+        ],
+        'client': ('127.0.0.1', 0),
+        'server': ('testserver', 80),
+    }
+    response = {}
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            response['headers'] = {
+                name.decode('latin-1').title(): value.decode('latin-1') for name, value in message['headers']
+            }
+
+    await app(scope, receive, send)
+    return response['status'], response['headers']
+
+
+def _record(stats, kind, start, status):
+    stats.record(kind, time.perf_counter() - start)
+    if status >= 400:
+        stats.count_error(kind, ResponseError(status))
+
+
+def _summary(stats, totals, elapsed):
+    summary = stats.summary(elapsed)
+    summary['latency'].update(totals.summary(elapsed)['latency'])
+    return summary
+
+
+def run_wsgi(clients, requests, threads):
+    app = WSGIHandler()
+    stats, totals = Stats(), Stats()
+
+    def session(cookie, url, first):
+        for i in range(requests):
+            request_start = time.perf_counter()
+            status, headers = _wsgi_call(app, 'GET', url, cookie)
+            _record(stats, 'GET current_game', request_start, status)
+            game_url = headers.get('Location', url)
+            request_start = time.perf_counter()
+            if first and i == 0:
+                status, _ = _wsgi_call(app, 'POST', game_url, cookie, FIRST_MOVE)
+                _record(stats, 'POST game_details', request_start, status)
+                stats.count_move()
+            else:
+                status, _ = _wsgi_call(app, 'GET', game_url, cookie)
+                _record(stats, 'GET game_details', request_start, status)
+        # od startu wszystkich klientow - razem z czekaniem na wolny watek
+        totals.record('client total', time.perf_counter() - start)
+        stats.count_game()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for future in [executor.submit(session, *client) for client in clients]:
+            future.result()
+    elapsed = time.perf_counter() - start
+    return _summary(stats, totals, elapsed)
+
+
+def run_asgi(clients, requests):
+    app = ASGIHandler()
+    stats, totals = Stats(), Stats()
+
+    async def session(cookie, url, first):
+        for i in range(requests):
+            request_start = time.perf_counter()
+            status, headers = await _asgi_call(app, 'GET', url, cookie)
+            _record(stats, 'GET current_game', request_start, status)
+            game_url = headers.get('Location', url)
+            request_start = time.perf_counter()
+            if first and i == 0:
+                status, _ = await _asgi_call(app, 'POST', game_url, cookie, FIRST_MOVE)
+                _record(stats, 'POST game_details', request_start, status)
+                stats.count_move()
+            else:
+                status, _ = await _asgi_call(app, 'GET', game_url, cookie)
+                _record(stats, 'GET game_details', request_start, status)
+        totals.record('client total', time.perf_counter() - start)
+        stats.count_game()
+
+    async def main():
+        await asyncio.gather(*[session(*client) for client in clients])
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    elapsed = time.perf_counter() - start
+    return _summary(stats, totals, elapsed)
+
+
+def run(mode, clients, requests, threads):
+    with override_settings(ROOT_URLCONF=URLCONFS[mode]):
+        if mode == 'wsgi':
+            return run_wsgi(clients, requests, threads)
+        return run_asgi(clients, requests)
+
+
+def format_summary(mode, summary):
+    lines = [
+        '[{}]'.format(mode),
+        'elapsed: {elapsed_s:.2f} s, clients: {games_finished}'.format(**summary),
+        'throughput: {requests_per_sec:.1f} req/s'.format(**summary),
+    ]
+    for key, count in sorted(summary['errors'].items()):
+        lines.append('error {}: {}'.format(key, count))
+    lines.append('{:<20} {:>7} {:>9} {:>9} {:>9} {:>9}'.format(
+        'request', 'count', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms'))
+    for kind, lat in summary['latency'].items():
+        lines.append('{:<20} {:>7} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}'.format(
+            kind, lat['count'], lat['p50_ms'], lat['p95_ms'], lat['p99_ms'], lat['max_ms']))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--clients', type=int, default=200, help='concurrent clients')
+    arg_parser.add_argument('--requests', type=int, default=5, help='page loads per client')
+    arg_parser.add_argument('--wsgi-threads', type=int, default=8, help='WSGI worker threads')
+    arg_parser.add_argument('--mode', choices=sorted(URLCONFS) + ['both'], default='both')
+    arg_parser.add_argument('--bot-engine', default='alphabeta')
+    arg_parser.add_argument('--bot-time-limit', type=float, default=0.05)
+    arg_parser.add_argument('--json', help='write the summaries as JSON')
+    args = arg_parser.parse_args(argv)
+
+    logging.disable(logging.CRITICAL)
+    test_db_dir = tempfile.mkdtemp()
+    old_test_name = connection.settings_dict['TEST']['NAME']
+    connection.settings_dict['TEST']['NAME'] = os.path.join(test_db_dir, 'servers.sqlite3')
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    summaries = {}
+    try:
+        with override_settings(
+                TTT_BOT_ENGINE=args.bot_engine,
+                TTT_BOT_TIME_LIMIT=args.bot_time_limit,
+                TTT_BOT_WORKERS=0,
+                ALLOWED_HOSTS=['testserver']):
+            modes = sorted(URLCONFS) if args.mode == 'both' else [args.mode]
+            for mode in modes:
+                # kazdy tryb na nowych grach - ruchy z poprzedniego nie wplywaja na wynik
+                clients = _make_clients(args.clients, mode)
+                connections.close_all()
+                summaries[mode] = run(mode, clients, args.requests, args.wsgi_threads)
+                print(format_summary(mode, summaries[mode]))
+                print()
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        connection.settings_dict['TEST']['NAME'] = old_test_name
+        shutil.rmtree(test_db_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summaries, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
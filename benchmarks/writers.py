@@ -0,0 +1,193 @@
+"""Benchmark wspolbieznych zapisow ruchow do jednego pliku SQLite.
+
+Kazdy watek piszacy rozgrywa wlasne gry przez core.update_game (bez widokow),
+a watki czytajace w tym czasie odpytuja stan losowych gier tak jak game_state.
+Porownuje profile polaczen SQLite:
+
+    default     - ustawienia domyslne (journal_mode=delete, bez ponowien)
+    concurrent  - settings.TTT_SQLITE_PRAGMAS (WAL) i ponowienia db.retry_on_lock
+
+    python -m benchmarks.writers --writers 16 --games 4
+    python -m benchmarks.writers --profile concurrent --readers 8 --json writers.json
+
+Raport: ruchy/s, opoznienia zapisow i odczytow, bledy "database is locked"
+i liczba ponowien.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TicTacToe.settings')
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.db import connection, connections  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.test import override_settings  # noqa: E402
+
+from ttt import core, metrics, ttt  # noqa: E402
+from ttt.models import Game  # noqa: E402
+from ttt.testing import Stats, random_game  # noqa: E402
+
+PROFILES = {
+    'default': {'TTT_SQLITE_PRAGMAS': {}, 'TTT_DB_LOCK_RETRIES': 1},
+    'concurrent': {
+        'TTT_SQLITE_PRAGMAS': settings.TTT_SQLITE_PRAGMAS,
+        'TTT_DB_LOCK_RETRIES': settings.TTT_DB_LOCK_RETRIES,
+    },
+}
+
+
+def _retries():
+    return sum(value for _, value in metrics.db_lock_retries.samples())
+
+
+def _writer(games, stats, failures):
+    try:
+        for game, players, moves in games:
+            for m in moves:
+                start = time.perf_counter()
+                try:
+                    core.update_game(game.id, players[m.value], m.board_nr, m.position)
+                except Exception as exc:
+                    stats.count_error('update_game', exc)
+                    # ruch przepadl, gra i tak nie moze byc dokonczona
+                    break
+                finally:
+                    stats.record('update_game', time.perf_counter() - start)
+                stats.count_move()
+            stats.count_game()
+    except Exception as exc:
+        failures.append(exc)
+    finally:
+        connections.close_all()
+
+
+def _reader(game_ids, stats, done, rng):
+    try:
+        while not done.is_set():
+            start = time.perf_counter()
+            try:
+                game = Game.objects.get(id=rng.choice(game_ids))
+                core.get_game_moves(game)
+            except Exception as exc:
+                stats.count_error('read', exc)
+            finally:
+                stats.record('read', time.perf_counter() - start)
+    finally:
+        connections.close_all()
+
+
+def run(writers, games_per_writer, readers, seed=1):
+    stats = Stats()
+    rng = random.Random(seed)
+    failures = []
+
+    jobs = []
+    game_ids = []
+    for w in range(writers):
+        games = []
+        for g in range(games_per_writer):
+            u1 = User.objects.create_user('w{}-{}-a'.format(w, g))
+            u2 = User.objects.create_user('w{}-{}-b'.format(w, g))
+            game = core.create_game(core.invite(u1, u2))
+            players = {ttt.CROSS_SYMBOL: game.cross_player, ttt.CIRCLE_SYMBOL: game.circle_player}
+            games.append((game, players, random_game(rng)))
+            game_ids.append(game.id)
+        jobs.append(threading.Thread(target=_writer, args=(games, stats, failures)))
+    done = threading.Event()
+    reader_jobs = [
+        threading.Thread(target=_reader, args=(game_ids, stats, done, random.Random(rng.getrandbits(32))))
+        for _ in range(readers)
+    ]
+
+    retries = _retries()
+    start = time.perf_counter()
+    for job in jobs + reader_jobs:
+        job.start()
+    for job in jobs:
+        job.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    for job in reader_jobs:
+        job.join()
+
+    result = stats.summary(elapsed)
+    result['lock_retries'] = _retries() - retries
+    result['failures'] = [str(f) for f in failures]
+    return result
+
+
+def run_profile(profile, writers, games_per_writer, readers, seed=1):
+    """Uruchamia run na nowej, tymczasowej bazie (tryb WAL zostaje w pliku bazy)."""
+    test_db_dir = tempfile.mkdtemp()
+    old_name = connection.settings_dict['NAME']
+    old_test_name = connection.settings_dict['TEST']['NAME']
+    try:
+        with override_settings(**PROFILES[profile]):
+            connection.close()
+            connection.settings_dict['TEST']['NAME'] = os.path.join(test_db_dir, 'writers.sqlite3')
+            connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                return run(writers, games_per_writer, readers, seed=seed)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+    finally:
+        connection.settings_dict['TEST']['NAME'] = old_test_name
+        shutil.rmtree(test_db_dir, ignore_errors=True)
+
+
+def format_summary(profile, summary):
+    lines = [
+        '[{}]'.format(profile),
+        'elapsed: {elapsed_s:.2f} s, games finished: {games_finished}, moves: {moves}'.format(**summary),
+        'throughput: {moves_per_sec:.1f} moves/s'.format(**summary),
+        'sqlite lock errors: {lock_errors}, lock retries: {lock_retries}'.format(**summary),
+    ]
+    for key, count in sorted(summary['errors'].items()):
+        lines.append('error {}: {}'.format(key, count))
+    for failure in summary['failures']:
+        lines.append('failure: {}'.format(failure))
+    lines.append('{:<14} {:>7} {:>9} {:>9} {:>9} {:>9}'.format(
+        'operation', 'count', 'p50 ms', 'p95 ms', 'p99 ms', 'max ms'))
+    for kind, lat in summary['latency'].items():
+        lines.append('{:<14} {:>7} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}'.format(
+            kind, lat['count'], lat['p50_ms'], lat['p95_ms'], lat['p99_ms'], lat['max_ms']))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--writers', type=int, default=16, help='threads writing moves')
+    arg_parser.add_argument('--games', type=int, default=2, help='games played by each writer')
+    arg_parser.add_argument('--readers', type=int, default=4, help='threads reading game state')
+    arg_parser.add_argument('--profile', choices=sorted(PROFILES) + ['both'], default='both')
+    arg_parser.add_argument('--seed', type=int, default=1)
+    arg_parser.add_argument('--json', help='write the summaries as JSON')
+    args = arg_parser.parse_args(argv)
+
+    logging.disable(logging.CRITICAL)
+    profiles = sorted(PROFILES) if args.profile == 'both' else [args.profile]
+    summaries = {}
+    for profile in profiles:
+        summaries[profile] = run_profile(profile, args.writers, args.games, args.readers, seed=args.seed)
+        print(format_summary(profile, summaries[profile]))
+        print()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summaries, f, indent=2)
+    return 1 if any(s['failures'] for s in summaries.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,6 +11,11 @@ const BOARD_ODD_MARKER = 'board-odd-marker';
 const BOARD_EVEN_MARKER = 'board-even-marker';
 const CROSS_STRONG_MARKER = 'cross-strong-marker';
 const CIRCLE_STRONG_MARKER = 'circle-strong-marker';
+// zapis plansz jak ttt.snapshot_index: 81 pol mini-plansz, potem 9 pol planszy glownej
+const MAIN_BOARD_NR = 0;
+const MAIN_BOARD_OFFSET = BOARD_COUNT * POS_COUNT;
+const EMPTY_CELL = '.';
+const DRAW_CELL = 'D';
 const ALL_MARKERS = [
     CROSS_MARKER,
     CIRCLE_MARKER,
@@ -202,7 +207,25 @@ function markLastUsedFields(moves, miniBoards) {
 }
 
 
-function setupBoard(moves, onFieldClick) {
+// legalMoves: [[boardNr, position], ...] wyliczone na serwerze
+function markLegalMoves(miniBoards, legalMoves) {
+    legalMoves.forEach(function (move) {
+        var $field = miniBoards[move[0]][move[1]];
+        unmarkField($field, BOARD_ODD_MARKER);
+        unmarkField($field, BOARD_EVEN_MARKER);
+        markField($field, SUGGESTION_MARKER);
+    });
+}
+
+
+function isLegalMove(legalMoves, boardNr, position) {
+    return legalMoves.some(function (move) {
+        return move[0] === boardNr && move[1] === position;
+    });
+}
+
+
+function setupBoard(moves, legalMoves, onFieldClick) {
     const $fields = $(".ttt td");
     const miniBoards = toBoards($fields);
     const mainBoard = toMainBoard(moves);
@@ -210,14 +233,17 @@ function setupBoard(moves, onFieldClick) {
     insertMoves(miniBoards, moves);
     markMiniBoardsWinner(miniBoards, mainBoard);
     markLastUsedFields(moves, miniBoards);
+    markLegalMoves(miniBoards, legalMoves);
     const board = {
         'enabled': true,
         'miniBoards': miniBoards,
     };
     $fields.click(function () {
        const $field = $(this);
-       if (board['enabled']) {
-           onFieldClick(board, $field, $field.data("board-nr"), $field.data("pos"));
+       const boardNr = $field.data("board-nr");
+       const position = $field.data("pos");
+       if (board['enabled'] && isLegalMove(legalMoves, boardNr, position)) {
+           onFieldClick(board, $field, boardNr, position);
        }
     });
     // markBoard(boards[1], CROSS_MARKER);
@@ -233,6 +259,45 @@ function setupBoard(moves, onFieldClick) {
 }
 
 
+// odwrotnosc ttt.snapshot_index: [boardNr, position]
+function snapshotCell(index) {
+    if (index >= MAIN_BOARD_OFFSET) {
+        return [MAIN_BOARD_NR, index - MAIN_BOARD_OFFSET + 1];
+    }
+    return [Math.floor(index / POS_COUNT) + 1, index % POS_COUNT + 1];
+}
+
+
+function snapshotMove(board, index) {
+    const cell = snapshotCell(index);
+    const value = board[index] === DRAW_CELL ? DRAW : board[index];
+    return {'board_nr': cell[0], 'position': cell[1], 'value': value};
+}
+
+
+// ruchy z zapisu plansz (serializers.compact_snapshot); ostatnie ruchy graczy na koncu listy
+function snapshotMoves(board, lastCells) {
+    const moves = [];
+    for (var index = 0; index < board.length; ++index) {
+        if (board[index] !== EMPTY_CELL && lastCells.indexOf(index) === -1) {
+            moves.push(snapshotMove(board, index));
+        }
+    }
+    lastCells.forEach(function (index) {
+        moves.push(snapshotMove(board, index));
+    });
+    return moves;
+}
+
+
+// stan z serwera (views._game_page_state) -> ruchy i dozwolone ruchy jak w game_state
+function hydrateGameState(data) {
+    data['moves'] = snapshotMoves(data['board'], data['last']);
+    data['legal_moves'] = data['legal'].map(snapshotCell);
+    return data;
+}
+
+
 function setupMessageDisplayer(message) {
     $('#message-displayer').text(message);
 }
@@ -252,28 +317,15 @@ function nextSymbol(symbol) {
 }
 
 
-function calcMiniBoardMoves(moves) {
-    var counter = 0;
-    moves.forEach(function(move) {
-        if (move['board_nr'] > 0) {
-            ++counter;
-        }
-    });
-    return counter;
-}
-
-
 function isYourMove(game) {
-    var n = calcMiniBoardMoves(game['moves']);
-    return (
-        (game['your_symbol'] === CROSS_SYMBOL && (n % 2 === 0)) ||
-        (game['your_symbol'] === CIRCLE_SYMBOL && (n % 2 === 1))
-    );
+    // serwer liczy kolej ze stanu gry (takze po archiwizacji i wyniku gry)
+    return game['is_your_move'];
 }
 
 
 function isGameRunning(game) {
-    return game['result'] === null;
+    // porzucona gra przeniesiona do archiwum jest tylko do odczytu
+    return game['result'] === null && !game['archived'];
 }
 
 
@@ -287,6 +339,9 @@ function getMessageFromGame(game) {
     else if (game['result'] === DRAW) {
         return "Remis";
     }
+    else if (game['archived']) {
+        return "Gra przerwana";
+    }
     else if (isYourMove(game)) {
         return "Twój ruch";
     }
@@ -315,7 +370,7 @@ function sendUpdateBoardRequest(boardNr, position, done) {
         position: position
     }), function (data) {
         console.log(data);
-        done({status: 200});
+        done({status: 200, data: data});
     }).fail(function (response) {
         console.log(response.responseJSON);
         done({status: response.status});
@@ -330,13 +385,62 @@ function updateBoard(board, boardNr, position, symbol) {
     markField($field, marker);
 }
 
+const BOT_STATUS_POLLING_INTERVAL = 300; // ms
+
+
+function isBotBusy(status) {
+    return status === 'queued' || status === 'running';
+}
+
+
+function waitForBot(done) {
+    $.get(window.location.pathname + "/bot", function (data) {
+        if (isBotBusy(data['status'])) {
+            setTimeout(function () {
+                waitForBot(done);
+            }, BOT_STATUS_POLLING_INTERVAL);
+        }
+        else {
+            done();
+        }
+    }).fail(function () {
+        done();
+    });
+}
+
+
 function setupAutoReloading(timeout) {
     setTimeout(function () {
         window.location.reload(true);
     }, timeout);
 }
 
-const AUTO_RELOADING_TIMEOUT = 1000; // ms
+const AUTO_RELOADING_TIMEOUT = 2000; // ms
+
+
+function setupGameEvents(version, onUnavailable) {
+    if (!window.EventSource) {
+        onUnavailable();
+        return;
+    }
+    const source = new EventSource(window.location.pathname + "/events");
+    source.addEventListener("hello", function (event) {
+        // ruch zapisany miedzy wyrenderowaniem strony a polaczeniem
+        if (JSON.parse(event.data)['version'] > version) {
+            source.close();
+            window.location.reload(true);
+        }
+    });
+    source.addEventListener("move", function () {
+        source.close();
+        window.location.reload(true);
+    });
+    source.onerror = function () {
+        // np. serwer WSGI bez obslugi SSE - wracamy do przeladowywania strony
+        source.close();
+        onUnavailable();
+    };
+}
 
 
 function setupNewGameLink(game) {
@@ -355,26 +459,35 @@ function setupSymbolIcon(symbol) {
 
 
 $(function () {
-    const gameState = getDataFromScript("game-state");
+    const gameState = hydrateGameState(getDataFromScript("game-state"));
     // const gameState = {"moves": [1, 1], "result": null, "your_symbol": "X"};
     setupMessageDisplayer(getMessageFromGame(gameState));
     setupSymbolIcon(gameState['your_symbol'])
     setupNewGameLink(gameState);
-//    setupAutoReloading(AUTO_RELOADING_TIMEOUT);
-
-//     onServer(function (event) {
-
-//     });
+    if (isGameRunning(gameState)) {
+        setupGameEvents(gameState['version'], function () {
+            if (!isYourMove(gameState)) {
+                setupAutoReloading(AUTO_RELOADING_TIMEOUT);
+            }
+        });
+    }
 
-    setupBoard(gameState['moves'], function (board, $field, boardNr, position) {
+    setupBoard(gameState['moves'], gameState['legal_moves'], function (board, $field, boardNr, position) {
         lockBoardContext(board, function (unlockBoard) {
             console.log("kliknięto", boardNr, position)
             sendUpdateBoardRequest(boardNr, position, function (response) {
                 if (response.status === 200) {
                     updateBoard(board, boardNr, position, gameState['your_symbol']);
                 }
-                window.location.reload(true);
-                unlockBoard();
+                if (response.data && isBotBusy(response.data['bot'])) {
+                    waitForBot(function () {
+                        window.location.reload(true);
+                    });
+                }
+                else {
+                    window.location.reload(true);
+                    unlockBoard();
+                }
             });
         });
     });
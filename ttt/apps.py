@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
 
 
 class TttConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ttt'
+
+    def ready(self):
+        from ttt import core, db, mcts, middleware
+        connection_created.connect(db.configure_connection, dispatch_uid='ttt.db.configure_connection')
+        connection_created.connect(middleware.install_query_timer, dispatch_uid='ttt.middleware.install_query_timer')
+        if getattr(settings, 'TTT_BOT_ENGINE', None) == core.BOT_ENGINE_MCTS:
+            workers = getattr(settings, 'TTT_MCTS_WORKERS', 1)
+            if workers > 1:
+                mcts.start_executor(workers)
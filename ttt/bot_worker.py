@@ -0,0 +1,156 @@
+"""Ruchy komputera wykonywane w tle, poza requestem HTTP.
+
+Zadania trafiaja do ograniczonej kolejki obslugiwanej przez pule watkow.
+Dla jednej gry w kolejce (lub w trakcie wykonywania) jest co najwyzej jedno
+zadanie. Status ostatniego zadania gry mozna odczytac przez status().
+"""
+import logging
+import queue
+import threading
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from ttt import core
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+ACTIVE_STATUSES = (STATUS_QUEUED, STATUS_RUNNING)
+
+MAX_STATUSES = 10000
+
+
+class QueueFull(Exception):
+    pass
+
+
+class BotExecutor:
+    """Pula watkow wykonujaca handler(game_id).
+
+    Przy workers == 0 zadania sa wykonywane od razu w watku wywolujacym.
+    """
+
+    def __init__(self, handler, workers, max_queue_size):
+        self._handler = handler
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._statuses = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._work, name='bot-worker-{}'.format(i), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def status(self, game_id):
+        with self._lock:
+            return self._statuses.get(game_id)
+
+    def _set_status(self, game_id, status):
+        with self._lock:
+            self._statuses[game_id] = status
+            self._statuses.move_to_end(game_id)
+            while len(self._statuses) > MAX_STATUSES:
+                oldest = next(iter(self._statuses))
+                if self._statuses[oldest] in ACTIVE_STATUSES:
+                    break
+                del self._statuses[oldest]
+
+    def submit(self, game_id):
+        """Zleca ruch komputera. Zwraca False, gdy zadanie dla gry juz czeka."""
+        if self.workers == 0:
+            self._execute(game_id)
+            return True
+
+        with self._lock:
+            if self._statuses.get(game_id) in ACTIVE_STATUSES:
+                return False
+            try:
+                self._queue.put_nowait(game_id)
+            except queue.Full:
+                raise QueueFull()
+            self._statuses[game_id] = STATUS_QUEUED
+            self._statuses.move_to_end(game_id)
+        return True
+
+    def _execute(self, game_id):
+        self._set_status(game_id, STATUS_RUNNING)
+        try:
+            self._handler(game_id)
+        except Exception:
+            logger.exception('Computer move failed in game %s', game_id)
+            self._set_status(game_id, STATUS_FAILED)
+        else:
+            self._set_status(game_id, STATUS_DONE)
+
+    def _work(self):
+        while True:
+            game_id = self._queue.get()
+            close_old_connections()
+            try:
+                self._execute(game_id)
+            finally:
+                close_old_connections()
+                self._queue.task_done()
+
+    def join(self):
+        self._queue.join()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    workers = getattr(settings, 'TTT_BOT_WORKERS', 0)
+    max_queue_size = getattr(settings, 'TTT_BOT_QUEUE_SIZE', 100)
+    with _executor_lock:
+        if (
+                _executor is None or
+                _executor.workers != workers or
+                _executor.max_queue_size != max_queue_size
+        ):
+            _executor = BotExecutor(core.play_computer_turn, workers, max_queue_size)
+        return _executor
+
+
+def submit(game_id):
+    try:
+        return get_executor().submit(game_id)
+    except QueueFull:
+        # gra nie utknie - kolejny GET widoku gry zleci ruch ponownie
+        logger.warning('Bot queue is full, computer move in game %s postponed', game_id)
+        return False
+
+
+def status(game_id):
+    return get_executor().status(game_id)
+
+
+def _submit_in_thread(game_id):
+    close_old_connections()
+    try:
+        return submit(game_id)
+    finally:
+        close_old_connections()
+
+
+async def submit_async(game_id):
+    """submit dla widokow async.
+
+    Przy TTT_BOT_WORKERS == 0 ruch komputera (przeszukiwanie) jest liczony
+    w osobnym watku, zeby nie blokowac petli zdarzen ani watku ORM requestu.
+    """
+    if get_executor().workers:
+        # tylko wstawia zadanie do kolejki
+        return submit(game_id)
+    return await sync_to_async(_submit_in_thread, thread_sensitive=False)(game_id)
@@ -6,8 +6,10 @@ from django.db.models import Q
 from django.db import transaction
 from django.conf import settings
 
-from ttt.models import GameSession, Game, Move, User
-from ttt import ttt
+from ttt.models import GameSession, Game, Move, User, ArchivedGame
+from ttt import ttt, db, search, mcts, events, metrics
+from ttt.state import UltimateState, IllegalMove
+from ttt.game_cache import game_cache
 
 
 def _rand_external_id():
@@ -27,6 +29,18 @@ def make_players_pair(player_1, player_2):
 
 COMPUTER_USERNAME = 'computer'
 
+# Zapis ruchow (TTT_MOVE_STORAGE): 'rows' - wiersze Move, 'dual' - nowe gry
+# zapisuja wiersze Move i Game.move_log, 'log' - nowe gry tylko Game.move_log.
+# Odczyt zawsze z Game.move_log, jesli gra go ma, wiec gry z obu trybow
+# mozna czytac w trakcie przejscia.
+MOVE_STORAGE_ROWS = 'rows'
+MOVE_STORAGE_DUAL = 'dual'
+MOVE_STORAGE_LOG = 'log'
+
+
+def _move_storage():
+    return getattr(settings, 'TTT_MOVE_STORAGE', MOVE_STORAGE_ROWS)
+
 
 @transaction.atomic
 def invite_computer_player(host_user):
@@ -46,39 +60,53 @@ def invite_computer_player(host_user):
 
 def invite(host_user, guest_user):
     player_1, player_2 = make_players_pair(host_user, guest_user)
-    return GameSession.objects.create(
+    game_session = GameSession.objects.create(
         external_id=_rand_external_id(),
         player_1=player_1,
         player_2=player_2
     )
+    db.stick_to_primary(host_user.id)
+    return game_session
 
 
 class GameError(Exception):
     pass
 
 
+@db.retry_on_lock
 def create_game(game_session):
     game = Game.objects.filter(session=game_session).order_by('-created_at').first()
+    if game is not None and not game.result:
+        raise GameError()
+    if game is None:
+        # gry w archiwum sa zakonczone albo porzucone
+        game = ArchivedGame.objects.filter(session=game_session).order_by('-created_at').first()
     if game is not None:
-        if not game.result:
-            raise GameError()
-        else:
-            cross_player = game.circle_player
-            circle_player = game.cross_player
+        cross_player = game.circle_player
+        circle_player = game.cross_player
     else:
         cross_player = game_session.player_1
         circle_player = game_session.player_2
-    return Game.objects.create(
+    now = timezone.now()
+    game = Game.objects.create(
         session=game_session,
         cross_player=cross_player,
         circle_player=circle_player,
-        created_at=timezone.now(),
-        result=None
+        created_at=now,
+        updated_at=now,
+        result=None,
+        move_log=None if _move_storage() == MOVE_STORAGE_ROWS else b''
     )
+    # obaj gracze zaraz otworza nowa gre (get_game moze czytac z repliki)
+    db.stick_to_primary(cross_player.id)
+    db.stick_to_primary(circle_player.id)
+    return game
 
 
+@db.replica_reads
 def get_running_user_games(user):
-    return (
+    # lista, nie QuerySet - zapytanie musi sie wykonac w replica_reads
+    return list(
         Game.objects
             .select_related()
             .filter(Q(cross_player=user) | Q(circle_player=user))
@@ -87,8 +115,59 @@ def get_running_user_games(user):
     )
 
 
+def _load_game(external_session_id, game_id):
+    return (
+        Game.objects
+            .select_related('session', 'cross_player', 'circle_player')
+            .filter(session__external_id=external_session_id, id=game_id)
+            .first()
+    )
+
+
+def _load_archived_game(external_session_id, game_id):
+    archived = (
+        ArchivedGame.objects
+            .select_related('session', 'cross_player', 'circle_player')
+            .filter(session__external_id=external_session_id, id=game_id)
+            .first()
+    )
+    if archived is None:
+        return None
+    # Game tylko do odczytu (nie zapisujemy - w tabeli Game juz go nie ma)
+    game = Game(
+        id=archived.id,
+        session=archived.session,
+        cross_player=archived.cross_player,
+        circle_player=archived.circle_player,
+        created_at=archived.created_at,
+        result=archived.result,
+        version=archived.version,
+        move_log=bytes(archived.move_log)
+    )
+    game.archived = True
+    moves = get_game_moves(game)
+    game.board = ttt.to_snapshot(ttt.to_boards(moves))
+    game.next_board_nr = ttt.next_board_nr(moves)
+    for m in moves:
+        if m.board_nr == ttt.MAIN_BOARD_NR:
+            continue
+        if m.value == ttt.CROSS_SYMBOL:
+            game.last_cross_cell = ttt.snapshot_index(m.board_nr, m.position)
+        else:
+            game.last_circle_cell = ttt.snapshot_index(m.board_nr, m.position)
+    return game
+
+
+@db.replica_reads
 def get_game(external_session_id, game_id):
-    return Game.objects.filter(session__external_id=external_session_id, id=game_id).first()
+    """Gra z cache, z tabeli Game albo z archiwum (ArchivedGame)."""
+    game = game_cache.get(game_id)
+    if game is not None and game.session.external_id == external_session_id:
+        return game
+    game = _load_game(external_session_id, game_id) or _load_archived_game(external_session_id, game_id)
+    if game is not None:
+        game_cache.set(game)
+    return game
 
 
 def get_game_or_create(external_session_id, user):
@@ -107,19 +186,39 @@ def get_game_or_create(external_session_id, user):
     return game
 
 
+def _log_moves(game):
+    # id to numer ruchu w grze, kursor dziala tak samo jak dla wierszy Move
+    return [
+        Move(id=i, game=game, board_nr=board_nr, position=position, value=value)
+        for i, (board_nr, position, value) in enumerate(ttt.decode_move_log(bytes(game.move_log)), 1)
+    ]
+
+
+@db.replica_reads
 def get_game_moves(game):
+    if game.move_log is not None:
+        return _log_moves(game)
     return list(Move.objects.filter(game=game).order_by('id'))
 
 
+@db.replica_reads
+def get_game_moves_since(game, move_id):
+    if game.move_log is not None:
+        return _log_moves(game)[max(move_id, 0):]
+    return list(Move.objects.filter(game=game, id__gt=move_id).order_by('id'))
+
+
+def is_player(game, user):
+    return user.id in (game.cross_player_id, game.circle_player_id)
+
+
 def is_first_player(game, user):
     return user.id == game.cross_player_id
 
 
-def is_new_game(game):
-    return (
-        game.result is None and
-        not Move.objects.filter(game=game).exists()
-    )
+def is_running(game):
+    """Gra bez wyniku, ktora nie jest w archiwum (porzucone gry sa tylko do odczytu)."""
+    return game.result is None and not game.archived
 
 
 def get_computer_player(game):
@@ -131,90 +230,147 @@ def get_computer_player(game):
         return None
 
 
-def update_game_by_computer(game, computer_player):
-    symbol = get_player_symbol(game, computer_player)
-    moves = get_game_moves(game)
+BOT_ENGINE_MINIMAX = 'minimax'
+BOT_ENGINE_ALPHABETA = 'alphabeta'
+BOT_ENGINE_MCTS = 'mcts'
 
-    board_nr, pos = ttt.bot_turn(
-        boards=ttt.to_boards(moves),
-        comp_symbol=symbol,
-        next_board_nr=ttt.next_board_nr(moves)
-    )
-
-    update_game(game.id, computer_player, board_nr, pos)
-
-
-class MoveError(Exception):
-    pass
-
-
-def _get_board(game_id, board_nr):
-    return ttt.make_board(
-        iterable=(
-            Move.objects
-            .filter(game_id=game_id, board_nr=board_nr)
-            .values_list('position', 'value')
-        ),
-        mini=board_nr != ttt.MAIN_BOARD_NR
-    )
 
+def _bot_turn(boards, next_board_nr, symbol):
+    engine = getattr(settings, 'TTT_BOT_ENGINE', BOT_ENGINE_MINIMAX)
+    if engine == BOT_ENGINE_ALPHABETA:
+        return search.best_move(
+            boards=boards,
+            comp_symbol=symbol,
+            next_board_nr=next_board_nr,
+            time_limit=getattr(settings, 'TTT_BOT_TIME_LIMIT', search.DEFAULT_TIME_LIMIT)
+        )
+    elif engine == BOT_ENGINE_MCTS:
+        playouts = getattr(settings, 'TTT_MCTS_PLAYOUTS', None)
+        return mcts.best_move(
+            boards=boards,
+            comp_symbol=symbol,
+            next_board_nr=next_board_nr,
+            playouts=playouts,
+            time_limit=(
+                getattr(settings, 'TTT_BOT_TIME_LIMIT', search.DEFAULT_TIME_LIMIT)
+                if playouts is None else None
+            ),
+            workers=getattr(settings, 'TTT_MCTS_WORKERS', 1)
+        )
+    elif engine == BOT_ENGINE_MINIMAX:
+        return ttt.bot_turn(
+            boards=boards,
+            comp_symbol=symbol,
+            next_board_nr=next_board_nr
+        )
+    else:
+        raise ValueError('Unknown bot engine: {}'.format(engine))
 
-def _update_board(game, board_nr, position, value):
-    if not ttt.is_pos(position):
-        raise MoveError('Invalid position: {}'.format(position))
 
-    board = _get_board(game.id, board_nr)
+def update_game_by_computer(game, computer_player, state=None):
+    if state is None:
+        game.refresh_from_db(fields=SNAPSHOT_FIELDS)
+        state = GameState(game)
+    symbol = get_player_symbol(game, computer_player)
 
-    if board[position]:
-        raise MoveError('The position {} is occupied'.format(position))
+    engine = getattr(settings, 'TTT_BOT_ENGINE', BOT_ENGINE_MINIMAX)
+    with metrics.bot_search_duration.time(engine=engine):
+        board_nr, pos = _bot_turn(state.boards, game.next_board_nr, symbol)
 
-    Move.objects.create(
-        game=game, board_nr=board_nr,
-        position=position, value=value
-    )
-    board[position] = value
+    update_game(game.id, computer_player, board_nr, pos)
 
-    return ttt.get_board_result(board)
 
+def play_computer_turn(game_id):
+    """Ruch komputera, jesli gra trwa i to jego kolej. Wolane przez bot_worker."""
+    game = Game.objects.select_related('cross_player', 'circle_player').filter(id=game_id).first()
+    if game is None:
+        # gra przeniesiona do archiwum
+        return False
+    computer_player = get_computer_player(game)
+    if computer_player is None or game.result is not None:
+        return False
+    state = GameState(game)
+    if not state.is_turn(get_player_symbol(game, computer_player)):
+        return False
+    update_game_by_computer(game, computer_player, state)
+    return True
 
-def _update_mini_board(game, board_nr, position, symbol):
-    if not ttt.is_mini_board_nr(board_nr):
-        raise MoveError('Invalid mini-board nr: {}'.format(board_nr))
 
-    if not ttt.is_symbol(symbol):
-        raise MoveError('Invalid symbol, got: {}'.format(symbol))
+class MoveError(Exception):
+    pass
 
-    prev_move = _get_last_player_move(game)
-    main_board = _get_board(game.id, ttt.MAIN_BOARD_NR)
 
-    if prev_move is None and symbol == ttt.CIRCLE_SYMBOL:
-        raise MoveError('Required cross symbol')
+class GameState:
+    """Stan gry odczytany z zapisu plansz w wierszu Game.
+
+    Zasady ruchow sprawdza ttt.state.UltimateState. play() aktualizuje zapis
+    plansz w self.game i dopisuje nowe (niezapisane) ruchy do new_moves.
+    """
+
+    def __init__(self, game):
+        self.game = game
+        self.new_moves = []
+        self.rules = UltimateState.from_snapshot(game.board, game.next_board_nr)
+
+    @property
+    def boards(self):
+        return ttt.snapshot_to_boards(self.game.board)
+
+    def is_turn(self, symbol):
+        return self.rules.symbol == symbol
+
+    def legal_moves(self, symbol):
+        """Dozwolone ruchy gracza symbol (pusta lista, gdy nie jego kolej)."""
+        if not is_running(self.game) or not self.is_turn(symbol):
+            return []
+        return self.rules.legal_moves()
+
+    def _add_move(self, board_nr, position, value):
+        self.new_moves.append(Move(game=self.game, board_nr=board_nr, position=position, value=value))
+        game = self.game
+        index = ttt.snapshot_index(board_nr, position)
+        game.board = game.board[:index] + ttt.to_snapshot_value(value) + game.board[index + 1:]
+        if board_nr != ttt.MAIN_BOARD_NR:
+            game.next_board_nr = position
+            if value == ttt.CROSS_SYMBOL:
+                game.last_cross_cell = index
+            else:
+                game.last_circle_cell = index
+
+    def play(self, board_nr, position, symbol):
+        """Wykonuje ruch gracza i zwraca wynik gry (albo None)."""
+        try:
+            result = self.rules.apply(board_nr, position, symbol)
+        except IllegalMove as exc:
+            raise MoveError(str(exc))
+        self._add_move(board_nr, position, symbol)
+        if result:
+            self._add_move(ttt.MAIN_BOARD_NR, board_nr, result)
+            game_result = self.rules.result()
+            if game_result:
+                self.game.result = game_result
+                return game_result
+        return None
 
-    if prev_move and prev_move.value == symbol:
-        raise MoveError('Required the next symbol, got: {}'.format(symbol))
 
-    expected_board_nr = (prev_move.position if prev_move and main_board[prev_move.position] is None else None)
-    print(expected_board_nr)
-    if expected_board_nr and expected_board_nr != board_nr:
-        raise MoveError('Wrong mini-board, expected: {}, got: {}'.format(
-            prev_move.position, board_nr))
+SNAPSHOT_FIELDS = ['board', 'last_cross_cell', 'last_circle_cell', 'next_board_nr']
 
-    print(main_board[board_nr])
-    if main_board[board_nr]:
-        raise MoveError('Wrong mini-board, board nr: {} is filled'.format(board_nr))
 
-    return _update_board(game, board_nr, position, symbol)
+class UpdateConflict(GameError):
+    pass
 
 
-def _update_main_board(game, position, result):
-    if not ttt.is_result(result):
-        raise Exception('Invalid result, got: {}'.format(result))
-    return _update_board(game, ttt.MAIN_BOARD_NR, position, result)
+# ile razy update_game ponawia ruch, gdy wersje gry zmienil inny zapis
+MAX_UPDATE_ATTEMPTS = 5
 
 
 def _get_game_to_update_by_user(game_id, user):
-    # select for update zaklada blokade
-    game = Game.objects.select_for_update().get(id=game_id)
+    # bez blokady - zapis sprawdza wersje gry (_commit_moves)
+    game = Game.objects.filter(id=game_id).first()
+    if game is None:
+        if ArchivedGame.objects.filter(id=game_id).exists():
+            raise GameError('The game {} is archived'.format(game_id))
+        raise Game.DoesNotExist('Game matching query does not exist.')
     if game.cross_player_id != user.id and game.circle_player_id != user.id:
         raise GameError('Unexpected player {} in the game {}: '.format(
             user.id, game.id))
@@ -232,32 +388,44 @@ def get_player_symbol(game, user):
         raise ValueError("unexpected user")
 
 
-def is_player_move(moves, player_symbol):
-    n = sum([1 for m in moves if m['board_nr'] != ttt.MAIN_BOARD_NR])
-    return (
-        (player_symbol == ttt.CROSS_SYMBOL and n % 2 == 0) or
-        (player_symbol == ttt.CIRCLE_SYMBOL and n % 2 == 1)
-    )
-
-
-def _get_last_player_move(game):
-    return (
-        Move.objects
-            .exclude(board_nr=ttt.MAIN_BOARD_NR)
-            .filter(game_id=game.id, board_nr__gt=ttt.MAIN_BOARD_NR)
-            .order_by('-id')
-            .first()
-    )
-
-
-@transaction.atomic()
+def _commit_moves(game, new_moves):
+    """Zapisuje ruchy, jesli wersja gry w bazie jest ta sama, co przy odczycie.
+
+    UPDATE z warunkiem na wersje (compare-and-swap) jest pierwszym zapisem
+    transakcji, wiec blokada bazy jest trzymana tylko przez dwa zapytania.
+    Zwraca False, gdy gre zmienil w miedzyczasie inny zapis.
+    """
+    fields = {field: getattr(game, field) for field in SNAPSHOT_FIELDS + ['result']}
+    game.updated_at = fields['updated_at'] = timezone.now()
+    if game.move_log is not None:
+        game.move_log = bytes(game.move_log) + ttt.encode_move_log(new_moves)
+        fields['move_log'] = game.move_log
+    with transaction.atomic():
+        updated = Game.objects.filter(id=game.id, version=game.version).update(version=game.version + 1, **fields)
+        if not updated:
+            return False
+        if game.move_log is None or _move_storage() != MOVE_STORAGE_LOG:
+            Move.objects.bulk_create(new_moves)
+        game.version += 1
+        transaction.on_commit(lambda: _on_game_updated(game, new_moves))
+    return True
+
+
+@db.retry_on_lock
 def update_game(game_id, user, board_nr, position):
-    game = _get_game_to_update_by_user(game_id, user)
-    symbol = get_player_symbol(game, user)
-    result = _update_mini_board(game, board_nr, position, symbol)
-    if result:
-        game_result = _update_main_board(game, board_nr, result)
-        if game_result:
-            game.result = result
-            game.save()
-
+    for _ in range(MAX_UPDATE_ATTEMPTS):
+        game = _get_game_to_update_by_user(game_id, user)
+        symbol = get_player_symbol(game, user)
+        state = GameState(game)
+        state.play(board_nr, position, symbol)
+        if _commit_moves(game, state.new_moves):
+            # obaj gracze zaraz czytaja gre - po ruchu komputera czeka na niego czlowiek
+            db.stick_to_primary(game.cross_player_id)
+            db.stick_to_primary(game.circle_player_id)
+            return
+    raise UpdateConflict('The game {} is updated concurrently'.format(game_id))
+
+
+def _on_game_updated(game, new_moves):
+    game_cache.bump(game.id, game.version)
+    events.publish_moves(game, new_moves)
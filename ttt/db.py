@@ -0,0 +1,135 @@
+"""Polaczenia z baza: pragmy SQLite, ponawianie przy blokadzie i replika do odczytu.
+
+Pragmy z settings.TTT_SQLITE_PRAGMAS sa ustawiane na kazdym nowym polaczeniu
+(sygnal connection_created, podpiety w TttConfig.ready). WAL pozwala czytac
+w trakcie zapisu, a busy_timeout kaze SQLite czekac na blokade zamiast od razu
+zglaszac "database is locked". Jesli blokada trwa dluzej, retry_on_lock
+ponawia cala operacje po losowym opoznieniu (jitter), zeby ponowienia wielu
+watkow nie trafialy w baze w tym samym momencie.
+
+ReplicaRouter kieruje na replike (settings.TTT_REPLICA_DATABASE) tylko odczyty
+z funkcji oznaczonych replica_reads. Gracz, ktory wlasnie zapisal ruch, przez
+TTT_REPLICA_STICKY_SECONDS czyta z bazy glownej (stick_to_primary,
+ReplicaMiddleware), wiec widzi swoje zmiany mimo opoznienia repliki.
+"""
+import contextvars
+import functools
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, OperationalError, transaction
+
+from ttt import metrics
+
+LOCK_RETRY_ATTEMPTS = 5
+LOCK_RETRY_BASE_DELAY = 0.01  # s, podwajane przy kolejnych probach
+
+STICKY_KEY_PREFIX = 'ttt:db:primary'
+
+# odczyt w funkcji oznaczonej replica_reads
+_replica_reads = contextvars.ContextVar('ttt_replica_reads', default=False)
+# odczyty tylko z bazy glownej (gracz po zapisie)
+_primary_only = contextvars.ContextVar('ttt_primary_only', default=False)
+
+
+def is_lock_error(exc):
+    # "database is locked" (inne polaczenie pisze), "database table is locked" (shared cache)
+    return isinstance(exc, OperationalError) and 'locked' in str(exc)
+
+
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'TTT_SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+
+
+def retry_on_lock(func):
+    """Ponawia func, gdy baza jest zablokowana.
+
+    Tylko poza transakcja - w zewnetrznym atomic() blad blokady psuje cala
+    transakcje, wiec ponowienie nalezy do tego, kto ja otworzyl.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        attempts = getattr(settings, 'TTT_DB_LOCK_RETRIES', LOCK_RETRY_ATTEMPTS)
+        attempt = 1
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if (
+                        not is_lock_error(exc) or
+                        attempt >= attempts or
+                        transaction.get_connection().in_atomic_block
+                ):
+                    raise
+            metrics.db_lock_retries.inc(operation=func.__name__)
+            time.sleep(random.uniform(0, LOCK_RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+            attempt += 1
+    return wrapper
+
+
+def replica_alias():
+    """Alias repliki albo None, gdy replika nie jest wlaczona."""
+    alias = getattr(settings, 'TTT_REPLICA_DATABASE', None)
+    if alias is None or alias not in settings.DATABASES:
+        return None
+    return alias
+
+
+class ReplicaRouter:
+    """Zapisy i zwykle odczyty - baza glowna, odczyty z replica_reads - replika."""
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and not _primary_only.get():
+            return replica_alias() or DEFAULT_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replika ma te same dane co baza glowna
+        return True
+
+
+def replica_reads(func):
+    """Odczyty w func (i w tym, co wola) moga isc do repliki."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = _replica_reads.set(True)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _replica_reads.reset(token)
+    return wrapper
+
+
+@contextmanager
+def primary_only():
+    token = _primary_only.set(True)
+    try:
+        yield
+    finally:
+        _primary_only.reset(token)
+
+
+def _sticky_key(user_id):
+    return '{}:{}'.format(STICKY_KEY_PREFIX, user_id)
+
+
+def stick_to_primary(user_id):
+    """Po zapisie gracz czyta z bazy glownej, dopoki replika nie nadrobi opoznienia."""
+    if replica_alias() is None:
+        return
+    cache.set(_sticky_key(user_id), True, settings.TTT_REPLICA_STICKY_SECONDS)
+
+
+def is_sticky(user_id):
+    return replica_alias() is not None and cache.get(_sticky_key(user_id), False)
@@ -0,0 +1,105 @@
+"""Publikowanie zdarzen gry (nowe ruchy) do subskrybentow SSE.
+
+Broker jest wybierany ustawieniem TTT_EVENT_BROKER. InProcessBroker dziala
+w obrebie jednego procesu (i sluzy jako zastepnik w testach); broker
+wspoldzielony, np. na Redis pub/sub, musi miec te same metody:
+subscribe(channel), unsubscribe(subscription) i publish(channel, event).
+"""
+import asyncio
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from ttt.serializers import serialized_moves
+
+DEFAULT_BROKER = 'ttt.events.InProcessBroker'
+
+
+class Subscription:
+
+    def __init__(self, channel, max_queue_size):
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_queue_size)
+        self.dropped = 0
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # klient i tak pobierze pelny stan po ponownym polaczeniu
+            self.dropped += 1
+
+    def deliver(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class InProcessBroker:
+    """Broker w pamieci procesu. subscribe() wolamy z petli asyncio,
+    publish() z dowolnego watku."""
+
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = Subscription(channel, self.max_queue_size)
+        with self._lock:
+            self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.channel)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.channel]
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.deliver(event)
+            except RuntimeError:
+                # petla subskrybenta juz nie dziala
+                self.unsubscribe(subscription)
+
+    def subscribers_count(self, channel):
+        with self._lock:
+            return len(self._subscriptions.get(channel, ()))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'TTT_EVENT_BROKER', DEFAULT_BROKER))()
+        return _broker
+
+
+def game_channel(game_id):
+    return 'game:{}'.format(game_id)
+
+
+def move_event(game, moves):
+    return {
+        'type': 'move',
+        'version': game.version,
+        'moves': serialized_moves(moves),
+        'result': game.result,
+    }
+
+
+def publish_moves(game, moves):
+    get_broker().publish(game_channel(game.id), move_event(game, moves))
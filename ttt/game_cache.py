@@ -0,0 +1,79 @@
+"""Cache wczytanych gier (Game z sesja i graczami) na Django cache framework.
+
+Klucz stanu zawiera wersje gry (Game.version), ktora core.update_game
+zwieksza przy kazdym commicie. Aktualna wersja jest trzymana pod osobnym
+kluczem, wiec stan zapisany przez spozniony odczyt nigdy nie zostanie
+podany jako aktualny. Rozmiar i wyrzucanie (LRU) zalezy od backendu,
+np. LocMemCache z MAX_ENTRIES albo Redis z maxmemory-policy allkeys-lru.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+KEY_PREFIX = 'ttt:game'
+
+
+class GameCache:
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _version_key(self, game_id):
+        return '{}:{}:version'.format(KEY_PREFIX, game_id)
+
+    def _state_key(self, game_id, version):
+        return '{}:{}:{}'.format(KEY_PREFIX, game_id, version)
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, game_id):
+        version = self.cache.get(self._version_key(game_id))
+        game = None
+        if version is not None:
+            game = self.cache.get(self._state_key(game_id, version))
+        self._count(game is not None)
+        return game
+
+    def set(self, game):
+        # add - nie nadpisujemy nowszej wersji ustawionej przez update_game
+        self.cache.add(self._version_key(game.id), game.version)
+        self.cache.set(self._state_key(game.id, game.version), game)
+
+    def bump(self, game_id, version):
+        self.cache.set(self._version_key(game_id), version)
+
+    def invalidate(self, game_id):
+        # dla zmian zapisanych bez zwiekszenia wersji gry
+        self.cache.delete(self._version_key(game_id))
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / total if total else 0.0,
+        }
+
+    def clear(self):
+        self.cache.clear()
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+game_cache = GameCache(getattr(settings, 'TTT_GAME_CACHE', 'default'))
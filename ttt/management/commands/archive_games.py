@@ -0,0 +1,75 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ttt import ttt
+from ttt.game_cache import game_cache
+from ttt.models import ArchivedGame, Game, Move
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves finished and abandoned games from Game/Move to ArchivedGame. '
+        'Archived games stay readable through core.get_game.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--finished-days', type=int, default=1,
+            help='archive games finished more than N days ago'
+        )
+        parser.add_argument(
+            '--abandoned-days', type=int, default=30,
+            help='archive unfinished games without a move for more than N days'
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, finished_days, abandoned_days, batch_size, **options):
+        now = timezone.now()
+        games = Game.objects.filter(
+            # updated_at - czas ostatniego ruchu, w zakonczonej grze: czas zakonczenia
+            Q(result__isnull=False, updated_at__lt=now - timedelta(days=finished_days)) |
+            Q(result__isnull=True, updated_at__lt=now - timedelta(days=abandoned_days))
+        ).order_by('id')
+
+        archived = 0
+        while True:
+            with transaction.atomic():
+                batch = list(games.select_for_update()[:batch_size])
+                if not batch:
+                    break
+                self._archive(batch, now)
+            for game in batch:
+                game_cache.invalidate(game.id)
+            archived += len(batch)
+
+        self.stdout.write('Archived {} games'.format(archived))
+
+    def _archive(self, games, now):
+        ids = [game.id for game in games]
+        moves = {}
+        for move in Move.objects.filter(game_id__in=[g.id for g in games if g.move_log is None]).order_by('id'):
+            moves.setdefault(move.game_id, []).append(move)
+
+        ArchivedGame.objects.bulk_create([
+            ArchivedGame(
+                id=game.id,
+                session_id=game.session_id,
+                cross_player_id=game.cross_player_id,
+                circle_player_id=game.circle_player_id,
+                created_at=game.created_at,
+                archived_at=now,
+                result=game.result,
+                version=game.version,
+                move_log=(
+                    bytes(game.move_log) if game.move_log is not None
+                    else ttt.encode_move_log(moves.get(game.id, []))
+                )
+            )
+            for game in games
+        ])
+        Move.objects.filter(game_id__in=ids).delete()
+        Game.objects.filter(id__in=ids).delete()
@@ -0,0 +1,43 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ttt import parser, replay
+
+
+class Command(BaseCommand):
+    help = (
+        'Replays scenario files (parser format) with the in-memory rules engine '
+        'and cross-checks a random sample through core.update_game.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+')
+        parser.add_argument('--workers', type=int, default=None)
+        parser.add_argument('--sample', type=int, default=20, help='scenarios replayed through the ORM')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, paths, workers, sample, seed, **options):
+        scenarios = []
+        for path in paths:
+            with open(path) as f:
+                scenarios.extend(parser.iter_scenarios(f, ensure_valid=False))
+
+        start = time.perf_counter()
+        results = replay.replay_all(scenarios, workers=workers)
+        elapsed = time.perf_counter() - start
+
+        counts = {}
+        for result in results:
+            key = result.error or 'result {}'.format(result.result)
+            counts[key] = counts.get(key, 0) + 1
+        self.stdout.write('Replayed {} scenarios in {:.2f} s'.format(len(scenarios), elapsed))
+        for key, count in sorted(counts.items()):
+            self.stdout.write('  {}: {}'.format(key, count))
+
+        mismatches = replay.cross_check(scenarios, results, sample, seed=seed)
+        for index, memory_result, orm_result in mismatches:
+            self.stderr.write('Scenario {}: {} != {}'.format(index, memory_result, orm_result))
+        if mismatches:
+            raise CommandError('{} of {} sampled scenarios differ'.format(len(mismatches), min(sample, len(scenarios))))
+        self.stdout.write('Cross-checked {} scenarios through the ORM'.format(min(sample, len(scenarios))))
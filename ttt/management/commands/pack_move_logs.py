@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from ttt import ttt
+from ttt.game_cache import game_cache
+from ttt.models import Game, Move
+
+
+class Command(BaseCommand):
+    help = 'Packs Move rows of finished games into Game.move_log.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--delete-rows', action='store_true',
+            help='delete Move rows of finished games that have a move log'
+        )
+
+    def handle(self, *args, batch_size, delete_rows, **options):
+        # tylko zakonczone gry - id ruchow (kursor klienta) zmieniaja sie po spakowaniu
+        games = Game.objects.filter(result__isnull=False, move_log__isnull=True).order_by('id')
+        packed = 0
+        while True:
+            batch = list(games.values_list('id', flat=True)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                moves = {}
+                for move in Move.objects.filter(game_id__in=batch).order_by('id'):
+                    moves.setdefault(move.game_id, []).append(move)
+                for game_id in batch:
+                    game = Game(id=game_id, move_log=ttt.encode_move_log(moves.get(game_id, [])))
+                    game.save(update_fields=['move_log'])
+            for game_id in batch:
+                game_cache.invalidate(game_id)
+            packed += len(batch)
+
+        deleted = 0
+        if delete_rows:
+            deleted, _ = Move.objects.filter(
+                game__result__isnull=False, game__move_log__isnull=False
+            ).delete()
+
+        self.stdout.write('Packed {} games, deleted {} Move rows'.format(packed, deleted))
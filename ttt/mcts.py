@@ -0,0 +1,171 @@
+"""Bot oparty na Monte Carlo Tree Search (UCT).
+
+Kazdy proces buduje wlasne drzewo od tej samej pozycji (root parallelization),
+a na koniec sumujemy liczby odwiedzin ruchow z korzenia. Symulacje graja na
+search.Position - ruchy sa wykonywane i cofane w miejscu, bez kopiowania plansz.
+"""
+import math
+import multiprocessing
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from ttt import ttt
+from ttt.search import Position
+
+DEFAULT_PLAYOUTS = 2000
+EXPLORATION = 1.4
+
+# pule procesow wg liczby procesow; tworzone raz (start_executor przy starcie
+# aplikacji) i nie zamykane, bo moga z nich korzystac inne watki
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+class _Node:
+
+    __slots__ = ('move', 'parent', 'children', 'untried', 'visits', 'wins')
+
+    def __init__(self, move, parent, untried):
+        self.move = move
+        self.parent = parent
+        self.children = []
+        self.untried = untried
+        self.visits = 0
+        # wygrane z perspektywy gracza, ktory wykonal self.move
+        self.wins = 0.0
+
+    def select_child(self):
+        log_visits = math.log(self.visits)
+        return max(
+            self.children,
+            key=lambda c: c.wins / c.visits + EXPLORATION * math.sqrt(log_visits / c.visits)
+        )
+
+
+def _playout(position, rng):
+    """Gra losowo do konca, cofa ruchy i zwraca wynik gry."""
+    played = 0
+    result = position.result()
+    while result is None:
+        position.play(*rng.choice(position.legal_moves()))
+        played += 1
+        result = position.result()
+    for _ in range(played):
+        position.undo()
+    return result
+
+
+def _search(position, playouts, time_limit, rng):
+    root = _Node(None, None, position.legal_moves())
+    deadline = time.monotonic() + time_limit if time_limit is not None else None
+    symbols = (ttt.CROSS_SYMBOL, ttt.CIRCLE_SYMBOL)
+
+    iterations = 0
+    while True:
+        if playouts is not None and iterations >= playouts:
+            break
+        if deadline is not None and time.monotonic() > deadline:
+            break
+        iterations += 1
+
+        node = root
+        while not node.untried and node.children:
+            node = node.select_child()
+            position.play(*node.move)
+
+        if node.untried:
+            move = node.untried.pop(rng.randrange(len(node.untried)))
+            position.play(*move)
+            child = _Node(move, node, position.legal_moves() if position.result() is None else [])
+            node.children.append(child)
+            node = child
+
+        result = _playout(position, rng)
+
+        while node is not None:
+            node.visits += 1
+            if node.move is not None:
+                # node.move wykonal gracz, ktory nie ma teraz ruchu
+                mover = symbols[position.side ^ 1]
+                if result == mover:
+                    node.wins += 1
+                elif result == ttt.DRAW:
+                    node.wins += 0.5
+                position.undo()
+            node = node.parent
+
+    return {child.move: child.visits for child in root.children}
+
+
+def _winning_move(position, moves, symbol):
+    for move in moves:
+        position.play(*move)
+        result = position.result()
+        position.undo()
+        if result == symbol:
+            return move
+    return None
+
+
+def _worker(state, playouts, time_limit, seed):
+    position = Position(*state)
+    return _search(position, playouts, time_limit, random.Random(seed))
+
+
+def mp_context():
+    """Kontekst multiprocessing dla pul procesow (mcts, replay).
+
+    fork w wielowatkowym serwerze kopiuje blokady trzymane przez inne watki
+    i otwarte polaczenia z baza.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context('spawn')
+
+
+def start_executor(workers):
+    """Pula procesow dla workers (wywolywane z TttConfig.ready i przez best_move)."""
+    with _executors_lock:
+        executor = _executors.get(workers)
+        if executor is None:
+            # procesy startuja dopiero przy pierwszym zadaniu
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context())
+            _executors[workers] = executor
+        return executor
+
+
+def best_move(boards, comp_symbol, next_board_nr,
+              playouts=None, time_limit=None, workers=1, seed=None):
+    """Odpowiednik ttt.bot_turn. Budzet to liczba symulacji na proces
+    i/lub limit czasu w sekundach; bez budzetu uzywane jest DEFAULT_PLAYOUTS.
+    """
+    position = Position.from_boards(boards, comp_symbol, next_board_nr)
+    moves = position.legal_moves()
+    if not moves:
+        raise ValueError('No legal moves')
+    if len(moves) == 1:
+        return moves[0]
+    winning_move = _winning_move(position, moves, comp_symbol)
+    if winning_move is not None:
+        return winning_move
+
+    if playouts is None and time_limit is None:
+        playouts = DEFAULT_PLAYOUTS
+    rng = random.Random(seed)
+    seeds = [rng.getrandbits(32) for _ in range(workers)]
+    state = (position.masks, position.filled, position.forced, position.side)
+
+    if workers == 1:
+        results = [_worker(state, playouts, time_limit, seeds[0])]
+    else:
+        executor = start_executor(workers)
+        futures = [executor.submit(_worker, state, playouts, time_limit, s) for s in seeds]
+        results = [f.result() for f in futures]
+
+    visits = {}
+    for result in results:
+        for move, n in result.items():
+            visits[move] = visits.get(move, 0) + n
+    return max(sorted(visits), key=lambda move: visits[move])
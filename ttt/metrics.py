@@ -0,0 +1,167 @@
+"""Lekki rejestr metryk (histogramy i liczniki) w formacie tekstowym Prometheusa.
+
+Metryki sa trzymane w pamieci procesu; przy kilku procesach kazdy wystawia
+wlasne /metrics i Prometheus sumuje je po stronie serwera.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in pairs
+    ) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(tuple(labels[name] for name in self.labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield self.name + _format_labels(self.labels, key), value
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # klucz etykiet -> [liczniki kubelkow, suma, liczba obserwacji]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            entry = self._values.get(tuple(labels[name] for name in self.labels))
+            return entry[2] if entry else 0
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items())
+        for key, (bucket_counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                yield (
+                    self.name + '_bucket' + _format_labels(self.labels, key, [('le', _format_value(bound))]),
+                    cumulative
+                )
+            yield self.name + '_sum' + _format_labels(self.labels, key), total
+            yield self.name + '_count' + _format_labels(self.labels, key), count
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.documentation))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+            for sample, value in metric.samples():
+                lines.append('{} {}'.format(sample, _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        for metric in self._metrics:
+            metric.reset()
+
+
+registry = Registry()
+
+request_duration = registry.histogram(
+    'ttt_request_duration_seconds', 'Request latency by URL name.',
+    labels=('view', 'method', 'status')
+)
+request_db_queries = registry.histogram(
+    'ttt_request_db_queries', 'SQL queries per request by URL name.',
+    labels=('view',), buckets=QUERY_COUNT_BUCKETS
+)
+request_db_duration = registry.histogram(
+    'ttt_request_db_duration_seconds', 'Time spent in SQL per request by URL name.',
+    labels=('view',)
+)
+bot_search_duration = registry.histogram(
+    'ttt_bot_search_seconds', 'Computer move search time by engine.',
+    labels=('engine',)
+)
+db_lock_retries = registry.counter(
+    'ttt_db_lock_retries_total', 'Operations retried after a "database is locked" error.',
+    labels=('operation',)
+)
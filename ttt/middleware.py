@@ -0,0 +1,112 @@
+import asyncio
+import contextvars
+import time
+
+from asgiref.sync import sync_to_async
+
+from ttt import db, metrics
+
+
+class _QueryTimer:
+    """Liczba i czas zapytan SQL jednego requestu."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+
+# timer biezacego requestu; sync_to_async przenosi go do watku, w ktorym
+# widok async wykonuje zapytania (w Django 3.2 jeden watek dla wszystkich requestow)
+_query_timer = contextvars.ContextVar('ttt_query_timer', default=None)
+
+
+def _timed_execute(execute, sql, params, many, context):
+    timer = _query_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.duration += time.perf_counter() - start
+        timer.count += 1
+
+
+def install_query_timer(sender, connection, **kwargs):
+    """Podpiete pod connection_created (TttConfig.ready): wrapper zostaje na polaczeniu na stale."""
+    if _timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_timed_execute)
+
+
+class _AsyncCapable:
+    """Middleware dzialajace pod WSGI i natywnie pod ASGI (widoki async nie
+    sa wtedy przenoszone do watku tylko z powodu middleware)."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # po tym atrybucie Django (i asyncio) rozpoznaje middleware async
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return self.call(request)
+
+
+class MetricsMiddleware(_AsyncCapable):
+    """Zapisuje w ttt.metrics czas requestu oraz liczbe i czas zapytan SQL
+    per nazwa URL (game_details, current_game, index, ...)."""
+
+    def call(self, request):
+        timer = _QueryTimer()
+        token = _query_timer.set(timer)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_timer.reset(token)
+        self._observe(request, response, time.perf_counter() - start, timer)
+        return response
+
+    async def __acall__(self, request):
+        timer = _QueryTimer()
+        token = _query_timer.set(timer)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_timer.reset(token)
+        self._observe(request, response, time.perf_counter() - start, timer)
+        return response
+
+    def _observe(self, request, response, duration, timer):
+        match = getattr(request, 'resolver_match', None)
+        view = match.url_name if match and match.url_name else 'unknown'
+        metrics.request_duration.observe(duration, view=view, method=request.method, status=response.status_code)
+        metrics.request_db_queries.observe(timer.count, view=view)
+        metrics.request_db_duration.observe(timer.duration, view=view)
+
+
+def _is_sticky(request):
+    return request.user.is_authenticated and db.is_sticky(request.user.id)
+
+
+class ReplicaMiddleware(_AsyncCapable):
+    """Gracz, ktory niedawno zapisal ruch (db.stick_to_primary), czyta tylko
+    z bazy glownej. Musi byc po AuthenticationMiddleware."""
+
+    def call(self, request):
+        if db.replica_alias() is not None and _is_sticky(request):
+            with db.primary_only():
+                return self.get_response(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        # request.user czyta sesje i uzytkownika z bazy
+        if db.replica_alias() is not None and await sync_to_async(_is_sticky)(request):
+            with db.primary_only():
+                return await self.get_response(request)
+        return await self.get_response(request)
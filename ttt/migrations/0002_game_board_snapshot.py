@@ -0,0 +1,64 @@
+# Generated by Django 3.2.9 on 2026-10-18 19:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+import ttt.ttt
+
+
+def backfill_snapshots(apps, schema_editor):
+    Game = apps.get_model('ttt', 'Game')
+    Move = apps.get_model('ttt', 'Move')
+    for game in Game.objects.iterator():
+        moves = list(Move.objects.filter(game=game).order_by('id'))
+        game.board = ttt.ttt.to_snapshot(ttt.ttt.to_boards(moves))
+        game.next_board_nr = ttt.ttt.next_board_nr(moves)
+        for m in moves:
+            if m.board_nr == ttt.ttt.MAIN_BOARD_NR:
+                continue
+            cell = ttt.ttt.snapshot_index(m.board_nr, m.position)
+            if m.value == ttt.ttt.CROSS_SYMBOL:
+                game.last_cross_cell = cell
+            else:
+                game.last_circle_cell = cell
+        game.save(update_fields=['board', 'next_board_nr', 'last_cross_cell', 'last_circle_cell'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ttt', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='board',
+            field=models.CharField(default=ttt.ttt.empty_snapshot, max_length=90),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='last_circle_cell',
+            field=models.SmallIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='last_cross_cell',
+            field=models.SmallIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='next_board_nr',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='session',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ttt.gamesession'),
+        ),
+        migrations.AlterField(
+            model_name='move',
+            name='game',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='ttt.game'),
+        ),
+        migrations.RunPython(backfill_snapshots, migrations.RunPython.noop),
+    ]
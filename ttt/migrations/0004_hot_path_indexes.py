@@ -0,0 +1,25 @@
+# Generated by Django 3.2.9 on 2026-10-18 19:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ttt', '0003_game_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['session', 'created_at'], name='game_session_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(condition=models.Q(('result__isnull', True)), fields=['cross_player', 'created_at'], name='game_running_cross_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(condition=models.Q(('result__isnull', True)), fields=['circle_player', 'created_at'], name='game_running_circle_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.9 on 2026-10-18 19:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ttt', '0004_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='move_log',
+            field=models.BinaryField(null=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.9 on 2026-10-18 19:47
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import ttt.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ttt', '0005_game_move_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedGame',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField()),
+                ('result', models.CharField(max_length=4, null=True, validators=[ttt.models.validate_result])),
+                ('version', models.PositiveIntegerField()),
+                ('move_log', models.BinaryField()),
+                ('circle_player', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_circle_player', to=settings.AUTH_USER_MODEL)),
+                ('cross_player', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_cross_player', to=settings.AUTH_USER_MODEL)),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_games', to='ttt.gamesession')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedgame',
+            index=models.Index(fields=['session', 'created_at'], name='archived_session_created_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.9 on 2026-10-18 20:41
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_updated_at(apps, schema_editor):
+    # czas ruchow nie byl zapisywany; trwajace gry dostaja pelny okres do archiwizacji od migracji
+    Game = apps.get_model('ttt', 'Game')
+    Game.objects.filter(updated_at__isnull=True).update(updated_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ttt', '0006_archived_game'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='updated_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
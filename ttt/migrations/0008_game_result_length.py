@@ -0,0 +1,19 @@
+# Generated by Django 3.2.9 on 2026-10-18 21:03
+
+from django.db import migrations, models
+import ttt.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ttt', '0007_game_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='game',
+            name='result',
+            field=models.CharField(max_length=4, null=True, validators=[ttt.models.validate_result]),
+        ),
+    ]
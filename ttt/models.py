@@ -35,7 +35,36 @@ class Game(models.Model):
     cross_player = models.ForeignKey(User, on_delete=models.PROTECT, related_name="cross_player")
     circle_player = models.ForeignKey(User, on_delete=models.PROTECT, related_name="circle_player")
     created_at = models.DateTimeField()
-    result = models.CharField(max_length=1, validators=[validate_result], null=True)
+    # czas ostatniego ruchu (albo utworzenia gry) - archive_games szuka po nim porzuconych gier
+    updated_at = models.DateTimeField(null=True)
+    result = models.CharField(max_length=len(ttt.DRAW), validators=[validate_result], null=True)
+    # stan plansz (ttt.to_snapshot) aktualizowany razem z ruchami
+    board = models.CharField(max_length=ttt.SNAPSHOT_SIZE, default=ttt.empty_snapshot)
+    last_cross_cell = models.SmallIntegerField(null=True)
+    last_circle_cell = models.SmallIntegerField(null=True)
+    next_board_nr = models.IntegerField(null=True)
+    # zwiekszana przy kazdym zapisie ruchu (klucz cache stanu gry, warunek zapisu w core.update_game)
+    version = models.PositiveIntegerField(default=0)
+    # historia ruchow (ttt.encode_move_log) zamiast wierszy Move, None - gra zapisana w Move
+    move_log = models.BinaryField(null=True)
+
+    # True w grze odtworzonej z ArchivedGame (core.get_game) - tylko do odczytu
+    archived = False
+
+    class Meta:
+        indexes = [
+            # create_game, get_game_or_create
+            models.Index(fields=['session', 'created_at'], name='game_session_created_idx'),
+            # get_running_user_games (OR na dwoch indeksach czesciowych)
+            models.Index(
+                fields=['cross_player', 'created_at'], name='game_running_cross_idx',
+                condition=models.Q(result__isnull=True)
+            ),
+            models.Index(
+                fields=['circle_player', 'created_at'], name='game_running_circle_idx',
+                condition=models.Q(result__isnull=True)
+            ),
+        ]
 
 
 class Move(models.Model):
@@ -45,4 +74,28 @@ class Move(models.Model):
     value = models.CharField(max_length=1, validators=[validate_result])
 
     class Meta:
+        # get_game_moves, get_game_moves_since: indeks klucza obcego game (w SQLite
+        # konczy sie rowid, wiec daje tez kolejnosc po id bez sortowania)
         unique_together = ["game", "board_nr", "position"]
+
+
+class ArchivedGame(models.Model):
+    """Zakonczona albo porzucona gra przeniesiona z Game/Move (manage.py archive_games).
+
+    Ruchy sa zapisane jak w Game.move_log, plansze odtwarza core przy odczycie.
+    """
+    id = models.BigIntegerField(primary_key=True)  # id z Game
+    session = models.ForeignKey(GameSession, on_delete=models.CASCADE, related_name="archived_games")
+    cross_player = models.ForeignKey(User, on_delete=models.PROTECT, related_name="archived_cross_player")
+    circle_player = models.ForeignKey(User, on_delete=models.PROTECT, related_name="archived_circle_player")
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField()
+    result = models.CharField(max_length=len(ttt.DRAW), validators=[validate_result], null=True)
+    version = models.PositiveIntegerField()
+    move_log = models.BinaryField()
+
+    class Meta:
+        indexes = [
+            # create_game
+            models.Index(fields=['session', 'created_at'], name='archived_session_created_idx'),
+        ]
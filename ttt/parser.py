@@ -85,6 +85,87 @@ def parse_steps(scenario, ensure_valid=True):
     return steps
 
 
+
+# Szybki odczyt wielu scenariuszy (np. z pliku), bez slownikow i sortowania.
+# Pole w wierszu planszy zaczyna sie co 4 znaki: 'X01|...|...*...'
+FIELD_WIDTH = len(EMPTY_FIELD)
+LINE_WIDTH = 9 * (FIELD_WIDTH + 1) - 1
+BOARD_ROWS = 9
+
+_CELLS = [
+    [(ttt.mini_board_nr(row_index, col_index), ttt.mini_board_pos(row_index, col_index)) for col_index in range(9)]
+    for row_index in range(BOARD_ROWS)
+]
+
+
+def _is_field_row(line):
+    return len(line) == LINE_WIDTH and line[FIELD_WIDTH] == FIELD_SEP
+
+
+def _scenario_moves(rows, ensure_valid):
+    moves = {}
+    for row_index, line in enumerate(rows):
+        cells = _CELLS[row_index]
+        for col_index in range(9):
+            offset = col_index * (FIELD_WIDTH + 1)
+            field = line[offset:offset + FIELD_WIDTH]
+            if field != EMPTY_FIELD:
+                board_nr, position = cells[col_index]
+                order = int(field[1:])
+                if ensure_valid and order in moves:
+                    raise ValueError('Duplicated order: {}'.format(field))
+                moves[order] = (board_nr, position, field[0])
+    if ensure_valid:
+        if sorted(moves) != list(range(1, len(moves) + 1)):
+            raise ValueError('Invalid order: {}'.format(sorted(moves)))
+        symbol = moves[1][2] if moves else None
+        for order in range(1, len(moves) + 1):
+            if moves[order][2] != symbol:
+                raise ValueError('Invalid symbol in move: {}'.format(order))
+            symbol = ttt.next_symbol(symbol)
+    return [moves[order] for order in sorted(moves)]
+
+
+def iter_scenarios(lines, ensure_valid=True):
+    """Czyta kolejne scenariusze z iterowalnych linii (np. otwartego pliku).
+
+    Dla kazdego scenariusza zwraca liste (board_nr, position, symbol)
+    w kolejnosci ruchow. Linie spoza plansz (puste, komentarze) sa pomijane.
+    """
+    rows = []
+    for line_nr, line in enumerate(lines, start=1):
+        line = line.strip()
+        if _is_field_row(line):
+            rows.append(line)
+            if len(rows) == BOARD_ROWS:
+                yield _scenario_moves(rows, ensure_valid)
+                rows = []
+        elif rows and not line.startswith(MINI_BOARD_SEP):
+            raise ValueError('Incomplete scenario before line {}'.format(line_nr))
+    if rows:
+        raise ValueError('Incomplete scenario at the end')
+
+
+def render_scenario(moves):
+    """Odwrotnosc parse_steps: ruchy (np. Move z get_game_moves) w ukladzie 11 linii.
+
+    Ruchy na planszy glownej (wyniki mini-plansz) sa pomijane.
+    """
+    cells = {}
+    order = 0
+    for m in moves:
+        if m.board_nr != ttt.MAIN_BOARD_NR:
+            order += 1
+            cells[(m.board_nr, m.position)] = '{}{:02d}'.format(m.value, order)
+    lines = []
+    for row_index in range(BOARD_ROWS):
+        if row_index and row_index % 3 == 0:
+            lines.append(' '.join(['***'] * 9))
+        fields = [cells.get(cell, EMPTY_FIELD) for cell in _CELLS[row_index]]
+        lines.append(MINI_BOARD_SEP.join(FIELD_SEP.join(fields[i:i + 3]) for i in range(0, 9, 3)))
+    return '\n'.join(lines)
+
+
 if __name__ == '__main__':
     test_scenario = '''
     ...|...|...*...|...|...*...|...|...
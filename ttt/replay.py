@@ -0,0 +1,122 @@
+"""Szybkie sprawdzanie wielu scenariuszy (zapisanych gier) bez bazy danych.
+
+Scenariusze (listy (board_nr, position, symbol), np. z parser.iter_scenarios)
+sa odtwarzane przez ttt.state.UltimateState w puli procesow. Wylosowana
+proba jest dodatkowo odtwarzana przez core.update_game (cross_check), zeby
+potwierdzic, ze zasady w pamieci i zapis w bazie daja ten sam wynik.
+"""
+import itertools
+import os
+import random
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from ttt.mcts import mp_context
+from ttt.state import UltimateState, IllegalMove
+
+DEFAULT_CHUNK_SIZE = 500
+
+# result - wynik gry (albo None), moves - liczba wykonanych ruchow,
+# error - komunikat bledu ruchu nr moves + 1 (albo None)
+ReplayResult = namedtuple('ReplayResult', ['result', 'moves', 'error'])
+
+
+def steps_to_moves(steps):
+    """Kroki z parser.parse_steps jako lista (board_nr, position, symbol)."""
+    return [(step['board_nr'], step['position'], step['symbol']) for step in steps]
+
+
+def replay(moves):
+    state = UltimateState.initial()
+    for count, (board_nr, position, symbol) in enumerate(moves):
+        try:
+            state.apply(board_nr, position, symbol)
+        except IllegalMove as exc:
+            return ReplayResult(state.result(), count, str(exc))
+        if state.result() is not None and count + 1 < len(moves):
+            return ReplayResult(state.result(), count + 1, 'The game is finished')
+    return ReplayResult(state.result(), len(moves), None)
+
+
+def _replay_chunk(chunk):
+    return [replay(moves) for moves in chunk]
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def replay_all(scenarios, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Odtwarza scenariusze i zwraca wyniki (ReplayResult) w tej samej kolejnosci.
+
+    workers=None - tyle procesow, ile procesorow; workers=1 - w biezacym procesie.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers == 1:
+        return [replay(moves) for moves in scenarios]
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context()) as executor:
+        for chunk_results in executor.map(_replay_chunk, _chunks(scenarios, chunk_size)):
+            results.extend(chunk_results)
+    return results
+
+
+class _Rollback(Exception):
+    pass
+
+
+def orm_replay(moves):
+    """Odtwarza scenariusz przez core.update_game w transakcji, ktora jest wycofywana."""
+    # import tutaj - procesy robocze replay_all nie potrzebuja Django
+    from django.contrib.auth.models import User
+    from django.db import transaction
+    from ttt import core, ttt
+
+    outcome = None
+    try:
+        with transaction.atomic():
+            cross_user = User.objects.create_user('replay-cross')
+            circle_user = User.objects.create_user('replay-circle')
+            game = core.create_game(core.invite(cross_user, circle_user))
+            players = {
+                ttt.CROSS_SYMBOL: game.cross_player,
+                ttt.CIRCLE_SYMBOL: game.circle_player,
+            }
+            count, error = 0, None
+            for board_nr, position, symbol in moves:
+                try:
+                    core.update_game(game.id, players.get(symbol, cross_user), board_nr, position)
+                except core.MoveError as exc:
+                    error = str(exc)
+                    break
+                except core.GameError:
+                    error = 'The game is finished'
+                    break
+                count += 1
+            game.refresh_from_db(fields=['result'])
+            outcome = ReplayResult(game.result, count, error)
+            raise _Rollback()
+    except _Rollback:
+        pass
+    return outcome
+
+
+def cross_check(scenarios, results, sample_size, seed=None):
+    """Porownuje wyniki replay z orm_replay dla losowej proby scenariuszy.
+
+    Zwraca liste (indeks, wynik w pamieci, wynik z bazy) dla niezgodnosci.
+    """
+    indexes = range(len(scenarios))
+    sample = sorted(random.Random(seed).sample(indexes, min(sample_size, len(scenarios))))
+    mismatches = []
+    for index in sample:
+        orm_result = orm_replay(scenarios[index])
+        if orm_result != results[index]:
+            mismatches.append((index, results[index], orm_result))
+    return mismatches
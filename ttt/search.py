@@ -0,0 +1,264 @@
+"""Przeszukiwanie calej gry (81 pol + plansza glowna) algorytmem alfa-beta.
+
+Stan gry trzymany jest w maskach bitowych z ttt.py, ruchy sa wykonywane
+i cofane w miejscu. Przeszukiwanie jest iteracyjnie poglebiane i konczy sie,
+gdy minie limit czasu - wtedy zwracany jest najlepszy ruch z ostatniej
+pelnej iteracji.
+"""
+import random
+import time
+from functools import lru_cache
+from math import inf
+
+from ttt import ttt
+from ttt.state import UltimateState
+
+DEFAULT_TIME_LIMIT = 0.5  # s
+DEFAULT_MAX_DEPTH = 81
+
+WIN_SCORE = 1000000
+TT_MAX_SIZE = 500000
+
+# co ile wezlow sprawdzamy czas
+_TIME_CHECK_INTERVAL = 1024
+
+_EXACT = 0
+_LOWER = 1
+_UPPER = 2
+
+_BOARD_NRS = range(ttt.MIN_BOARD_NR + 1, ttt.MAX_BOARD_NR + 1)
+_POSITIONS = range(ttt.MIN_POS, ttt.MAX_POS + 1)
+_BITS = [None] + [ttt.pos_bit(pos) for pos in _POSITIONS]
+
+_zobrist_rng = random.Random(0)
+_ZOBRIST = [
+    [[_zobrist_rng.getrandbits(64) for _ in range(ttt.MAX_POS + 1)]
+     for _ in range(ttt.MAX_BOARD_NR + 1)]
+    for _ in range(2)
+]
+_ZOBRIST_FORCED = [_zobrist_rng.getrandbits(64) for _ in range(ttt.MAX_BOARD_NR + 1)]
+_ZOBRIST_SIDE = _zobrist_rng.getrandbits(64)
+
+# waga linii w zaleznosci od liczby pol zajetych przez gracza
+_LINE_WEIGHTS = [0, 1, 4]
+_MAIN_BOARD_WEIGHT = 25
+_WON_BOARD_WEIGHT = 10
+_CENTER_BOARD_NR = 5
+
+
+class _Timeout(Exception):
+    pass
+
+
+class Position(UltimateState):
+    """Stan gry do przeszukiwania (zasady z UltimateState) z haszem Zobrista."""
+
+    __slots__ = ('hash',)
+
+    def __init__(self, masks, filled, forced, side):
+        super().__init__(masks, filled, forced, side)
+        self.hash = 0
+        for s in range(2):
+            for board_nr in _BOARD_NRS:
+                for pos in _POSITIONS:
+                    if masks[s][board_nr] & _BITS[pos]:
+                        self.hash ^= _ZOBRIST[s][board_nr][pos]
+
+    def key(self):
+        return self.hash ^ _ZOBRIST_FORCED[self.forced or 0] ^ (_ZOBRIST_SIDE if self.side else 0)
+
+    def play(self, board_nr, pos):
+        self.hash ^= _ZOBRIST[self.side][board_nr][pos]
+        UltimateState.play(self, board_nr, pos)
+
+    def undo(self):
+        UltimateState.undo(self)
+        ply = self._ply
+        self.hash ^= _ZOBRIST[self.side][self._history_board[ply]][self._history_pos[ply]]
+
+
+@lru_cache(maxsize=None)
+def _lines_score(own, blocked):
+    score = 0
+    for win in ttt.WIN_MASKS:
+        if not win & blocked:
+            score += _LINE_WEIGHTS[ttt.popcount(own & win)]
+    return score
+
+
+def evaluate(position):
+    """Ocena pozycji z perspektywy gracza, ktory ma ruch."""
+    main = ttt.MAIN_BOARD_NR
+    own = position.masks[position.side]
+    opp = position.masks[position.side ^ 1]
+    main_filled = position.filled[main]
+    main_draw = main_filled & ~(own[main] | opp[main])
+
+    score = _MAIN_BOARD_WEIGHT * (
+        _lines_score(own[main], opp[main] | main_draw) -
+        _lines_score(opp[main], own[main] | main_draw)
+    )
+    score += _WON_BOARD_WEIGHT * (ttt.popcount(own[main]) - ttt.popcount(opp[main]))
+    for board_nr in _BOARD_NRS:
+        if main_filled & _BITS[board_nr]:
+            continue
+        board_score = (
+            _lines_score(own[board_nr], opp[board_nr]) -
+            _lines_score(opp[board_nr], own[board_nr])
+        )
+        if board_nr == _CENTER_BOARD_NR:
+            board_score *= 2
+        score += board_score
+    return score
+
+
+class Searcher:
+
+    def __init__(self, time_limit=DEFAULT_TIME_LIMIT, max_depth=DEFAULT_MAX_DEPTH):
+        self.time_limit = time_limit
+        self.max_depth = max_depth
+        self.table = {}
+        self.nodes = 0
+        self.depth_reached = 0
+        self._deadline = None
+
+    def _check_time(self):
+        self.nodes += 1
+        if (
+                self._deadline is not None and
+                self.nodes % _TIME_CHECK_INTERVAL == 0 and
+                time.monotonic() > self._deadline
+        ):
+            raise _Timeout()
+
+    def _ordered_moves(self, position, tt_move):
+        side = position.side
+        own = position.masks[side]
+        opp = position.masks[side ^ 1]
+        main_filled = position.filled[ttt.MAIN_BOARD_NR]
+
+        def priority(move):
+            if move == tt_move:
+                return -1000
+            board_nr, pos = move
+            bit = _BITS[pos]
+            score = 0
+            if ttt.is_win_mask(own[board_nr] | bit):
+                score -= 100
+            elif ttt.is_win_mask(opp[board_nr] | bit):
+                score -= 50
+            if main_filled & bit:
+                # przeciwnik dostaje wolny wybor planszy
+                score += 30
+            if pos == _CENTER_BOARD_NR:
+                score -= 1
+            return score
+
+        return sorted(position.legal_moves(), key=priority)
+
+    def _negamax(self, position, depth, alpha, beta, ply):
+        self._check_time()
+
+        result = position.result()
+        if result is not None:
+            # ostatni ruch wykonal przeciwnik - jego wygrana albo remis
+            if result == ttt.DRAW:
+                return 0
+            return -(WIN_SCORE - ply)
+        if depth == 0:
+            return evaluate(position)
+
+        key = position.key()
+        entry = self.table.get(key)
+        tt_move = None
+        alpha_orig = alpha
+        if entry is not None:
+            entry_depth, entry_score, entry_flag, tt_move = entry
+            if entry_depth >= depth:
+                if entry_flag == _EXACT:
+                    return entry_score
+                elif entry_flag == _LOWER:
+                    alpha = max(alpha, entry_score)
+                else:
+                    beta = min(beta, entry_score)
+                if alpha >= beta:
+                    return entry_score
+
+        best_score = -inf
+        best_move = None
+        for move in self._ordered_moves(position, tt_move):
+            position.play(*move)
+            try:
+                score = -self._negamax(position, depth - 1, -beta, -alpha, ply + 1)
+            finally:
+                position.undo()
+            if score > best_score:
+                best_score, best_move = score, move
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                break
+
+        if best_score <= alpha_orig:
+            flag = _UPPER
+        elif best_score >= beta:
+            flag = _LOWER
+        else:
+            flag = _EXACT
+        if len(self.table) >= TT_MAX_SIZE:
+            self.table.clear()
+        self.table[key] = (depth, best_score, flag, best_move)
+        return best_score
+
+    def _search_root(self, position, depth):
+        key = position.key()
+        entry = self.table.get(key)
+        tt_move = entry[3] if entry is not None else None
+        alpha = -inf
+        best_move = None
+        for move in self._ordered_moves(position, tt_move):
+            position.play(*move)
+            try:
+                score = -self._negamax(position, depth - 1, -inf, -alpha, 1)
+            finally:
+                position.undo()
+            if best_move is None or score > alpha:
+                alpha, best_move = score, move
+        self.table[key] = (depth, alpha, _EXACT, best_move)
+        return best_move, alpha
+
+    def search(self, position):
+        moves = position.legal_moves()
+        if not moves:
+            raise ValueError('No legal moves')
+        if len(moves) == 1:
+            return moves[0]
+
+        # pierwsza iteracja zawsze sie konczy, zeby miec poprawny ruch
+        self._deadline = None
+        best_move, score = self._search_root(position, 1)
+        self.depth_reached = 1
+        self._deadline = time.monotonic() + self.time_limit
+
+        empty_cells = sum(
+            ttt.BOARD_SIZE - ttt.popcount(position.filled[board_nr])
+            for board_nr in _BOARD_NRS
+        )
+        for depth in range(2, min(self.max_depth, empty_cells) + 1):
+            if abs(score) >= WIN_SCORE - self.max_depth:
+                break
+            try:
+                best_move, score = self._search_root(position, depth)
+            except _Timeout:
+                break
+            self.depth_reached = depth
+            if time.monotonic() > self._deadline:
+                break
+        return best_move
+
+
+def best_move(boards, comp_symbol, next_board_nr,
+              time_limit=DEFAULT_TIME_LIMIT, max_depth=DEFAULT_MAX_DEPTH):
+    """Odpowiednik ttt.bot_turn przeszukujacy cala gre."""
+    position = Position.from_boards(boards, comp_symbol, next_board_nr)
+    return Searcher(time_limit=time_limit, max_depth=max_depth).search(position)
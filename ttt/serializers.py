@@ -1,3 +1,4 @@
+from ttt import ttt
 from ttt.ttt import is_mini_board_nr, is_pos
 
 
@@ -12,6 +13,42 @@ def serialized_moves(moves):
     return results
 
 
+def serialized_move_log(moves):
+    """Jak serialized_moves, z id ruchu (kursor dla kolejnych odczytow)."""
+    results = serialized_moves(moves)
+    for result, move in zip(results, moves):
+        result['id'] = move.id
+    return results
+
+
+def _last_cells(game):
+    """Ostatnie ruchy obu graczy, od starszego do nowszego."""
+    crosses = sum(1 for v in game.board[:ttt.MAIN_BOARD_OFFSET] if v == ttt.CROSS_SYMBOL)
+    circles = sum(1 for v in game.board[:ttt.MAIN_BOARD_OFFSET] if v == ttt.CIRCLE_SYMBOL)
+    if crosses > circles:
+        cells = [game.last_circle_cell, game.last_cross_cell]
+    else:
+        cells = [game.last_cross_cell, game.last_circle_cell]
+    return [cell for cell in cells if cell is not None]
+
+
+def compact_snapshot(game):
+    """Zapis plansz z Game i indeksy ostatnich ruchow graczy (od starszego).
+
+    app.js (snapshotMoves) odtwarza z tego liste ruchow w formacie
+    serialized_moves, z ostatnimi ruchami graczy na koncu.
+    """
+    return {
+        'board': game.board,
+        'last': _last_cells(game),
+    }
+
+
+def snapshot_indices(moves):
+    """Ruchy (board_nr, pos) jako indeksy ttt.snapshot_index."""
+    return [ttt.snapshot_index(board_nr, pos) for board_nr, pos in moves]
+
+
 def _get_board_nr(data):
     value = data.get('boardNr') # todo: !!!
     if not isinstance(value, int) or not is_mini_board_nr(value):
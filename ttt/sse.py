@@ -0,0 +1,149 @@
+"""Strumien zdarzen gry (server-sent events) obslugiwany bezposrednio w ASGI.
+
+Django 3.2 nie potrafi strumieniowac odpowiedzi asynchronicznie, wiec
+GET game/<external_session_id>/<game_id>/events obsluguje EventsRouter,
+a pozostale requesty przekazuje do aplikacji Django.
+"""
+import asyncio
+import json
+import re
+from http.cookies import SimpleCookie
+from importlib import import_module
+from types import SimpleNamespace
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth
+
+from ttt import core, events
+
+EVENTS_PATH = re.compile(r'^/game/(?P<external_session_id>[^/]+)/(?P<game_id>\d+)/events$')
+
+HEARTBEAT_INTERVAL = 15  # s
+
+
+def _get_session_key(scope):
+    cookie = SimpleCookie()
+    for name, value in scope.get('headers', []):
+        if name == b'cookie':
+            cookie.load(value.decode('latin-1'))
+    morsel = cookie.get(settings.SESSION_COOKIE_NAME)
+    return morsel.value if morsel else None
+
+
+def _get_user(session_key):
+    """Uzytkownik sesji jak w AuthenticationMiddleware (auth.get_user sprawdza
+    tez hash hasla zapisany w sesji), None dla anonimowego lub nieaktywnego."""
+    if session_key is None:
+        return None
+    session = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+    user = auth.get_user(SimpleNamespace(session=session))
+    if not user.is_authenticated or not user.is_active:
+        return None
+    return user
+
+
+def _get_player_game(session_key, external_session_id, game_id):
+    user = _get_user(session_key)
+    if user is None:
+        return None
+    game = core.get_game(external_session_id, game_id)
+    if game is None or not core.is_player(game, user):
+        return None
+    return game
+
+
+def format_event(event):
+    return 'event: {}\ndata: {}\n\n'.format(event['type'], json.dumps(event)).encode('utf-8')
+
+
+async def _send_response(send, status, body=b''):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'text/plain; charset=utf-8')],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def game_events(scope, receive, send, external_session_id, game_id):
+    broker = events.get_broker()
+    # subskrypcja przed odczytem gry: ruch zapisany w miedzyczasie jest juz
+    # w wersji wyslanej w hello albo przyjdzie jako zdarzenie move
+    subscription = broker.subscribe(events.game_channel(game_id))
+    try:
+        game = await sync_to_async(_get_player_game)(
+            _get_session_key(scope), external_session_id, game_id)
+        if game is None:
+            await _send_response(send, 404, b'Not Found')
+            return
+        await _stream_events(receive, send, game, subscription)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def _stream_events(receive, send, game, subscription):
+    disconnect = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ],
+        })
+        # klient porownuje wersje z wersja, z ktora wyrenderowano strone
+        await send({
+            'type': 'http.response.body',
+            'body': format_event({'type': 'hello', 'version': game.version}),
+            'more_body': True,
+        })
+        while True:
+            getter = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait(
+                {getter, disconnect},
+                timeout=HEARTBEAT_INTERVAL,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if getter not in done:
+                getter.cancel()
+            if disconnect in done:
+                return
+            if getter in done:
+                event = getter.result()
+                body = format_event(event)
+            else:
+                body = b': heartbeat\n\n'
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+            if getter in done and event.get('result') is not None:
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+    finally:
+        disconnect.cancel()
+
+
+class EventsRouter:
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            match = EVENTS_PATH.match(scope['path'])
+            if match:
+                await game_events(
+                    scope, receive, send,
+                    match.group('external_session_id'),
+                    int(match.group('game_id'))
+                )
+                return
+        await self.application(scope, receive, send)
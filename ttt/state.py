@@ -0,0 +1,202 @@
+"""Zasady gry na maskach bitowych, bez bazy danych.
+
+UltimateState sprawdza i wykonuje ruchy, podaje wynik gry i plansze, na ktorej
+trzeba zagrac. Uzywa go core (ruchy graczy) oraz search i mcts (przeszukiwanie),
+wiec wszedzie obowiazuja te same zasady. Wykonanie i cofniecie ruchu niczego
+nie alokuje - historia jest w listach o stalym rozmiarze.
+"""
+from ttt import ttt
+
+MAX_MOVES = (ttt.MAX_BOARD_NR - ttt.MIN_BOARD_NR) * ttt.BOARD_SIZE
+
+_BOARD_NRS = range(ttt.MIN_BOARD_NR + 1, ttt.MAX_BOARD_NR + 1)
+_POSITIONS = range(ttt.MIN_POS, ttt.MAX_POS + 1)
+_BITS = [None] + [ttt.pos_bit(pos) for pos in _POSITIONS]
+_SYMBOLS = (ttt.CROSS_SYMBOL, ttt.CIRCLE_SYMBOL)
+
+# _BOARD_MOVES[board_nr][maska zajetych pol] - wolne pola planszy jako ruchy
+_BOARD_MOVES = [
+    [tuple((board_nr, pos) for pos in ttt.free_positions(filled)) for filled in range(ttt.FULL_MASK + 1)]
+    for board_nr in range(ttt.MAX_BOARD_NR + 1)
+]
+
+
+class IllegalMove(ValueError):
+    pass
+
+
+class UltimateState:
+    """Stan gry. Strona 0 to krzyzyk, strona 1 to kolko.
+
+    masks[side][board_nr] - pola strony na planszy (board_nr 0 to plansza glowna),
+    filled[board_nr] - pola zajete (na planszy glownej: plansze zakonczone),
+    forced - plansza, na ktorej trzeba zagrac (None - dowolna).
+    """
+
+    __slots__ = (
+        'masks', 'filled', 'forced', 'side', 'moves_count',
+        '_ply', '_history_board', '_history_pos', '_history_forced', '_history_main',
+    )
+
+    def __init__(self, masks, filled, forced, side):
+        self.masks = masks
+        self.filled = filled
+        self.forced = forced
+        self.side = side
+        self.moves_count = sum(ttt.popcount(filled[board_nr]) for board_nr in _BOARD_NRS)
+        self._ply = 0
+        self._history_board = [0] * MAX_MOVES
+        self._history_pos = [0] * MAX_MOVES
+        self._history_forced = [None] * MAX_MOVES
+        self._history_main = [0] * MAX_MOVES
+
+    @classmethod
+    def initial(cls):
+        return cls(
+            [[0] * (ttt.MAX_BOARD_NR + 1), [0] * (ttt.MAX_BOARD_NR + 1)],
+            [0] * (ttt.MAX_BOARD_NR + 1), None, 0
+        )
+
+    @classmethod
+    def from_boards(cls, boards, symbol, next_board_nr):
+        """Stan z plansz (jak ttt.to_boards), symbol - gracz, ktory ma ruch."""
+        masks = [[0] * (ttt.MAX_BOARD_NR + 1), [0] * (ttt.MAX_BOARD_NR + 1)]
+        filled = [0] * (ttt.MAX_BOARD_NR + 1)
+        for board_nr, board in boards.items():
+            masks[0][board_nr], masks[1][board_nr], filled[board_nr] = ttt.to_masks(board)
+        forced = next_board_nr
+        if forced is not None and filled[ttt.MAIN_BOARD_NR] & _BITS[forced]:
+            forced = None
+        side = 0 if symbol == ttt.CROSS_SYMBOL else 1
+        return cls(masks, filled, forced, side)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, next_board_nr):
+        """Stan z zapisu plansz (Game.board, ttt.to_snapshot)."""
+        masks = [[0] * (ttt.MAX_BOARD_NR + 1), [0] * (ttt.MAX_BOARD_NR + 1)]
+        filled = [0] * (ttt.MAX_BOARD_NR + 1)
+        for index, value in enumerate(snapshot):
+            if value == ttt.EMPTY_CELL:
+                continue
+            board_nr, pos = ttt.snapshot_cell(index)
+            bit = _BITS[pos]
+            filled[board_nr] |= bit
+            if value == ttt.CROSS_SYMBOL:
+                masks[0][board_nr] |= bit
+            elif value == ttt.CIRCLE_SYMBOL:
+                masks[1][board_nr] |= bit
+        forced = next_board_nr
+        if forced is not None and filled[ttt.MAIN_BOARD_NR] & _BITS[forced]:
+            forced = None
+        state = cls(masks, filled, forced, 0)
+        state.side = state.moves_count % 2
+        return state
+
+    @property
+    def symbol(self):
+        """Symbol gracza, ktory ma ruch."""
+        return _SYMBOLS[self.side]
+
+    def last_symbol(self):
+        if self.moves_count == 0:
+            return None
+        return _SYMBOLS[self.side ^ 1]
+
+    def result(self):
+        main = ttt.MAIN_BOARD_NR
+        return ttt.masks_result(self.masks[0][main], self.masks[1][main], self.filled[main])
+
+    def board_result(self, board_nr):
+        return ttt.masks_result(self.masks[0][board_nr], self.masks[1][board_nr], self.filled[board_nr])
+
+    def legal_moves(self):
+        """Lista dozwolonych ruchow (board_nr, pos).
+
+        Ruchy kazdej planszy sa gotowymi krotkami z tablicy (plansza, maska
+        zajetych pol), wiec koszt zalezy od liczby plansz, a nie pol.
+        """
+        if self.forced is not None:
+            return list(_BOARD_MOVES[self.forced][self.filled[self.forced]])
+        main_filled = self.filled[ttt.MAIN_BOARD_NR]
+        moves = []
+        for board_nr in _BOARD_NRS:
+            if not main_filled & _BITS[board_nr]:
+                moves.extend(_BOARD_MOVES[board_nr][self.filled[board_nr]])
+        return moves
+
+    def check_move(self, board_nr, pos, symbol):
+        """Rzuca IllegalMove, jesli gracz symbol nie moze zagrac na (board_nr, pos)."""
+        if not ttt.is_mini_board_nr(board_nr):
+            raise IllegalMove('Invalid mini-board nr: {}'.format(board_nr))
+
+        if not ttt.is_symbol(symbol):
+            raise IllegalMove('Invalid symbol, got: {}'.format(symbol))
+
+        prev_symbol = self.last_symbol()
+        if prev_symbol is None and symbol == ttt.CIRCLE_SYMBOL:
+            raise IllegalMove('Required cross symbol')
+
+        if prev_symbol == symbol:
+            raise IllegalMove('Required the next symbol, got: {}'.format(symbol))
+
+        if self.forced is not None and self.forced != board_nr:
+            raise IllegalMove('Wrong mini-board, expected: {}, got: {}'.format(self.forced, board_nr))
+
+        if self.filled[ttt.MAIN_BOARD_NR] & _BITS[board_nr]:
+            raise IllegalMove('Wrong mini-board, board nr: {} is filled'.format(board_nr))
+
+        if not ttt.is_pos(pos):
+            raise IllegalMove('Invalid position: {}'.format(pos))
+
+        if self.filled[board_nr] & _BITS[pos]:
+            raise IllegalMove('The position {} is occupied'.format(pos))
+
+    def apply(self, board_nr, pos, symbol):
+        """Sprawdza i wykonuje ruch. Zwraca wynik mini-planszy (albo None)."""
+        self.check_move(board_nr, pos, symbol)
+        self.play(board_nr, pos)
+        return self.board_result(board_nr)
+
+    def play(self, board_nr, pos):
+        """Wykonuje ruch bez sprawdzania (ruch z legal_moves)."""
+        side = self.side
+        bit = _BITS[pos]
+        own = self.masks[side]
+        own[board_nr] |= bit
+        filled = self.filled
+        filled[board_nr] |= bit
+
+        main_bit = 0
+        if ttt.is_win_mask(own[board_nr]):
+            main_bit = _BITS[board_nr]
+            own[ttt.MAIN_BOARD_NR] |= main_bit
+        elif filled[board_nr] == ttt.FULL_MASK:
+            main_bit = _BITS[board_nr]
+        filled[ttt.MAIN_BOARD_NR] |= main_bit
+
+        ply = self._ply
+        self._history_board[ply] = board_nr
+        self._history_pos[ply] = pos
+        self._history_forced[ply] = self.forced
+        self._history_main[ply] = main_bit
+        self._ply = ply + 1
+
+        self.forced = None if filled[ttt.MAIN_BOARD_NR] & bit else pos
+        self.side = side ^ 1
+        self.moves_count += 1
+
+    def undo(self):
+        ply = self._ply - 1
+        self._ply = ply
+        board_nr = self._history_board[ply]
+        main_bit = self._history_main[ply]
+        side = self.side ^ 1
+        bit = _BITS[self._history_pos[ply]]
+        own = self.masks[side]
+        own[board_nr] &= ~bit
+        self.filled[board_nr] &= ~bit
+        own[ttt.MAIN_BOARD_NR] &= ~main_bit
+        self.filled[ttt.MAIN_BOARD_NR] &= ~main_bit
+        self.forced = self._history_forced[ply]
+        self.side = side
+        self.moves_count -= 1
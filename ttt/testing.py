@@ -0,0 +1,139 @@
+"""Pomocnicze funkcje dla testow (ttt.tests) i benchmarkow (benchmarks).
+
+Losowe, poprawne gry (random_game) i plansze po ich ruchach (position_boards)
+sa liczone przez ttt.search.Position, bez bazy danych. Stats zbiera czasy
+requestow i bledy z wielu watkow generatorow obciazenia, a compare porownuje
+wyniki mikro-benchmarkow z zapisanym punktem odniesienia.
+"""
+import threading
+from bisect import bisect_left
+from collections import namedtuple
+
+from ttt import db, ttt
+from ttt.search import Position
+
+CorpusMove = namedtuple('CorpusMove', ['board_nr', 'position', 'value'])
+
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+
+def random_game(rng):
+    """Losowa, poprawna gra: lista ruchow graczy (bez wynikow plansz)."""
+    position = Position.from_boards(ttt.to_boards([]), ttt.CROSS_SYMBOL, None)
+    moves = []
+    while position.result() is None:
+        board_nr, pos = rng.choice(position.legal_moves())
+        symbol = ttt.CROSS_SYMBOL if position.side == 0 else ttt.CIRCLE_SYMBOL
+        moves.append(CorpusMove(board_nr, pos, symbol))
+        position.play(board_nr, pos)
+    return moves
+
+
+def position_boards(moves):
+    """Plansze (jak ttt.to_boards) po wykonaniu ruchow graczy."""
+    position = Position.from_boards(ttt.to_boards([]), ttt.CROSS_SYMBOL, None)
+    for m in moves:
+        position.play(m.board_nr, m.position)
+    boards = {}
+    for board_nr in range(ttt.MIN_BOARD_NR, ttt.MAX_BOARD_NR + 1):
+        board = ttt.init_board()
+        for pos in range(ttt.MIN_POS, ttt.MAX_POS + 1):
+            bit = ttt.pos_bit(pos)
+            if position.masks[0][board_nr] & bit:
+                board[pos] = ttt.CROSS_SYMBOL
+            elif position.masks[1][board_nr] & bit:
+                board[pos] = ttt.CIRCLE_SYMBOL
+            elif position.filled[board_nr] & bit:
+                board[pos] = ttt.DRAW
+        boards[board_nr] = board
+    return boards
+
+
+def percentile(sorted_values, q):
+    return sorted_values[int(round(q / 100 * (len(sorted_values) - 1)))]
+
+
+def compare(results, baseline, tolerance):
+    """Zwraca liste regresji: (nazwa, ops/s teraz, ops/s w punkcie odniesienia)."""
+    regressions = []
+    for name, base in baseline.items():
+        current = results.get(name)
+        if current is None:
+            continue
+        if current['ops_per_sec'] < base['ops_per_sec'] * (1 - tolerance):
+            regressions.append((name, current['ops_per_sec'], base['ops_per_sec']))
+    return regressions
+
+
+class ResponseError(Exception):
+    """Odpowiedz z bledem; 503 to baza zajeta mimo ponowien (widok zwraca {"error": "busy"})."""
+
+    def __init__(self, status_code):
+        super().__init__('HTTP {}'.format(status_code))
+        self.status_code = status_code
+
+
+def _is_lock_error(exc):
+    return db.is_lock_error(exc) or isinstance(exc, ResponseError) and exc.status_code == 503
+
+
+class Stats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.lock_errors = 0
+        self.errors = {}
+        self.games_finished = 0
+        self.moves = 0
+
+    def record(self, kind, seconds):
+        with self._lock:
+            self.latencies.setdefault(kind, []).append(seconds)
+
+    def count_error(self, kind, exc):
+        with self._lock:
+            if _is_lock_error(exc):
+                self.lock_errors += 1
+            else:
+                key = '{}: {}'.format(kind, exc if isinstance(exc, ResponseError) else type(exc).__name__)
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+    def count_move(self):
+        with self._lock:
+            self.moves += 1
+
+    def count_game(self):
+        with self._lock:
+            self.games_finished += 1
+
+    def summary(self, elapsed):
+        requests = sum(len(v) for k, v in self.latencies.items() if k != 'bot move')
+        result = {
+            'elapsed_s': elapsed,
+            'requests': requests,
+            'requests_per_sec': requests / elapsed if elapsed else 0.0,
+            'moves': self.moves,
+            'moves_per_sec': self.moves / elapsed if elapsed else 0.0,
+            'games_finished': self.games_finished,
+            'lock_errors': self.lock_errors,
+            'errors': self.errors,
+            'latency': {},
+        }
+        for kind, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            histogram = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+            for v in values:
+                histogram[bisect_left(HISTOGRAM_BUCKETS_MS, v * 1000)] += 1
+            result['latency'][kind] = {
+                'count': len(values),
+                'p50_ms': percentile(values, 50) * 1000,
+                'p95_ms': percentile(values, 95) * 1000,
+                'p99_ms': percentile(values, 99) * 1000,
+                'max_ms': values[-1] * 1000,
+                'histogram_ms': dict(zip(
+                    ['<={}'.format(b) for b in HISTOGRAM_BUCKETS_MS] + ['>{}'.format(HISTOGRAM_BUCKETS_MS[-1])],
+                    histogram
+                )),
+            }
+        return result
@@ -1,7 +1,30 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import random
+import tempfile
+import threading
+import unittest
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.db import OperationalError, connection, connections
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
-from ttt import ttt, core, parser
-from ttt.models import Game
+from django.urls import reverse
+from django.utils import timezone
+from ttt import ttt, core, db, parser, search, mcts, bot_worker, events, metrics, replay, sse, testing, views
+from ttt.game_cache import game_cache
+from ttt.models import ArchivedGame, Game, GameSession, Move
+from ttt.serializers import compact_snapshot
+from ttt.sse import EventsRouter
+from ttt.state import UltimateState, IllegalMove
 
 
 class StepError(Exception):
@@ -132,15 +155,40 @@ class TTTTest(TestCase):
             X13|...|O02*...|O06|...*...|X31|O28
             X01|...|...*...|O32|...*...|...|X25
         '''
-        try:
-            execute_scenario(scenario, self.game, cross_user=self.u1, circle_user=self.u2, ensure_valid_scenario=True)
-        except StepError as error:
-            print("Wykryto błąd", error.step)
-            print("message", str(error))
-        else:
-            updated_game = Game.objects.get(id=self.game.id)
-            print("wynik końcowy:", updated_game.result)
-# skończyć
+        execute_scenario(scenario, self.game, cross_user=self.u1, circle_user=self.u2, ensure_valid_scenario=True)
+        updated_game = Game.objects.get(id=self.game.id)
+        self.assertEquals(updated_game.result, ttt.DRAW)
+        # DRAW jest dluzszy niz symbol gracza - pole musi go pomiescic
+        updated_game.full_clean()
+
+    def test_board_snapshot_matches_moves(self):
+        scenario = '''
+            O20|...|...*...|...|...*X13|...|O12
+            ...|O14|...*...|...|...*...|X17|...
+            O18|...|O02*...|...|...*...|...|X05
+            *** *** *** *** *** *** *** *** ***
+            ...|...|X11*X01|...|...*...|...|O16
+            ...|...|...*...|X15|...*...|...|...
+            O22|...|...*...|...|X07*...|...|X09
+            *** *** *** *** *** *** *** *** ***
+            X19|...|O04*...|...|...*...|...|...
+            ...|X21|...*...|...|...*O10|O06|O08
+            ...|...|...*...|...|...*X03|...|...
+        '''
+        execute_scenario(scenario, self.game, cross_user=self.u1, circle_user=self.u2)
+        game = Game.objects.get(id=self.game.id)
+        moves = core.get_game_moves(game)
+        self.assertEqual(game.board, ttt.to_snapshot(ttt.to_boards(moves)))
+        self.assertEqual(game.next_board_nr, ttt.next_board_nr(moves))
+
+        player_moves = [(m.board_nr, m.position) for m in moves if m.board_nr != ttt.MAIN_BOARD_NR]
+        self.assertEqual([ttt.snapshot_cell(i) for i in compact_snapshot(game)['last']], player_moves[-2:])
+
+    def test_update_game_queries(self):
+        core.update_game(self.game.id, self.u1, 5, 5)
+        # blokada gry, zapis ruchu, zapis planszy w Game (+ savepoint testu)
+        with self.assertNumQueries(5):
+            core.update_game(self.game.id, self.u2, 5, 1)
 
     def test_wrong_move(self):
         scenario = '''
@@ -201,4 +249,1147 @@ class TTTTest(TestCase):
         except StepError as error:
             self.assertEquals(str(error), "Required cross symbol")
 
-    # po ukonczeniu gry, gdy bedzie nowa gra to gracze powinni sie zamienic
\ No newline at end of file
+    # po ukonczeniu gry, gdy bedzie nowa gra to gracze powinni sie zamienic
+
+class ScenarioStreamTest(TestCase):
+
+    def test_reads_many_scenarios(self):
+        rng = random.Random(9)
+        games = [testing.random_game(rng) for _ in range(5)]
+        text = '\n\n# kolejna gra\n'.join(parser.render_scenario(moves) for moves in games)
+        scenarios = list(parser.iter_scenarios(io.StringIO(text)))
+        self.assertEqual(scenarios, [[tuple(m) for m in moves] for moves in games])
+
+    def test_matches_parse_steps(self):
+        scenario = parser.render_scenario(testing.random_game(random.Random(10))[:30])
+        steps = parser.parse_steps(scenario)
+        moves, = parser.iter_scenarios(scenario.splitlines())
+        self.assertEqual(moves, [(s['board_nr'], s['position'], s['symbol']) for s in steps])
+
+    def test_render_game_moves(self):
+        u1 = User.objects.create_user("u1", "u1@example.com", "haslo123")
+        u2 = User.objects.create_user("u2", "u2@example.com", "haslo123")
+        game = core.create_game(core.invite(u1, u2))
+        moves = testing.random_game(random.Random(11))
+        players = {ttt.CROSS_SYMBOL: game.cross_player, ttt.CIRCLE_SYMBOL: game.circle_player}
+        for m in moves:
+            core.update_game(game.id, players[m.value], m.board_nr, m.position)
+        # wyniki mini-plansz z get_game_moves nie trafiaja do scenariusza
+        rendered = parser.render_scenario(core.get_game_moves(game))
+        self.assertEqual(len(rendered.splitlines()), 11)
+        self.assertEqual(next(parser.iter_scenarios(rendered.splitlines())), [tuple(m) for m in moves])
+
+    def test_invalid_scenarios(self):
+        scenario = parser.render_scenario(testing.random_game(random.Random(12))[:6])
+        with self.assertRaises(ValueError):
+            list(parser.iter_scenarios(scenario.replace('X03', 'X07').splitlines()))
+        with self.assertRaises(ValueError):
+            list(parser.iter_scenarios(scenario.splitlines()[:5]))
+
+
+class UltimateStateTest(TestCase):
+
+    def test_replays_games(self):
+        rng = random.Random(13)
+        for _ in range(20):
+            moves = testing.random_game(rng)
+            state = UltimateState.initial()
+            for m in moves:
+                self.assertIn((m.board_nr, m.position), state.legal_moves())
+                state.apply(m.board_nr, m.position, m.value)
+            self.assertIsNotNone(state.result())
+            self.assertEqual(state.moves_count, len(moves))
+
+    def test_from_snapshot_matches_boards(self):
+        moves = testing.random_game(random.Random(14))[:25]
+        boards = testing.position_boards(moves)
+        from_snapshot = UltimateState.from_snapshot(ttt.to_snapshot(boards), moves[-1].position)
+        from_boards = UltimateState.from_boards(boards, ttt.CIRCLE_SYMBOL, moves[-1].position)
+        self.assertEqual(
+            (from_snapshot.masks, from_snapshot.filled, from_snapshot.forced, from_snapshot.side),
+            (from_boards.masks, from_boards.filled, from_boards.forced, from_boards.side)
+        )
+        self.assertEqual(from_snapshot.symbol, ttt.CIRCLE_SYMBOL)
+
+    def test_undo_restores_state(self):
+        state = UltimateState.initial()
+        for m in testing.random_game(random.Random(15))[:30]:
+            state.play(m.board_nr, m.position)
+        before = ([row[:] for row in state.masks], state.filled[:], state.forced, state.side, state.moves_count)
+        for move in state.legal_moves():
+            state.play(*move)
+            state.undo()
+        self.assertEqual(before, (state.masks, state.filled, state.forced, state.side, state.moves_count))
+
+    def test_illegal_moves(self):
+        state = UltimateState.initial()
+        with self.assertRaisesRegex(IllegalMove, 'Required cross symbol'):
+            state.apply(5, 5, ttt.CIRCLE_SYMBOL)
+        state.apply(5, 5, ttt.CROSS_SYMBOL)
+        with self.assertRaisesRegex(IllegalMove, 'Required the next symbol'):
+            state.apply(5, 1, ttt.CROSS_SYMBOL)
+        with self.assertRaisesRegex(IllegalMove, 'expected: 5, got: 1'):
+            state.apply(1, 1, ttt.CIRCLE_SYMBOL)
+        with self.assertRaisesRegex(IllegalMove, 'The position 5 is occupied'):
+            state.apply(5, 5, ttt.CIRCLE_SYMBOL)
+        with self.assertRaisesRegex(IllegalMove, 'Invalid position'):
+            state.apply(5, 10, ttt.CIRCLE_SYMBOL)
+        self.assertEqual(state.moves_count, 1)
+
+    def test_legal_moves_match_free_fields(self):
+        state = UltimateState.initial()
+        for m in testing.random_game(random.Random(16))[:40]:
+            if state.forced is not None:
+                boards = [state.forced]
+            else:
+                boards = [
+                    board_nr for board_nr in range(ttt.MIN_BOARD_NR + 1, ttt.MAX_BOARD_NR + 1)
+                    if not state.filled[ttt.MAIN_BOARD_NR] & ttt.pos_bit(board_nr)
+                ]
+            expected = [
+                (board_nr, pos)
+                for board_nr in boards
+                for pos in range(ttt.MIN_POS, ttt.MAX_POS + 1)
+                if not state.filled[board_nr] & ttt.pos_bit(pos)
+            ]
+            self.assertEqual(state.legal_moves(), expected)
+            state.play(m.board_nr, m.position)
+        self.assertEqual(ttt.free_positions(0b111111110), (1,))
+
+
+class ReplayTest(TestCase):
+
+    def _corpus(self, seed, games):
+        rng = random.Random(seed)
+        scenarios = [[tuple(m) for m in testing.random_game(rng)] for _ in range(games)]
+        # niepoprawne: zly symbol, powtorzony ruch, ruch po koncu gry
+        scenarios.append(scenarios[0][:3] + [scenarios[0][3][:2] + (ttt.CROSS_SYMBOL,)])
+        scenarios.append(scenarios[1][:5] + [scenarios[1][1]])
+        scenarios.append(scenarios[2] + [scenarios[2][0]])
+        return scenarios
+
+    def test_parallel_results_match_inline(self):
+        scenarios = self._corpus(16, 60)
+        inline = replay.replay_all(scenarios, workers=1)
+        parallel = replay.replay_all(scenarios, workers=2, chunk_size=7)
+        self.assertEqual(parallel, inline)
+        self.assertTrue(all(r.error is None and r.result is not None for r in inline[:60]))
+        self.assertEqual(inline[60], (None, 3, 'Required the next symbol, got: X'))
+        self.assertEqual(inline[61].moves, 5)
+        self.assertIsNotNone(inline[61].error)
+        self.assertEqual(inline[62].error, 'The game is finished')
+
+    def test_cross_check_agrees_with_orm(self):
+        scenarios = self._corpus(17, 5)
+        results = replay.replay_all(scenarios, workers=1)
+        self.assertEqual(replay.cross_check(scenarios, results, sample_size=len(scenarios), seed=1), [])
+        self.assertEqual(User.objects.count(), 0)
+
+    def test_check_scenarios_command(self):
+        rng = random.Random(19)
+        with tempfile.NamedTemporaryFile('w', suffix='.txt') as f:
+            f.write('\n\n'.join(parser.render_scenario(testing.random_game(rng)) for _ in range(10)))
+            f.flush()
+            out = io.StringIO()
+            call_command('check_scenarios', f.name, '--workers', '1', '--sample', '3', stdout=out)
+        self.assertIn('Replayed 10 scenarios', out.getvalue())
+        self.assertIn('Cross-checked 3 scenarios', out.getvalue())
+
+    def test_parse_steps_scenario(self):
+        scenario = parser.render_scenario(testing.random_game(random.Random(18)))
+        result = replay.replay(replay.steps_to_moves(parser.parse_steps(scenario)))
+        self.assertIsNone(result.error)
+        self.assertIsNotNone(result.result)
+
+
+class BitboardTest(TestCase):
+
+    def _reference_result(self, board):
+        for symbol in (ttt.CROSS_SYMBOL, ttt.CIRCLE_SYMBOL):
+            for a, b, c in ttt.LINES:
+                if board[a] == board[b] == board[c] == symbol:
+                    return symbol
+        if None not in board.values():
+            return ttt.DRAW
+        return None
+
+    def test_board_result_matches_reference(self):
+        values = [None, ttt.CROSS_SYMBOL, ttt.CIRCLE_SYMBOL, ttt.DRAW]
+        for code in range(4 ** 9):
+            board = ttt.init_board()
+            for pos in range(ttt.MIN_POS, ttt.MAX_POS + 1):
+                board[pos] = values[code % 4]
+                code //= 4
+            self.assertEqual(ttt.get_board_result(board), self._reference_result(board))
+
+    def test_minimax_blocks_line(self):
+        board = ttt.make_board([(1, ttt.CIRCLE_SYMBOL), (2, ttt.CIRCLE_SYMBOL), (5, ttt.CROSS_SYMBOL)], mini=True)
+        row, col, _ = ttt.minimax(board, 6, ttt.CROSS_SYMBOL, ttt.CROSS_SYMBOL, ttt.CIRCLE_SYMBOL)
+        self.assertEqual((row, col), (0, 2))
+
+
+class SolutionsTest(TestCase):
+
+    def test_solved_moves_match_search(self):
+        rng = random.Random(7)
+        for _ in range(300):
+            board = ttt.init_board()
+            for pos in rng.sample(range(ttt.MIN_POS, ttt.MAX_POS + 1), rng.randint(3, 6)):
+                board[pos] = rng.choice([ttt.CROSS_SYMBOL, ttt.CIRCLE_SYMBOL, ttt.DRAW])
+            if not ttt._is_playable(board):
+                continue
+            depth = len(ttt._get_empty_cells(board))
+            comp, human = ttt.CROSS_SYMBOL, ttt.CIRCLE_SYMBOL
+            for player in (comp, human):
+                expected = ttt._minimax(
+                    ttt.to_mask(board, comp), ttt.to_mask(board, human),
+                    ttt.to_masks(board)[2], depth, player == comp
+                )
+                self.assertEqual(ttt.minimax(board, depth, player, comp, human), expected)
+
+    def test_stored_solutions_are_complete(self):
+        stored = ttt.load_solutions(ttt.SOLUTIONS_PATH)
+        self.assertEqual(stored[(0, 0, 0)], [0] * ttt.BOARD_SIZE)
+        for key, scores in stored.items():
+            self.assertEqual(key, ttt._canonical(*key)[0])
+            self.assertEqual(len(scores), ttt.BOARD_SIZE)
+
+
+class SearchTest(TestCase):
+
+    def test_takes_winning_move(self):
+        # X ma dwie wygrane plansze w linii (1, 2) i moze wygrac plansze 3
+        moves = [
+            Move(board_nr=0, position=1, value=ttt.CROSS_SYMBOL),
+            Move(board_nr=0, position=2, value=ttt.CROSS_SYMBOL),
+            Move(board_nr=3, position=1, value=ttt.CROSS_SYMBOL),
+            Move(board_nr=3, position=2, value=ttt.CROSS_SYMBOL),
+            Move(board_nr=7, position=3, value=ttt.CIRCLE_SYMBOL),
+        ]
+        board_nr, pos = search.best_move(
+            boards=ttt.to_boards(moves),
+            comp_symbol=ttt.CROSS_SYMBOL,
+            next_board_nr=ttt.next_board_nr(moves),
+            time_limit=0.1
+        )
+        self.assertEqual((board_nr, pos), (3, 3))
+
+    def test_play_and_undo_restore_position(self):
+        position = search.Position.from_boards(ttt.to_boards([]), ttt.CROSS_SYMBOL, None)
+        key = position.key()
+        for board_nr, pos in [(5, 5), (5, 1), (1, 5), (5, 9)]:
+            self.assertIn((board_nr, pos), position.legal_moves())
+            position.play(board_nr, pos)
+        self.assertEqual(position.forced, 9)
+        for _ in range(4):
+            position.undo()
+        self.assertEqual(position.key(), key)
+        self.assertEqual(len(position.legal_moves()), 81)
+
+    @override_settings(TTT_BOT_ENGINE=core.BOT_ENGINE_ALPHABETA, TTT_BOT_TIME_LIMIT=0.05)
+    def test_computer_moves_are_legal(self):
+        user = User.objects.create_user("u1", "u1@example.com", "haslo123")
+        session = core.invite_computer_player(user)
+        game = core.create_game(session)
+        computer = core.get_computer_player(game)
+        human = game.circle_player if game.cross_player == computer else game.cross_player
+        rng = random.Random(1)
+        for _ in range(10):
+            moves = core.get_game_moves(game)
+            symbol = core.get_player_symbol(game, computer)
+            game.refresh_from_db()
+            if core.GameState(game).is_turn(symbol):
+                core.update_game_by_computer(game, computer)
+            else:
+                position = search.Position.from_boards(
+                    ttt.to_boards(moves), ttt.next_symbol(symbol), ttt.next_board_nr(moves))
+                core.update_game(game.id, human, *rng.choice(position.legal_moves()))
+        mini_moves = [m for m in core.get_game_moves(game) if m.board_nr != ttt.MAIN_BOARD_NR]
+        self.assertEqual(len(mini_moves), 10)
+
+
+class MCTSTest(TestCase):
+
+    def test_takes_winning_move(self):
+        moves = [
+            Move(board_nr=0, position=1, value=ttt.CROSS_SYMBOL),
+            Move(board_nr=0, position=2, value=ttt.CROSS_SYMBOL),
+            Move(board_nr=3, position=1, value=ttt.CROSS_SYMBOL),
+            Move(board_nr=3, position=2, value=ttt.CROSS_SYMBOL),
+            Move(board_nr=7, position=3, value=ttt.CIRCLE_SYMBOL),
+        ]
+        board_nr, pos = mcts.best_move(
+            boards=ttt.to_boards(moves),
+            comp_symbol=ttt.CROSS_SYMBOL,
+            next_board_nr=ttt.next_board_nr(moves),
+            playouts=300,
+            seed=1
+        )
+        self.assertEqual((board_nr, pos), (3, 3))
+
+    def test_parallel_workers_are_deterministic(self):
+        boards = ttt.to_boards([])
+        first = mcts.best_move(boards, ttt.CROSS_SYMBOL, None, playouts=100, workers=2, seed=5)
+        second = mcts.best_move(boards, ttt.CROSS_SYMBOL, None, playouts=100, workers=2, seed=5)
+        self.assertEqual(first, second)
+        self.assertTrue(ttt.is_mini_board_nr(first[0]) and ttt.is_pos(first[1]))
+
+    def test_executor_is_shared_between_threads(self):
+        executors = []
+        threads = [threading.Thread(target=lambda: executors.append(mcts.start_executor(3))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len({id(executor) for executor in executors}), 1)
+        self.assertNotEqual(executors[0]._mp_context.get_start_method(), 'fork')
+
+
+class BotWorkerTest(TestCase):
+
+    def test_deduplicates_and_bounds_queue(self):
+        started = threading.Event()
+        release = threading.Event()
+        handled = []
+
+        def handler(game_id):
+            started.set()
+            release.wait(5)
+            handled.append(game_id)
+
+        executor = bot_worker.BotExecutor(handler, workers=1, max_queue_size=1)
+        self.assertTrue(executor.submit(1))
+        started.wait(5)
+        self.assertEqual(executor.status(1), bot_worker.STATUS_RUNNING)
+        self.assertFalse(executor.submit(1))
+        self.assertTrue(executor.submit(2))
+        self.assertEqual(executor.status(2), bot_worker.STATUS_QUEUED)
+        with self.assertRaises(bot_worker.QueueFull):
+            executor.submit(3)
+
+        release.set()
+        executor.join()
+        self.assertEqual(handled, [1, 2])
+        self.assertEqual(executor.status(1), bot_worker.STATUS_DONE)
+        self.assertEqual(executor.status(3), None)
+
+    @override_settings(TTT_BOT_WORKERS=0, TTT_BOT_ENGINE=core.BOT_ENGINE_ALPHABETA, TTT_BOT_TIME_LIMIT=0.05)
+    def test_human_move_triggers_computer_move(self):
+        game_cache.clear()
+        user = User.objects.create_user("u1", "u1@example.com", "haslo123")
+        session = core.invite_computer_player(user)
+        game = core.create_game(session)
+        self.client.force_login(user)
+        url = reverse('game_details', args=[session.external_id, game.id])
+
+        self.client.get(url)
+        if core.is_first_player(game, user):
+            response = self.client.post(url, json.dumps({'boardNr': 5, 'position': 5}),
+                                        content_type='application/json')
+            self.assertEqual(response.json(), {'bot': bot_worker.STATUS_DONE})
+
+        moves = core.get_game_moves(game)
+        self.assertEqual(moves[-1].value, core.get_player_symbol(game, core.get_computer_player(game)))
+        response = self.client.get(reverse('bot_status', args=[session.external_id, game.id]))
+        self.assertEqual(response.json(), {'status': bot_worker.STATUS_DONE})
+
+    def test_bot_status_requires_player(self):
+        user = User.objects.create_user("u1", "u1@example.com", "haslo123")
+        session = core.invite_computer_player(user)
+        game = core.create_game(session)
+        outsider = User.objects.create_user("u3", "u3@example.com", "haslo123")
+        self.client.force_login(outsider)
+        response = self.client.get(reverse('bot_status', args=[session.external_id, game.id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class GameCacheTest(TestCase):
+
+    def setUp(self):
+        game_cache.clear()
+        self.u1 = User.objects.create_user("u1", "u1@example.com", "haslo123")
+        self.u2 = User.objects.create_user("u2", "u2@example.com", "haslo123")
+        self.session = core.invite(self.u1, self.u2)
+        self.game = core.create_game(self.session)
+
+    def test_get_game_is_cached_until_update(self):
+        core.get_game(self.session.external_id, self.game.id)
+        with self.assertNumQueries(0):
+            game = core.get_game(self.session.external_id, self.game.id)
+        self.assertEqual(game.version, 0)
+        self.assertEqual(game_cache.stats()['hits'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            core.update_game(self.game.id, self.u1, 5, 5)
+        game = core.get_game(self.session.external_id, self.game.id)
+        self.assertEqual(game.version, 1)
+        self.assertEqual(game.board, ttt.to_snapshot(ttt.to_boards(core.get_game_moves(game))))
+        self.assertEqual(game_cache.stats()['misses'], 2)
+
+    def test_stale_state_is_not_served(self):
+        stale = core.get_game(self.session.external_id, self.game.id)
+        game_cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            core.update_game(self.game.id, self.u1, 5, 5)
+        # spozniony odczyt zapisuje stara wersje po commicie
+        game_cache.set(stale)
+        game = core.get_game(self.session.external_id, self.game.id)
+        self.assertEqual(game.version, 1)
+
+    def test_wrong_session_is_not_served(self):
+        core.get_game(self.session.external_id, self.game.id)
+        self.assertIsNone(core.get_game('x' * GameSession.EXTERNAL_ID_SIZE, self.game.id))
+
+
+class GameEventsTest(TestCase):
+
+    def setUp(self):
+        game_cache.clear()
+        self.u1 = User.objects.create_user("u1", "u1@example.com", "haslo123")
+        self.u2 = User.objects.create_user("u2", "u2@example.com", "haslo123")
+        self.session = core.invite(self.u1, self.u2)
+        self.game = core.create_game(self.session)
+
+    def test_broker_delivers_from_other_thread(self):
+        broker = events.InProcessBroker()
+
+        async def run():
+            subscription = broker.subscribe('game:1')
+            thread = threading.Thread(target=broker.publish, args=('game:1', {'type': 'move'}))
+            thread.start()
+            event = await asyncio.wait_for(subscription.get(), 5)
+            thread.join()
+            broker.unsubscribe(subscription)
+            return event
+
+        self.assertEqual(async_to_sync(run)(), {'type': 'move'})
+        self.assertEqual(broker.subscribers_count('game:1'), 0)
+
+    def _stream(self, user, on_open, messages=3):
+        self.client.force_login(user)
+        cookie = '{}={}'.format(
+            settings.SESSION_COOKIE_NAME,
+            self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        )
+        scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': '/game/{}/{}/events'.format(self.session.external_id, self.game.id),
+            'headers': [(b'cookie', cookie.encode())],
+        }
+        sent = []
+
+        async def run():
+            disconnected = asyncio.Event()
+
+            async def receive():
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+                if len(sent) == 2:
+                    await sync_to_async(on_open)()
+                if len(sent) == messages:
+                    disconnected.set()
+
+            await EventsRouter(None)(scope, receive, send)
+
+        async_to_sync(run)()
+        return sent
+
+    def test_stream_pushes_committed_moves(self):
+        def move():
+            with self.captureOnCommitCallbacks(execute=True):
+                core.update_game(self.game.id, self.u1, 5, 5)
+
+        sent = self._stream(self.u2, move)
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertIn(b'event: hello', sent[1]['body'])
+        body = sent[2]['body'].decode()
+        self.assertTrue(body.startswith('event: move\n'))
+        event = json.loads(body.split('data: ', 1)[1])
+        self.assertEqual(event['version'], 1)
+        self.assertEqual(event['moves'], [{'board_nr': 5, 'position': 5, 'value': ttt.CROSS_SYMBOL}])
+
+    def test_hello_reports_move_before_subscription(self):
+        self.client.force_login(self.u2)
+        url = reverse('game_details', args=[self.session.external_id, self.game.id])
+        rendered_version = self.client.get(url).context['game']['version']
+        with self.captureOnCommitCallbacks(execute=True):
+            core.update_game(self.game.id, self.u1, 5, 5)
+
+        sent = self._stream(self.u2, lambda: None, messages=2)
+        body = sent[1]['body'].decode()
+        self.assertTrue(body.startswith('event: hello\n'))
+        self.assertGreater(json.loads(body.split('data: ', 1)[1])['version'], rendered_version)
+
+    def test_stream_rejects_session_after_password_change(self):
+        self.client.force_login(self.u2)
+        cookie = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.u2.set_password("nowehaslo123")
+        self.u2.save()
+        self.assertIsNone(sse._get_user(cookie))
+        self.assertIsNone(sse._get_player_game(cookie, self.session.external_id, self.game.id))
+
+    def test_stream_requires_player(self):
+        outsider = User.objects.create_user("u3", "u3@example.com", "haslo123")
+        sent = self._stream(outsider, lambda: None)
+        self.assertEqual(sent[0]['status'], 404)
+
+
+class GameStateViewTest(TestCase):
+
+    def setUp(self):
+        game_cache.clear()
+        self.u1 = User.objects.create_user("u1", "u1@example.com", "haslo123")
+        self.u2 = User.objects.create_user("u2", "u2@example.com", "haslo123")
+        self.session = core.invite(self.u1, self.u2)
+        self.game = core.create_game(self.session)
+        self.url = reverse('game_state', args=[self.session.external_id, self.game.id])
+        self.client.force_login(self.u2)
+
+    def _move(self, user, board_nr, position):
+        with self.captureOnCommitCallbacks(execute=True):
+            core.update_game(self.game.id, user, board_nr, position)
+
+    def test_returns_moves_after_cursor(self):
+        self._move(self.u1, 5, 5)
+        self._move(self.u2, 5, 1)
+        data = self.client.get(self.url).json()
+        self.assertEqual([(m['board_nr'], m['position']) for m in data['moves']], [(5, 5), (5, 1)])
+        self.assertEqual(data['cursor'], data['moves'][-1]['id'])
+        self.assertFalse(data['is_your_move'])
+
+        self._move(self.u1, 1, 5)
+        data = self.client.get(self.url, {'since': data['cursor']}).json()
+        self.assertEqual([(m['board_nr'], m['position']) for m in data['moves']], [(1, 5)])
+        self.assertTrue(data['is_your_move'])
+        self.assertEqual(data['version'], 3)
+
+    def test_not_modified_without_queries(self):
+        self._move(self.u1, 5, 5)
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        # sesja i uzytkownik z bazy, gra z cache
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self._move(self.u2, 5, 1)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_legal_moves(self):
+        self.assertEqual(self.client.get(self.url).json()['legal_moves'], [])
+        self._move(self.u1, 5, 3)
+        data = self.client.get(self.url).json()
+        self.assertEqual(data['legal_moves'], [[3, pos] for pos in range(ttt.MIN_POS, ttt.MAX_POS + 1)])
+
+    def test_requires_player(self):
+        outsider = User.objects.create_user("u3", "u3@example.com", "haslo123")
+        self.client.force_login(outsider)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+class GamePageTest(TestCase):
+
+    def setUp(self):
+        game_cache.clear()
+        cache.clear()
+        self.u1 = User.objects.create_user("u1", "u1@example.com", "haslo123")
+        self.u2 = User.objects.create_user("u2", "u2@example.com", "haslo123")
+        self.session = core.invite(self.u1, self.u2)
+        self.game = core.create_game(self.session)
+        self.url = reverse('game_details', args=[self.session.external_id, self.game.id])
+        self.client.force_login(self.u2)
+
+    def test_compact_state(self):
+        core.update_game(self.game.id, self.u1, 5, 3)
+        state = self.client.get(self.url).context['game']
+        game = Game.objects.get(id=self.game.id)
+        self.assertEqual(state['board'], game.board)
+        self.assertEqual(state['last'], [ttt.snapshot_index(5, 3)])
+        self.assertTrue(state['is_your_move'])
+        self.assertEqual(state['legal'], [ttt.snapshot_index(3, pos) for pos in range(ttt.MIN_POS, ttt.MAX_POS + 1)])
+
+    def test_compact_snapshot_keeps_last_moves_order(self):
+        core.update_game(self.game.id, self.u1, 5, 3)
+        core.update_game(self.game.id, self.u2, 3, 1)
+        game = Game.objects.get(id=self.game.id)
+        self.assertEqual([ttt.snapshot_cell(i) for i in compact_snapshot(game)['last']], [(5, 3), (3, 1)])
+
+    def test_board_skeleton_is_cached(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.content.count(b'<td '), ttt.BOARD_SIZE * ttt.MAX_BOARD_NR)
+        version = views._board_skeleton_version()
+        self.assertIsNotNone(cache.get(make_template_fragment_key('ttt_board_skeleton', [version])))
+
+        with mock.patch.object(ttt, 'BOARD_ROWS', []):
+            self.assertEqual(self.client.get(self.url).content, response.content)
+
+        # inny szablon - inny klucz, szkielet renderowany od nowa
+        with mock.patch.object(views, '_board_skeleton_version', lambda: 'changed'), \
+                mock.patch.object(ttt, 'BOARD_ROWS', []):
+            self.assertEqual(self.client.get(self.url).content.count(b'<td '), 0)
+
+
+class OptimisticUpdateTest(TestCase):
+
+    def setUp(self):
+        game_cache.clear()
+        self.u1 = User.objects.create_user("u1", "u1@example.com", "haslo123")
+        self.u2 = User.objects.create_user("u2", "u2@example.com", "haslo123")
+        self.game = core.create_game(core.invite(self.u1, self.u2))
+
+    def _load_with_concurrent_update(self, conflicts):
+        get_game = core._get_game_to_update_by_user
+
+        def wrapper(game_id, user):
+            # inny zapis zmienia wersje gry miedzy odczytem a zapisem ruchu
+            game = get_game(game_id, user)
+            if conflicts:
+                conflicts.pop()
+                Game.objects.filter(id=game.id).update(version=game.version + 1)
+            return game
+        return mock.patch.object(core, '_get_game_to_update_by_user', side_effect=wrapper)
+
+    def test_retries_after_conflict(self):
+        with self._load_with_concurrent_update([1, 1]):
+            core.update_game(self.game.id, self.u1, 5, 5)
+        self.game.refresh_from_db()
+        self.assertEqual(self.game.version, 3)
+        self.assertEqual([(m.board_nr, m.position) for m in core.get_game_moves(self.game)], [(5, 5)])
+
+    def test_gives_up_after_max_attempts(self):
+        with self._load_with_concurrent_update([1] * core.MAX_UPDATE_ATTEMPTS):
+            with self.assertRaises(core.UpdateConflict):
+                core.update_game(self.game.id, self.u1, 5, 5)
+        self.assertEqual(core.get_game_moves(self.game), [])
+
+
+class ConcurrentGamesTest(TransactionTestCase):
+
+    def test_parallel_games(self):
+        game_cache.clear()
+        rng = random.Random(21)
+        games = []
+        for nr in range(8):
+            u1 = User.objects.create_user("a{}".format(nr))
+            u2 = User.objects.create_user("b{}".format(nr))
+            game = core.create_game(core.invite(u1, u2))
+            players = {ttt.CROSS_SYMBOL: game.cross_player, ttt.CIRCLE_SYMBOL: game.circle_player}
+            games.append((game, players, testing.random_game(rng)))
+        errors = []
+
+        def play(game, players, moves):
+            # dwoch klientow wysyla te same ruchy (np. podwojne klikniecie)
+            try:
+                for m in moves:
+                    try:
+                        core.update_game(game.id, players[m.value], m.board_nr, m.position)
+                    except core.UpdateConflict as exc:
+                        errors.append(exc)
+                    except (core.MoveError, core.GameError):
+                        pass
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=play, args=game)
+            for game in games for _ in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        for game, _, moves in games:
+            game.refresh_from_db()
+            self.assertEqual(game.version, len(moves))
+            self.assertIsNotNone(game.result)
+            played = [(m.board_nr, m.position) for m in core.get_game_moves(game) if m.board_nr != ttt.MAIN_BOARD_NR]
+            self.assertEqual(played, [(m.board_nr, m.position) for m in moves])
+
+
+class LockRetryTest(SimpleTestCase):
+
+    def _flaky(self, errors):
+        calls = []
+
+        def operation():
+            calls.append(1)
+            if errors:
+                raise errors.pop(0)
+            return 'ok'
+        return calls, db.retry_on_lock(operation)
+
+    @mock.patch('ttt.db.time.sleep')
+    def test_retries_lock_errors_with_backoff(self, sleep):
+        calls, operation = self._flaky([OperationalError('database is locked')] * 2)
+        self.assertEqual(operation(), 'ok')
+        self.assertEqual(len(calls), 3)
+        delays = [c.args[0] for c in sleep.call_args_list]
+        self.assertTrue(0 <= delays[0] <= db.LOCK_RETRY_BASE_DELAY)
+        self.assertTrue(0 <= delays[1] <= 2 * db.LOCK_RETRY_BASE_DELAY)
+
+    @mock.patch('ttt.db.time.sleep')
+    @override_settings(TTT_DB_LOCK_RETRIES=3)
+    def test_gives_up(self, sleep):
+        calls, operation = self._flaky([OperationalError('database is locked')] * 5)
+        with self.assertRaises(OperationalError):
+            operation()
+        self.assertEqual(len(calls), 3)
+
+    @mock.patch('ttt.db.time.sleep')
+    def test_other_errors_are_not_retried(self, sleep):
+        calls, operation = self._flaky([OperationalError('no such table: ttt_game')])
+        with self.assertRaises(OperationalError):
+            operation()
+        self.assertEqual(len(calls), 1)
+        with mock.patch.object(connection, 'in_atomic_block', True):
+            calls, operation = self._flaky([OperationalError('database is locked')])
+            with self.assertRaises(OperationalError):
+                operation()
+        self.assertEqual(len(calls), 1)
+
+
+@override_settings(TTT_REPLICA_DATABASE='replica')
+class ReplicaTest(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        game_cache.clear()
+        cache.clear()
+        self.u1 = User.objects.create_user("u1", "u1@example.com", "haslo123")
+        self.u2 = User.objects.create_user("u2", "u2@example.com", "haslo123")
+        self.session = core.invite(self.u1, self.u2)
+        self.game = core.create_game(self.session)
+        cache.clear()
+
+    def _replicate(self):
+        # kopia calej bazy glownej - replika bez opoznienia
+        for alias in ('default', 'replica'):
+            connections[alias].ensure_connection()
+        connections['default'].connection.backup(connections['replica'].connection)
+
+    def test_game_reads_use_replica(self):
+        self.assertIsNone(core.get_game(self.session.external_id, self.game.id))
+        self._replicate()
+        game = core.get_game(self.session.external_id, self.game.id)
+        self.assertEqual(game._state.db, 'replica')
+
+        game_cache.clear()
+        core.update_game(self.game.id, self.u1, 5, 5)
+        # zapis idzie do bazy glownej, replika jeszcze go nie ma
+        self.assertEqual(Move.objects.using('default').filter(game=self.game).count(), 1)
+        self.assertEqual(core.get_game_moves(game), [])
+        self._replicate()
+        self.assertEqual(len(core.get_game_moves(game)), 1)
+
+    def test_running_games_use_replica(self):
+        self._replicate()
+        self.assertEqual([game._state.db for game in core.get_running_user_games(self.u1)], ['replica'])
+
+    def test_computer_move_sticks_human(self):
+        game = core.create_game(core.invite_computer_player(self.u1))
+        computer = core.get_computer_player(game)
+        cache.clear()
+        if core.is_first_player(game, computer):
+            core.update_game(game.id, computer, 5, 5)
+        else:
+            core.update_game(game.id, self.u1, 5, 5)
+            cache.clear()
+            core.update_game(game.id, computer, 5, 1)
+        self.assertTrue(db.is_sticky(self.u1.id))
+
+    def test_read_your_writes(self):
+        self._replicate()
+        url = reverse('game_state', args=[self.session.external_id, self.game.id])
+        self.client.force_login(self.u1)
+        self.client.post(
+            reverse('game_details', args=[self.session.external_id, self.game.id]),
+            json.dumps({'boardNr': 5, 'position': 5}), content_type='application/json'
+        )
+        self.assertEqual(len(self.client.get(url).json()['moves']), 1)
+
+        # przeciwnik (np. po zdarzeniu move) tez czyta z bazy glownej
+        game_cache.clear()
+        self.client.force_login(self.u2)
+        self.assertEqual(len(self.client.get(url).json()['moves']), 1)
+
+        # po czasie TTT_REPLICA_STICKY_SECONDS - znowu replika
+        cache.delete(db._sticky_key(self.u2.id))
+        game_cache.clear()
+        self.assertEqual(self.client.get(url).json()['moves'], [])
+        self._replicate()
+        game_cache.clear()
+        self.assertEqual(len(self.client.get(url).json()['moves']), 1)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'SQLite pragmas')
+class SQLitePragmasTest(TestCase):
+
+    def test_connection_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.TTT_SQLITE_PRAGMAS['busy_timeout'])
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite specific')
+class QueryPlanTest(TestCase):
+
+    def setUp(self):
+        game_cache.clear()
+        self.u1 = User.objects.create_user("u1", "u1@example.com", "haslo123")
+        self.u2 = User.objects.create_user("u2", "u2@example.com", "haslo123")
+        self.session = core.invite(self.u1, self.u2)
+        self.game = core.create_game(self.session)
+        core.update_game(self.game.id, self.game.cross_player, 5, 5)
+
+    def assertIndexedPlans(self, func, *args, indexes=(), allow_sort=False):
+        """Plan kazdego SELECT-a wykonanego przez func: bez pelnego skanu tabel
+        ttt_*, bez sortowania w pamieci (chyba ze allow_sort), z uzyciem indexes."""
+        with CaptureQueriesContext(connection) as queries:
+            result = func(*args)
+            if hasattr(result, '__iter__'):
+                list(result)
+        selects = [q['sql'] for q in queries if q['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        used = []
+        for sql in selects:
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                details = [row[-1] for row in cursor.fetchall()]
+            used.extend(details)
+            bad = [
+                d for d in details
+                if d.startswith('SCAN') and 'ttt_' in d or not allow_sort and 'TEMP B-TREE' in d
+            ]
+            self.assertEqual(bad, [], '{}\n{}'.format(sql, details))
+        for index in indexes:
+            self.assertTrue(any(index in d for d in used), '{} not used:\n{}'.format(index, used))
+
+    def test_running_games(self):
+        # OR na dwoch indeksach - wyniki i tak trzeba posortowac
+        self.assertIndexedPlans(
+            core.get_running_user_games, self.u1,
+            indexes=['game_running_cross_idx', 'game_running_circle_idx'], allow_sort=True
+        )
+
+    def test_create_game(self):
+        Game.objects.filter(id=self.game.id).update(result=ttt.CROSS_SYMBOL)
+        self.assertIndexedPlans(core.create_game, self.session, indexes=['game_session_created_idx'])
+
+    def test_game_queries(self):
+        external_id = self.session.external_id
+        self.assertIndexedPlans(core.get_game_or_create, external_id, self.u2)
+        # first() sortuje po id, ale wyszukiwanie po kluczu glownym daje jeden wiersz
+        self.assertIndexedPlans(core.get_game, external_id, self.game.id, allow_sort=True)
+        self.assertIndexedPlans(core.play_computer_turn, self.game.id)
+
+    def test_move_queries(self):
+        # indeks klucza obcego (z rowid na koncu) - bez sortowania po id
+        fk_index = 'ttt_move_game_id_491a3f5d'
+        self.assertIndexedPlans(core.get_game_moves, self.game, indexes=[fk_index])
+        self.assertIndexedPlans(core.get_game_moves_since, self.game, 0, indexes=[fk_index])
+
+
+class MoveLogTest(TestCase):
+
+    def setUp(self):
+        game_cache.clear()
+        self.u1 = User.objects.create_user("u1", "u1@example.com", "haslo123")
+        self.u2 = User.objects.create_user("u2", "u2@example.com", "haslo123")
+        self.session = core.invite(self.u1, self.u2)
+
+    def _play(self, game, moves):
+        players = {ttt.CROSS_SYMBOL: game.cross_player, ttt.CIRCLE_SYMBOL: game.circle_player}
+        for m in moves:
+            core.update_game(game.id, players[m.value], m.board_nr, m.position)
+        return Game.objects.get(id=game.id)
+
+    def _values(self, moves):
+        return [(m.board_nr, m.position, m.value) for m in moves]
+
+    def test_log_matches_rows(self):
+        moves = testing.random_game(random.Random(4))
+        with override_settings(TTT_MOVE_STORAGE=core.MOVE_STORAGE_DUAL):
+            game = self._play(core.create_game(self.session), moves)
+        rows = list(Move.objects.filter(game=game).order_by('id'))
+        self.assertEqual(len(game.move_log), len(moves))
+        self.assertEqual(self._values(core.get_game_moves(game)), self._values(rows))
+        self.assertEqual(self._values(core.get_game_moves_since(game, 3)), self._values(rows[3:]))
+
+    @override_settings(TTT_MOVE_STORAGE=core.MOVE_STORAGE_LOG)
+    def test_log_storage_writes_no_rows(self):
+        moves = testing.random_game(random.Random(5))
+        game = self._play(core.create_game(self.session), moves[:10])
+        self.assertFalse(Move.objects.filter(game=game).exists())
+        # blokada gry i zapis Game (+ savepoint testu), bez zapisu ruchow
+        move = moves[10]
+        user = game.cross_player if move.value == ttt.CROSS_SYMBOL else game.circle_player
+        with self.assertNumQueries(4):
+            core.update_game(game.id, user, move.board_nr, move.position)
+        self.assertEqual(len(game.move_log) + 1, len(Game.objects.get(id=game.id).move_log))
+
+    def test_pack_finished_games(self):
+        game = self._play(core.create_game(self.session), testing.random_game(random.Random(6)))
+        expected = self._values(core.get_game_moves(game))
+        core.get_game(self.session.external_id, game.id)
+
+        call_command('pack_move_logs', '--delete-rows', stdout=io.StringIO())
+        self.assertFalse(Move.objects.filter(game=game).exists())
+        game = core.get_game(self.session.external_id, game.id)
+        self.assertIsNotNone(game.move_log)
+        self.assertEqual(self._values(core.get_game_moves(game)), expected)
+
+
+class ArchiveTest(TestCase):
+
+    def setUp(self):
+        game_cache.clear()
+        self.u1 = User.objects.create_user("u1", "u1@example.com", "haslo123")
+        self.u2 = User.objects.create_user("u2", "u2@example.com", "haslo123")
+        self.session = core.invite(self.u1, self.u2)
+
+    def _finished_game(self, seed):
+        game = core.create_game(self.session)
+        players = {ttt.CROSS_SYMBOL: game.cross_player, ttt.CIRCLE_SYMBOL: game.circle_player}
+        for m in testing.random_game(random.Random(seed)):
+            core.update_game(game.id, players[m.value], m.board_nr, m.position)
+        return Game.objects.get(id=game.id)
+
+    def _archive(self, *args):
+        call_command('archive_games', '--finished-days', '0', *args, stdout=io.StringIO())
+
+    def test_archived_game_is_readable(self):
+        game = self._finished_game(7)
+        moves = [(m.board_nr, m.position, m.value) for m in core.get_game_moves(game)]
+        core.get_game(self.session.external_id, game.id)
+
+        self._archive()
+        self.assertFalse(Game.objects.filter(id=game.id).exists())
+        self.assertFalse(Move.objects.filter(game_id=game.id).exists())
+        self.assertTrue(ArchivedGame.objects.filter(id=game.id).exists())
+
+        archived = core.get_game(self.session.external_id, game.id)
+        self.assertEqual(archived.result, game.result)
+        self.assertEqual(archived.version, game.version)
+        self.assertEqual(archived.board, game.board)
+        self.assertEqual(
+            (archived.last_cross_cell, archived.last_circle_cell, archived.next_board_nr),
+            (game.last_cross_cell, game.last_circle_cell, game.next_board_nr)
+        )
+        self.assertEqual([(m.board_nr, m.position, m.value) for m in core.get_game_moves(archived)], moves)
+        self.assertIsNone(core.get_game('wrong', game.id))
+
+        self.client.force_login(self.u1)
+        url = reverse('game_details', args=[self.session.external_id, game.id])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.post(url, {'boardNr': 1, 'position': 1}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_new_game_after_archive_swaps_players(self):
+        game = self._finished_game(8)
+        self._archive()
+        new_game = core.create_game(self.session)
+        self.assertEqual(new_game.cross_player_id, game.circle_player_id)
+
+    def test_keeps_running_games(self):
+        game = core.create_game(self.session)
+        core.update_game(game.id, game.cross_player, 5, 5)
+        self._archive()
+        self.assertTrue(Game.objects.filter(id=game.id).exists())
+        self._archive('--abandoned-days', '0')
+        self.assertFalse(Game.objects.filter(id=game.id).exists())
+        self.assertIsNone(core.get_game(self.session.external_id, game.id).result)
+
+    def test_abandoned_by_last_move(self):
+        game = core.create_game(self.session)
+        Game.objects.filter(id=game.id).update(created_at=timezone.now() - timedelta(days=60))
+        core.update_game(game.id, game.cross_player, 5, 5)
+        self._archive('--abandoned-days', '30')
+        self.assertTrue(Game.objects.filter(id=game.id).exists())
+
+        Game.objects.filter(id=game.id).update(updated_at=timezone.now() - timedelta(days=31))
+        self._archive('--abandoned-days', '30')
+        self.assertFalse(Game.objects.filter(id=game.id).exists())
+
+    def test_finished_games_by_last_move(self):
+        game = self._finished_game(9)
+        Game.objects.filter(id=game.id).update(created_at=timezone.now() - timedelta(days=2))
+        call_command('archive_games', '--finished-days', '1', stdout=io.StringIO())
+        self.assertTrue(Game.objects.filter(id=game.id).exists())
+
+        Game.objects.filter(id=game.id).update(updated_at=timezone.now() - timedelta(days=2))
+        call_command('archive_games', '--finished-days', '1', stdout=io.StringIO())
+        self.assertFalse(Game.objects.filter(id=game.id).exists())
+
+    def test_update_missing_game(self):
+        game = core.create_game(self.session)
+        with self.assertRaises(Game.DoesNotExist):
+            core.update_game(game.id + 1000, self.u1, 5, 5)
+        self._archive('--abandoned-days', '0')
+        with self.assertRaisesMessage(core.GameError, 'archived'):
+            core.update_game(game.id, game.cross_player, 5, 5)
+
+    def test_archived_unfinished_game_is_read_only(self):
+        game = core.create_game(self.session)
+        core.update_game(game.id, game.cross_player, 5, 5)
+        self._archive('--abandoned-days', '0')
+
+        self.client.force_login(game.circle_player)
+        state = self.client.get(reverse('game_details', args=[self.session.external_id, game.id])).context['game']
+        self.assertTrue(state['archived'])
+        self.assertFalse(state['is_your_move'])
+        self.assertEqual(state['legal'], [])
+
+    def test_polled_game_state_changes_after_archive(self):
+        game = core.create_game(self.session)
+        core.update_game(game.id, game.cross_player, 5, 5)
+        self.client.force_login(game.circle_player)
+        url = reverse('game_state', args=[self.session.external_id, game.id])
+        etag = self.client.get(url)['ETag']
+
+        self._archive('--abandoned-days', '0')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['archived'])
+        self.assertEqual(response.json()['legal_moves'], [])
+
+
+class MetricsTest(TestCase):
+
+    def setUp(self):
+        metrics.registry.reset()
+        game_cache.clear()
+        self.user = User.objects.create_user("u1", "u1@example.com", "haslo123")
+        self.client.force_login(self.user)
+
+    def test_request_latency_and_queries_per_view(self):
+        self.client.get(reverse('index'))
+        self.client.get(reverse('index'))
+        self.assertEqual(metrics.request_duration.count(view='index', method='GET', status=200), 2)
+        self.assertEqual(metrics.request_db_queries.count(view='index'), 2)
+
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('ttt_request_duration_seconds_count{view="index",method="GET",status="200"} 2', body)
+        self.assertIn('ttt_request_db_queries_bucket{view="index",le="+Inf"} 2', body)
+        self.assertIn('# TYPE ttt_bot_search_seconds histogram', body)
+
+    @override_settings(TTT_BOT_ENGINE=core.BOT_ENGINE_ALPHABETA, TTT_BOT_TIME_LIMIT=0.01)
+    def test_bot_search_time(self):
+        session = core.invite_computer_player(self.user)
+        game = core.create_game(session)
+        if not core.play_computer_turn(game.id):
+            core.update_game(game.id, self.user, 5, 5)
+            core.play_computer_turn(game.id)
+        self.assertEqual(metrics.bot_search_duration.count(engine=core.BOT_ENGINE_ALPHABETA), 1)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('h', 'test', buckets=(1, 2))
+        for value in (0.5, 1.5, 1.7, 3):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.samples()), [
+            ('h_bucket{le="1"}', 1),
+            ('h_bucket{le="2"}', 3),
+            ('h_bucket{le="+Inf"}', 4),
+            ('h_sum', 6.7),
+            ('h_count', 4),
+        ])
+
+
+@override_settings(ROOT_URLCONF='TicTacToe.asgi_urls', TTT_BOT_WORKERS=0,
+                   TTT_BOT_ENGINE=core.BOT_ENGINE_ALPHABETA, TTT_BOT_TIME_LIMIT=0.05)
+class AsyncViewsTest(TransactionTestCase):
+    # ruch komputera liczy sie w innym watku (bot_worker.submit_async), wiec dane musza byc zatwierdzone
+
+    def setUp(self):
+        game_cache.clear()
+        self.user = User.objects.create_user("u1", "u1@example.com", "haslo123")
+
+    def _request(self, method, *args, **kwargs):
+        async def request():
+            return await getattr(self.async_client, method)(*args, **kwargs)
+        return async_to_sync(request)()
+
+    def _get(self, url):
+        return self._request('get', url)
+
+    def test_requires_login(self):
+        session = core.invite_computer_player(self.user)
+        response = self._get(reverse('current_game', args=[session.external_id]))
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(str(settings.LOGIN_URL)))
+
+    def test_game_against_computer(self):
+        session = core.invite_computer_player(self.user)
+        self.async_client.force_login(self.user)
+        response = self._get(reverse('current_game', args=[session.external_id]))
+        self.assertEqual(response.status_code, 302)
+        url = response['Location']
+        game = Game.objects.get(session=session)
+
+        self.assertEqual(self._get(url).status_code, 200)
+        if core.is_first_player(game, self.user):
+            response = self._request(
+                'post', url, json.dumps({'boardNr': 5, 'position': 5}), content_type='application/json')
+            self.assertEqual(response.json(), {'bot': bot_worker.STATUS_DONE})
+            response = self._request(
+                'post', url, json.dumps({'boardNr': 5, 'position': 5}), content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+        moves = core.get_game_moves(game)
+        computer = core.get_computer_player(game)
+        self.assertEqual(moves[-1].value, core.get_player_symbol(game, computer))
+
+
+class BenchmarkTest(TestCase):
+
+    def test_compare_flags_regressions(self):
+        baseline = {'a': {'ops_per_sec': 100.0}, 'b': {'ops_per_sec': 100.0}}
+        results = {'a': {'ops_per_sec': 85.0}, 'b': {'ops_per_sec': 70.0}}
+        self.assertEqual(testing.compare(results, baseline, tolerance=0.2), [('b', 70.0, 100.0)])
+
+    def test_seeded_minimax_is_reproducible(self):
+        board = ttt.init_board()
+        ttt.seed_random(3)
+        first = [ttt.minimax(board, 9, ttt.CROSS_SYMBOL, ttt.CROSS_SYMBOL, ttt.CIRCLE_SYMBOL) for _ in range(5)]
+        ttt.seed_random(3)
+        second = [ttt.minimax(board, 9, ttt.CROSS_SYMBOL, ttt.CROSS_SYMBOL, ttt.CIRCLE_SYMBOL) for _ in range(5)]
+        self.assertEqual(first, second)
+
+    def test_rendered_scenario_parses_back(self):
+        moves = testing.random_game(random.Random(2))[:40]
+        steps = parser.parse_steps(parser.render_scenario(moves))
+        self.assertEqual([(s['board_nr'], s['position'], s['symbol']) for s in steps], [tuple(m) for m in moves])
+
+    def test_load_stats_summary(self):
+        stats = testing.Stats()
+        for ms in (1, 3, 8, 40, 3000):
+            stats.record('GET game_state', ms / 1000)
+        stats.record('bot move', 0.2)
+        summary = stats.summary(elapsed=1.0)
+        self.assertEqual(summary['requests'], 5)
+        latency = summary['latency']['GET game_state']
+        self.assertEqual(latency['p50_ms'], 8)
+        self.assertEqual(latency['histogram_ms']['<=5'], 1)
+        self.assertEqual(latency['histogram_ms']['<=5000'], 1)
+        self.assertEqual(summary['latency']['bot move']['count'], 1)
+
+    def test_load_stats_count_busy_responses(self):
+        stats = testing.Stats()
+        stats.count_error('POST game_details', OperationalError('database is locked'))
+        stats.count_error('POST game_details', testing.ResponseError(503))
+        stats.count_error('POST game_details', testing.ResponseError(400))
+        summary = stats.summary(elapsed=1.0)
+        self.assertEqual(summary['lock_errors'], 2)
+        self.assertEqual(summary['errors'], {'POST game_details: HTTP 400': 1})
@@ -1,6 +1,7 @@
-from random import choice
+import json
+from random import Random
 from math import inf
-from copy import deepcopy
+from pathlib import Path
 
 CROSS_SYMBOL = 'X'
 CIRCLE_SYMBOL = 'O'
@@ -14,6 +15,9 @@ MAIN_BOARD_NR = 0
 MIN_BOARD_NR = 0
 MAX_BOARD_NR = 9
 
+# losowy pierwszy ruch w minimax; seed_random() daje powtarzalne wyniki
+_random = Random()
+
 LINES = [
     [1, 2, 3],
     [4, 5, 6],
@@ -27,6 +31,33 @@ LINES = [
     [7, 5, 3]
 ]
 
+FULL_MASK = (1 << BOARD_SIZE) - 1
+
+
+def pos_bit(pos):
+    return 1 << (pos - 1)
+
+
+WIN_MASKS = [pos_bit(a) | pos_bit(b) | pos_bit(c) for a, b, c in LINES]
+
+# _WINNING[mask] mowi czy maska zawiera pelna linie
+_WINNING = [
+    any(mask & win == win for win in WIN_MASKS)
+    for mask in range(FULL_MASK + 1)
+]
+
+_POPCOUNT = [bin(mask).count('1') for mask in range(FULL_MASK + 1)]
+
+# wolne pola (pozycje) dla kazdej maski zajetych pol
+_FREE_POSITIONS = [
+    tuple(pos for pos in range(MIN_POS, MAX_POS + 1) if not mask & pos_bit(pos))
+    for mask in range(FULL_MASK + 1)
+]
+
+
+def seed_random(seed):
+    _random.seed(seed)
+
 
 def is_symbol(s):
     return s == CIRCLE_SYMBOL or s == CROSS_SYMBOL
@@ -46,11 +77,58 @@ def is_result(s):
     return s == DRAW or is_symbol(s)
 
 
+def to_mask(board, value):
+    mask = 0
+    for pos, v in board.items():
+        if v == value:
+            mask |= pos_bit(pos)
+    return mask
+
+
+def to_masks(board):
+    """Zwraca (maska X, maska O, maska zajetych pol) dla planszy-slownika."""
+    cross = circle = filled = 0
+    for pos, v in board.items():
+        if v is not None:
+            bit = pos_bit(pos)
+            filled |= bit
+            if v == CROSS_SYMBOL:
+                cross |= bit
+            elif v == CIRCLE_SYMBOL:
+                circle |= bit
+    return cross, circle, filled
+
+
+def is_win_mask(mask):
+    return _WINNING[mask]
+
+
+def popcount(mask):
+    return _POPCOUNT[mask]
+
+
+def free_positions(filled):
+    """Wolne pozycje planszy o masce zajetych pol filled (krotka, bez skanowania)."""
+    return _FREE_POSITIONS[filled]
+
+
+def mask_positions(mask):
+    return [pos for pos in range(MIN_POS, MAX_POS + 1) if mask & pos_bit(pos)]
+
+
+def masks_result(cross, circle, filled):
+    if _WINNING[cross]:
+        return CROSS_SYMBOL
+    elif _WINNING[circle]:
+        return CIRCLE_SYMBOL
+    elif filled == FULL_MASK:
+        return DRAW
+    else:
+        return None
+
+
 def _is_line(board, symbol):
-    for a, b, c in LINES:
-        if board.get(a) == board.get(b) == board.get(c) == symbol:
-            return True
-    return False
+    return _WINNING[to_mask(board, symbol)]
 
 
 def is_mini_board_nr(board_nr):
@@ -65,14 +143,7 @@ def is_board(board_nr):
 
 
 def get_board_result(board):
-    if _is_line(board, CROSS_SYMBOL):
-        return CROSS_SYMBOL
-    elif _is_line(board, CIRCLE_SYMBOL):
-        return CIRCLE_SYMBOL
-    elif None not in list(board.values()):
-        return DRAW
-    else:
-        return None
+    return masks_result(*to_masks(board))
 
 def init_board():
     return {pos: None for pos in range(MIN_POS, MAX_POS + 1)}
@@ -123,6 +194,10 @@ def to_rows(values, row_size):
     return rows
 
 
+# uklad pol strony gry (wiersze po 9 par (board_nr, pos)), taki sam dla kazdej gry
+BOARD_ROWS = to_rows(all_boards_positions(), row_size=9)
+
+
 def to_boards(moves):
     boards = {board_nr: init_board() for board_nr in
               range(MIN_BOARD_NR, MAX_BOARD_NR + 1)}
@@ -131,6 +206,65 @@ def to_boards(moves):
     return boards
 
 
+# Zapis wszystkich plansz gry w jednym napisie: 81 pol mini-plansz
+# (plansza 1 pole 1, plansza 1 pole 2, ...) i 9 pol planszy glownej.
+EMPTY_CELL = '.'
+DRAW_CELL = 'D'
+MAIN_BOARD_OFFSET = MAX_BOARD_NR * BOARD_SIZE
+SNAPSHOT_SIZE = MAIN_BOARD_OFFSET + BOARD_SIZE
+
+
+def snapshot_index(board_nr, pos):
+    if board_nr == MAIN_BOARD_NR:
+        return MAIN_BOARD_OFFSET + pos - 1
+    return (board_nr - 1) * BOARD_SIZE + pos - 1
+
+
+def snapshot_cell(index):
+    """Odwrotnosc snapshot_index: zwraca (board_nr, pos)."""
+    if index >= MAIN_BOARD_OFFSET:
+        return MAIN_BOARD_NR, index - MAIN_BOARD_OFFSET + 1
+    return index // BOARD_SIZE + 1, index % BOARD_SIZE + 1
+
+
+def empty_snapshot():
+    return EMPTY_CELL * SNAPSHOT_SIZE
+
+
+def to_snapshot_value(value):
+    if value is None:
+        return EMPTY_CELL
+    elif value == DRAW:
+        return DRAW_CELL
+    return value
+
+
+def from_snapshot_value(value):
+    if value == EMPTY_CELL:
+        return None
+    elif value == DRAW_CELL:
+        return DRAW
+    return value
+
+
+def to_snapshot(boards):
+    cells = [EMPTY_CELL] * SNAPSHOT_SIZE
+    for board_nr, board in boards.items():
+        for pos, value in board.items():
+            cells[snapshot_index(board_nr, pos)] = to_snapshot_value(value)
+    return ''.join(cells)
+
+
+def snapshot_to_boards(snapshot):
+    boards = {board_nr: init_board() for board_nr in
+              range(MIN_BOARD_NR, MAX_BOARD_NR + 1)}
+    for index, value in enumerate(snapshot):
+        if value != EMPTY_CELL:
+            board_nr, pos = snapshot_cell(index)
+            boards[board_nr][pos] = from_snapshot_value(value)
+    return boards
+
+
 def next_board_nr(moves):
     for m in moves[::-1]:
         if m.board_nr != MAIN_BOARD_NR:
@@ -138,55 +272,73 @@ def next_board_nr(moves):
     return None
 
 
+# Zwarty zapis historii ruchow: jeden bajt na ruch gracza (snapshot_index pola),
+# symbole na przemian od X. Wyniki mini-plansz (ruchy na planszy glownej)
+# nie sa zapisywane, decode_move_log odtwarza je z ruchow graczy.
+def encode_move_log(moves):
+    return bytes(snapshot_index(m.board_nr, m.position) for m in moves if m.board_nr != MAIN_BOARD_NR)
+
+
+def decode_move_log(data):
+    """Zwraca liste (board_nr, pos, value) w kolejnosci ruchow, jak w Move."""
+    boards = {board_nr: init_board() for board_nr in
+              range(MIN_BOARD_NR, MAX_BOARD_NR + 1)}
+    moves = []
+    symbol = CROSS_SYMBOL
+    for index in data:
+        board_nr, pos = snapshot_cell(index)
+        board = boards[board_nr]
+        board[pos] = symbol
+        moves.append((board_nr, pos, symbol))
+        result = get_board_result(board)
+        if result:
+            boards[MAIN_BOARD_NR][board_nr] = result
+            moves.append((MAIN_BOARD_NR, board_nr, result))
+        symbol = next_symbol(symbol)
+    return moves
+
+
+def _pos_to_row_col(pos):
+    return (pos - 1) // 3, (pos - 1) % 3
+
+
 def _get_empty_cells(board):
-    cells = []
-    for pos, val in board.items():
-        if val is None:
-            row = (pos - 1) // 3
-            col = (pos - 1) % 3
-            cells.append((row, col))
-    return cells
+    return [_pos_to_row_col(pos) for pos, val in board.items() if val is None]
 
 
-def _heuristic(board, depth, comp_symbol, human_symbol):
-    if _is_line(board, comp_symbol):
+def _heuristic(comp, human, depth):
+    if _WINNING[comp]:
         score = depth + 1
-    elif _is_line(board, human_symbol):
+    elif _WINNING[human]:
         score = -(depth + 1)
     else:
         score = 0
     return score
 
 
-def minimax(board, depth: int, player, comp_symbol, human_symbol):
-    if depth == 9:
-        row = choice([0, 1, 2])
-        col = choice([0, 1, 2])
-        return [row, col, 0]
+def _minimax(comp, human, filled, depth, comp_move):
+    if depth == 0 or _WINNING[comp] or _WINNING[human]:
+        return [-1, -1, _heuristic(comp, human, depth)]
 
-    if player == comp_symbol:
+    if comp_move:
         best = [-1, -1, -inf]
     else:
         best = [-1, -1, inf]
 
-    if depth == 0 or _is_line(board, comp_symbol) or _is_line(board, human_symbol):
-        score = _heuristic(board, depth, comp_symbol, human_symbol)
-        return [-1, -1, score]
-
-    for row, col in _get_empty_cells(board):
-        pos = _row_col_to_pos(row, col)
-        previous = board[pos]
-        board[pos] = player
-        result = minimax(board, depth - 1, next_symbol(player), comp_symbol, human_symbol)
-        board[pos] = previous
-        result[0], result[1] = row, col
-
-        if player == comp_symbol:
+    for pos in range(MIN_POS, MAX_POS + 1):
+        bit = pos_bit(pos)
+        if filled & bit:
+            continue
+        if comp_move:
+            result = _minimax(comp | bit, human, filled | bit, depth - 1, False)
             if result[2] > best[2]:
                 best = result
+                best[0], best[1] = _pos_to_row_col(pos)
         else:
+            result = _minimax(comp, human | bit, filled | bit, depth - 1, True)
             if result[2] < best[2]:
                 best = result
+                best[0], best[1] = _pos_to_row_col(pos)
 
     return best
 
@@ -196,14 +348,16 @@ def _is_symbol(x):
 
 
 def _is_full(board):
-    return 9 == sum([1 for v in board.values() if _is_symbol(v)])
+    cross, circle, _ = to_masks(board)
+    return cross | circle == FULL_MASK
 
 
 def _is_playable(board):
+    cross, circle, _ = to_masks(board)
     return (
-        not _is_full(board) and
-        not _is_line(board, CIRCLE_SYMBOL) and
-        not _is_line(board, CROSS_SYMBOL)
+        cross | circle != FULL_MASK and
+        not _WINNING[circle] and
+        not _WINNING[cross]
     )
 
 
@@ -212,6 +366,158 @@ def _row_col_to_pos(row, col):
     return index + 1
 
 
+# Tablica rozwiazan dla planszy 3x3. Pozycja jest opisana z perspektywy
+# gracza, ktory ma ruch: (maska gracza, maska przeciwnika, maska zajetych pol).
+# Pola zajete przez DRAW (plansza glowna) sa zajete, ale nie naleza do nikogo.
+# Dla kazdej pozycji kanonicznej (najmniejszej z 8 symetrii) trzymamy wyniki
+# wszystkich ruchow, wiec wybor ruchu jest identyczny jak w pelnym minimaxie.
+
+SOLUTIONS_PATH = Path(__file__).resolve().parent / 'solutions.json'
+
+_SYMMETRIES = [
+    lambda r, c: (r, c),
+    lambda r, c: (c, 2 - r),
+    lambda r, c: (2 - r, 2 - c),
+    lambda r, c: (2 - c, r),
+    lambda r, c: (r, 2 - c),
+    lambda r, c: (2 - r, c),
+    lambda r, c: (c, r),
+    lambda r, c: (2 - c, 2 - r),
+]
+
+# _SYMMETRY_POS[t][pos] - pozycja, na ktora symetria t przenosi pos
+_SYMMETRY_POS = [
+    [None] + [_row_col_to_pos(*sym(*_pos_to_row_col(pos))) for pos in range(MIN_POS, MAX_POS + 1)]
+    for sym in _SYMMETRIES
+]
+
+_SYMMETRY_MASK = [
+    [
+        sum(pos_bit(perm[pos]) for pos in range(MIN_POS, MAX_POS + 1) if mask & pos_bit(pos))
+        for mask in range(FULL_MASK + 1)
+    ]
+    for perm in _SYMMETRY_POS
+]
+
+_solutions = None
+
+
+def _canonical(mover, other, filled):
+    best_key = None
+    best_sym = None
+    for sym, table in enumerate(_SYMMETRY_MASK):
+        key = (table[mover], table[other], table[filled])
+        if best_key is None or key < best_key:
+            best_key, best_sym = key, sym
+    return best_key, best_sym
+
+
+def _solve(key):
+    solutions = get_solutions()
+    scores = solutions.get(key)
+    if scores is not None:
+        return scores
+
+    mover, other, filled = key
+    scores = [None] * BOARD_SIZE
+    for pos in range(MIN_POS, MAX_POS + 1):
+        bit = pos_bit(pos)
+        if filled & bit:
+            continue
+        child_filled = filled | bit
+        depth = BOARD_SIZE - _POPCOUNT[child_filled]
+        if _WINNING[mover | bit]:
+            score = depth + 1
+        elif depth == 0:
+            score = 0
+        else:
+            child_key, _ = _canonical(other, mover | bit, child_filled)
+            score = -max(s for s in _solve(child_key) if s is not None)
+        scores[pos - 1] = score
+
+    solutions[key] = scores
+    return scores
+
+
+def solved_move(mover, other, filled):
+    """Zwraca (pos, wynik) najlepszego ruchu z perspektywy gracza, ktory ma ruch.
+
+    Pozycja nie moze byc koncowa (linia lub brak wolnych pol).
+    """
+    key, sym = _canonical(mover, other, filled)
+    scores = _solve(key)
+    perm = _SYMMETRY_POS[sym]
+    best_pos, best_score = None, -inf
+    for pos in range(MIN_POS, MAX_POS + 1):
+        score = scores[perm[pos] - 1]
+        if score is not None and score > best_score:
+            best_pos, best_score = pos, score
+    return best_pos, best_score
+
+
+def get_solutions():
+    global _solutions
+    if _solutions is None:
+        _solutions = load_solutions(SOLUTIONS_PATH)
+    return _solutions
+
+
+def load_solutions(path):
+    try:
+        with open(path) as f:
+            rows = json.load(f)
+    except FileNotFoundError:
+        return {}
+    return {tuple(row[:3]): row[3:] for row in rows}
+
+
+def build_solutions():
+    """Rozwiazuje wszystkie niekoncowe pozycje planszy bez pol DRAW."""
+    for code in range(3 ** BOARD_SIZE):
+        mover = other = 0
+        for pos in range(MIN_POS, MAX_POS + 1):
+            code, v = divmod(code, 3)
+            if v == 1:
+                mover |= pos_bit(pos)
+            elif v == 2:
+                other |= pos_bit(pos)
+        filled = mover | other
+        if filled != FULL_MASK and not _WINNING[mover] and not _WINNING[other]:
+            _solve(_canonical(mover, other, filled)[0])
+    return get_solutions()
+
+
+def save_solutions(path, solutions):
+    rows = sorted(list(key) + scores for key, scores in solutions.items())
+    with open(path, 'w') as f:
+        json.dump(rows, f, separators=(',', ':'))
+
+
+def minimax(board, depth: int, player, comp_symbol, human_symbol):
+    if depth == 9:
+        row = _random.choice([0, 1, 2])
+        col = _random.choice([0, 1, 2])
+        return [row, col, 0]
+
+    comp = to_mask(board, comp_symbol)
+    human = to_mask(board, human_symbol)
+    filled = to_masks(board)[2]
+    if (
+            depth == 0 or
+            depth != BOARD_SIZE - _POPCOUNT[filled] or
+            _WINNING[comp] or _WINNING[human]
+    ):
+        return _minimax(comp, human, filled, depth, player == comp_symbol)
+
+    if player == comp_symbol:
+        pos, score = solved_move(comp, human, filled)
+    else:
+        pos, score = solved_move(human, comp, filled)
+        score = -score
+    row, col = _pos_to_row_col(pos)
+    return [row, col, score]
+
+
 def bot_turn(boards, comp_symbol, next_board_nr):
     human_symbol = next_symbol(comp_symbol)
 
@@ -220,7 +526,7 @@ def bot_turn(boards, comp_symbol, next_board_nr):
         board_nr = next_board_nr
     else:
         row, col, _ = minimax(
-            board=deepcopy(boards[MAIN_BOARD_NR]),
+            board=boards[MAIN_BOARD_NR],
             depth=len(_get_empty_cells(boards[MAIN_BOARD_NR])),
             player=comp_symbol,
             comp_symbol=comp_symbol,
@@ -231,7 +537,7 @@ def bot_turn(boards, comp_symbol, next_board_nr):
 
 
     row, col, _ = minimax(
-        board=deepcopy(mini_board),
+        board=mini_board,
         depth=len(_get_empty_cells(mini_board)),
         player=comp_symbol,
         comp_symbol=comp_symbol,
@@ -240,3 +546,7 @@ def bot_turn(boards, comp_symbol, next_board_nr):
     pos = _row_col_to_pos(row, col)
 
     return board_nr, pos
+
+
+if __name__ == '__main__':
+    save_solutions(SOLUTIONS_PATH, build_solutions())
@@ -1,20 +1,28 @@
+import functools
+import hashlib
 import json
 
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect
+from django.template.loader import get_template
 from django.urls import reverse
 from django.contrib.auth.models import User
 from django.contrib.auth import login as auth_login, logout as auth_logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.conf import settings
+from django.db import OperationalError
 from django.http.response import Http404, HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
 from django.views.decorators.csrf import csrf_exempt
 
-from ttt import core, ttt
+from ttt import core, ttt, db, bot_worker, metrics
 from ttt.forms import LoginForm, RegistrationForm, InvitationForm
-from ttt.serializers import serialized_moves, deserialized_user_move
+from ttt.serializers import compact_snapshot, snapshot_indices, serialized_move_log, deserialized_user_move
 
 
 # Create your views here.
+@db.replica_reads
 def index(request):
     if not request.user.is_authenticated:
         return render(request, 'index.html')
@@ -83,6 +91,22 @@ def invite_computer_player(request):
     return redirect(reverse('current_game', args=[session.external_id]))
 
 
+def _async_login_required(view):
+    """login_required dla widokow async (w Django 3.2 dekorator obsluguje tylko widoki sync)."""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        # request.user czyta sesje i uzytkownika z bazy
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+def _async_csrf_exempt(view):
+    view.csrf_exempt = True
+    return view
+
+
 @csrf_exempt
 @login_required
 def current_game(request, external_session_id):
@@ -92,6 +116,85 @@ def current_game(request, external_session_id):
     return redirect(reverse('game_details', args=[external_session_id, game.id]))
 
 
+@_async_csrf_exempt
+@_async_login_required
+async def current_game_async(request, external_session_id):
+    game = await sync_to_async(core.get_game_or_create)(external_session_id=external_session_id, user=request.user)
+    if game is None:
+        raise Http404()
+    return redirect(reverse('game_details', args=[external_session_id, game.id]))
+
+
+def _game_page_state(game, user):
+    """Stan gry, ktory app.js naklada na szkielet planszy (zwarty JSON)."""
+    player_symbol = core.get_player_symbol(game, user)
+    state = core.GameState(game)
+    return {
+        **compact_snapshot(game),
+        'version': game.version,
+        'result': game.result,
+        'your_symbol': player_symbol,
+        'archived': game.archived,
+        'is_your_move': core.is_running(game) and state.is_turn(player_symbol),
+        'legal': snapshot_indices(state.legal_moves(player_symbol)),
+    }
+
+
+def _is_computer_next(game):
+    return core.get_computer_player(game) is not None and core.is_running(game)
+
+
+def _is_computer_turn(game, state):
+    return _is_computer_next(game) and not state['is_your_move']
+
+
+@functools.lru_cache(maxsize=None)
+def _board_skeleton_version():
+    # po zmianie szablonu (nowe wdrozenie) fragment planszy ma nowy klucz w cache
+    source = get_template('game_session.html').template.source
+    return hashlib.md5(source.encode('utf-8')).hexdigest()[:12]
+
+
+def _render_game_page(request, external_session_id, state):
+    return render(request, 'game_session.html', {
+        'game': state,
+        # szablon siega po fields tylko przy pustym cache fragmentu planszy
+        'fields': ttt.BOARD_ROWS,
+        'skeleton_version': _board_skeleton_version(),
+        'external_session_id': external_session_id})
+
+
+def _parse_user_move(request):
+    """Ruch z body POST albo odpowiedz z bledem."""
+    try:
+        user_data = json.loads(request.body.decode('utf-8'))
+    except ValueError:
+        return None, JsonResponse({'error': 'invalid json'}, status=400)
+
+    try:
+        return deserialized_user_move(user_data), None
+    except ValueError as exc:
+        return None, JsonResponse({'error': str(exc)}, status=400)
+
+
+def _play_user_move(game, user, user_move):
+    """Zapisuje ruch gracza. Zwraca odpowiedz z bledem albo None."""
+    try:
+        core.update_game(game.id, user, **user_move)
+    except core.MoveError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    except core.GameError:
+        return JsonResponse({'error': 'ignored'}, status=400)
+    except OperationalError as exc:
+        if not db.is_lock_error(exc):
+            raise
+        # baza zajeta mimo ponowien (db.retry_on_lock) - klient moze wyslac ruch jeszcze raz
+        return JsonResponse({'error': 'busy'}, status=503)
+
+    game.refresh_from_db(fields=['result'])
+    return None
+
+
 @csrf_exempt
 @login_required
 def game_details(request, external_session_id, game_id):
@@ -100,53 +203,99 @@ def game_details(request, external_session_id, game_id):
         raise Http404()
 
     if request.method == 'GET':
-        moves = serialized_moves(core.get_game_moves(game))
-        player_symbol = core.get_player_symbol(game, request.user)
-        state = {
-            'moves': moves,
-            'result': game.result,
-            'your_symbol': player_symbol,
-            'is_your_move': core.is_player_move(moves, player_symbol)
-        }
-        fields = ttt.to_rows(ttt.all_boards_positions(), row_size=9)
-
-        computer_player = core.get_computer_player(game)
-        if (
-                computer_player is not None and
-                core.is_first_player(game, computer_player) and
-                core.is_new_game(game)
-        ):
-            core.update_game_by_computer(game, computer_player)
-
-        return render(request, 'game_session.html', {
-            'game': state,
-            'fields': fields,
-            'external_session_id': external_session_id})
+        state = _game_page_state(game, request.user)
+        if _is_computer_turn(game, state):
+            bot_worker.submit(game.id)
+        return _render_game_page(request, external_session_id, state)
+    else:
+        user_move, error = _parse_user_move(request)
+        if error is None:
+            error = _play_user_move(game, request.user, user_move)
+        if error is not None:
+            return error
+
+        if _is_computer_next(game):
+            bot_worker.submit(game.id)
+            return JsonResponse({'bot': bot_worker.status(game.id)}, status=200)
+
+        return JsonResponse({}, status=200)
+
+
+@_async_csrf_exempt
+@_async_login_required
+async def game_details_async(request, external_session_id, game_id):
+    """game_details dla ASGI: zapytania w sync_to_async, ruch komputera przez bot_worker.submit_async."""
+    game = await sync_to_async(core.get_game)(external_session_id, game_id)
+    if game is None:
+        raise Http404()
+
+    if request.method == 'GET':
+        state = _game_page_state(game, request.user)
+        if _is_computer_turn(game, state):
+            await bot_worker.submit_async(game.id)
+        # szablon moze siegac do bazy (np. sesja w context processors)
+        return await sync_to_async(_render_game_page)(request, external_session_id, state)
     else:
-        try:
-            user_data = json.loads(request.body.decode('utf-8'))
-        except ValueError:
-            return JsonResponse({'error': 'invalid json'}, status=400)
-
-        try:
-            user_move = deserialized_user_move(user_data)
-        except ValueError as exc:
-            return JsonResponse({'error': str(exc)}, status=400)
-
-        try:
-            core.update_game(game.id, request.user, **user_move)
-        except core.MoveError as exc:
-            return JsonResponse({'error': str(exc)}, status=400)
-        except core.GameError:
-            return JsonResponse({'error': 'ignored'}, status=400)
-
-        computer_player = core.get_computer_player(game)
-        if (
-                computer_player is not None and
-                game.result is None
-        ):
-            print('updating_by_computer')
-            core.update_game_by_computer(game, computer_player)
+        user_move, error = _parse_user_move(request)
+        if error is None:
+            error = await sync_to_async(_play_user_move)(game, request.user, user_move)
+        if error is not None:
+            return error
+
+        if _is_computer_next(game):
+            await bot_worker.submit_async(game.id)
+            return JsonResponse({'bot': bot_worker.status(game.id)}, status=200)
 
         return JsonResponse({}, status=200)
 
+
+def _game_state_etag(game, player_symbol, since):
+    # wersja gry zmienia sie z kazdym zapisanym ruchem; archiwizacja jej nie zmienia,
+    # a konczy gre (pusta lista dozwolonych ruchow)
+    return '"{}-{}{}-{}-{}"'.format(game.id, game.version, 'a' if game.archived else '', player_symbol, since)
+
+
+@login_required
+def game_state(request, external_session_id, game_id):
+    game = core.get_game(external_session_id, game_id)
+    if game is None or not core.is_player(game, request.user):
+        raise Http404()
+
+    try:
+        since = int(request.GET.get('since', 0))
+    except ValueError:
+        return JsonResponse({'error': 'invalid since'}, status=400)
+
+    player_symbol = core.get_player_symbol(game, request.user)
+    etag = _game_state_etag(game, player_symbol, since)
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return response
+
+    moves = serialized_move_log(core.get_game_moves_since(game, since))
+    state = core.GameState(game)
+    legal_moves = state.legal_moves(player_symbol)
+    response = JsonResponse({
+        'moves': moves,
+        'cursor': moves[-1]['id'] if moves else since,
+        'version': game.version,
+        'result': game.result,
+        'your_symbol': player_symbol,
+        'archived': game.archived,
+        'is_your_move': core.is_running(game) and state.is_turn(player_symbol),
+        'legal_moves': legal_moves,
+    })
+    response['ETag'] = etag
+    return response
+
+
+@login_required
+def bot_status(request, external_session_id, game_id):
+    game = core.get_game(external_session_id, game_id)
+    if game is None or not core.is_player(game, request.user):
+        raise Http404()
+    return JsonResponse({'status': bot_worker.status(game.id)})
+
+
+def metrics_view(request):
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')